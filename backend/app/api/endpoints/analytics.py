@@ -1,83 +1,92 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from app.core.database import get_db
+from app.api.http_cache import ConditionalGet, conditional_get
+from app.core.config import settings
+from app.core.database import get_async_read_db
+from app.core.responses import FastJSONResponse
 from app.services.analytics_service import AnalyticsService
-from app.models.schemas import AnalyticsResponse
+from app.services.custom_query import CustomQueryEngine, CustomQueryError
+from app.services.query_builder import QueryTooExpensive
+from app.models.schemas import AnalyticsResponse, CustomQueryRequest, CustomQueryResponse
 
 router = APIRouter()
 
+TIMEOUT_DETAIL = "Query excedeu o tempo limite; reduza o período ou os campos"
+TIMEOUT_RETRY_AFTER_SECONDS = 30
+
+
+def _http_error(e: Exception, message: str) -> HTTPException:
+    """Guarda de custo -> 422, statement_timeout -> 503 (com Retry-After), demais -> 500
+
+    O timeout é do servidor (não do envio do request): 503, não 408.
+    """
+    if isinstance(e, QueryTooExpensive):
+        return HTTPException(status_code=422, detail=str(e))
+    if isinstance(e, DBAPIError) and 'statement timeout' in str(e.orig or e).lower():
+        return HTTPException(
+            status_code=503, detail=TIMEOUT_DETAIL,
+            headers={'Retry-After': str(TIMEOUT_RETRY_AFTER_SECONDS)}
+        )
+    return HTTPException(status_code=500, detail=f"{message}: {str(e)}")
+
+
 @router.get("/dashboard", response_model=AnalyticsResponse)
 async def get_complete_dashboard(
     start_date: Optional[str] = Query(None, description="Data inicial (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="Data final (YYYY-MM-DD)"),
     store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Seções separadas por vírgula (ex.: overview,hourly_sales); padrão: todas"),
+    exact: bool = Query(False, description="Clientes únicos exatos (COUNT DISTINCT) em vez da estimativa HLL (~1,6% de erro)"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Dashboard completo com todos os dados - CORRIGIDO
     """
     try:
-        service = AnalyticsService(db)
-        data = service.get_business_overview(start_date, end_date, store_ids)
-        
-        # CORREÇÃO: O QueryBuilder retorna 'period' mas o schema espera 'date'
-        # Vamos converter corretamente
-        if 'sales_trends' in data:
-            fixed_trends = []
-            for trend in data['sales_trends']:
-                # Se o trend tem 'period', convertemos para 'date'
-                if 'period' in trend:
-                    fixed_trends.append({
-                        'date': trend['period'],  # period vira date
-                        'revenue': trend['revenue'],
-                        'orders': trend['orders'],
-                        'avg_ticket': trend['avg_ticket']
-                    })
-                else:
-                    # Já está no formato correto
-                    fixed_trends.append(trend)
-            data['sales_trends'] = fixed_trends
-        
-        return data
+        sections = AnalyticsService.parse_sections(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('dashboard'))
+        data = await service.get_business_overview(start_date, end_date, store_ids, sections, exact)
+        # Resultado interno já no formato de AnalyticsResponse: sem revalidar
+        return http_cache.respond(data)
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar dados do dashboard: {str(e)}")
+        raise _http_error(e, "Erro ao buscar dados do dashboard")
 
 @router.get("/overview")
 async def get_business_overview(
     start_date: Optional[str] = Query(None, description="Data inicial (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="Data final (YYYY-MM-DD)"),
     store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Seções separadas por vírgula (ex.: overview,hourly_sales); padrão: todas"),
+    exact: bool = Query(False, description="Clientes únicos exatos (COUNT DISTINCT) em vez da estimativa HLL (~1,6% de erro)"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Overview completo do negócio com todas as métricas principais
     """
     try:
-        service = AnalyticsService(db)
-        result = service.get_business_overview(start_date, end_date, store_ids)
-        
-        # Aplicar a mesma correção para o overview
-        if 'sales_trends' in result:
-            fixed_trends = []
-            for trend in result['sales_trends']:
-                if 'period' in trend:
-                    fixed_trends.append({
-                        'date': trend['period'],
-                        'revenue': trend['revenue'],
-                        'orders': trend['orders'],
-                        'avg_ticket': trend['avg_ticket']
-                    })
-                else:
-                    fixed_trends.append(trend)
-            result['sales_trends'] = fixed_trends
-            
-        return result
+        sections = AnalyticsService.parse_sections(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('dashboard'))
+        result = await service.get_business_overview(start_date, end_date, store_ids, sections, exact)
+        return http_cache.respond(result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar dados: {str(e)}")
+        raise _http_error(e, "Erro ao buscar dados")
 
 @router.get("/sales-trends")
 async def get_sales_trends(
@@ -85,31 +94,20 @@ async def get_sales_trends(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     store_ids: Optional[List[int]] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Tendências de vendas ao longo do tempo
     """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
     try:
-        service = AnalyticsService(db)
-        result = service.get_sales_trends(period, start_date, end_date, store_ids)
-        
-        # Converter period para date nos resultados
-        fixed_trends = []
-        for trend in result:
-            if 'period' in trend:
-                fixed_trends.append({
-                    'date': trend['period'],
-                    'revenue': trend['revenue'],
-                    'orders': trend['orders'],
-                    'avg_ticket': trend['avg_ticket']
-                })
-            else:
-                fixed_trends.append(trend)
-                
-        return {"trends": fixed_trends}
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('sales_trends'))
+        result = await service.get_sales_trends(period, start_date, end_date, store_ids)
+        return http_cache.respond({"trends": result})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar tendências: {str(e)}")
+        raise _http_error(e, "Erro ao buscar tendências")
 
 @router.get("/top-products")
 async def get_top_products(
@@ -117,51 +115,76 @@ async def get_top_products(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     store_ids: Optional[List[int]] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Produtos mais vendidos
     """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
     try:
-        service = AnalyticsService(db)
-        result = service.get_top_products(limit, start_date, end_date, store_ids)
-        return {"products": result}
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('top_products'))
+        result = await service.get_top_products(limit, start_date, end_date, store_ids)
+        return http_cache.respond(result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar produtos: {str(e)}")
+        raise _http_error(e, "Erro ao buscar produtos")
 
 @router.get("/channel-performance")
 async def get_channel_performance(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     store_ids: Optional[List[int]] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Performance por canal de venda
     """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
     try:
-        service = AnalyticsService(db)
-        result = service.get_channel_performance(start_date, end_date, store_ids)
-        return {"channels": result}
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('channel_performance'))
+        result = await service.get_channel_performance(start_date, end_date, store_ids)
+        return http_cache.respond(result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar canais: {str(e)}")
+        raise _http_error(e, "Erro ao buscar canais")
 
 @router.get("/hourly-sales")
 async def get_hourly_sales(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     store_ids: Optional[List[int]] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
 ):
     """
     Vendas por hora do dia
     """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('hourly_sales'))
+        result = await service.get_hourly_sales(start_date, end_date, store_ids)
+        return http_cache.respond({"hourly_sales": result})
+    except Exception as e:
+        raise _http_error(e, "Erro ao buscar vendas por hora")
+
+@router.post("/custom-query", response_model=CustomQueryResponse)
+async def run_custom_query(
+    request: CustomQueryRequest,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Query customizada do modo avançado (dimensões, medidas e filtros da camada semântica)
+    """
     try:
-        service = AnalyticsService(db)
-        result = service.get_hourly_sales(start_date, end_date, store_ids)
-        return {"hourly_sales": result}
+        engine = CustomQueryEngine(db)
+        return FastJSONResponse(await engine.execute(request.model_dump()))
+    except CustomQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar vendas por hora: {str(e)}")
+        raise _http_error(e, "Erro ao executar query")
 
 @router.get("/test-simple")
 async def test_simple_endpoint():
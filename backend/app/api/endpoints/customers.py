@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, Query, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.api.endpoints.analytics import _http_error
+from app.api.http_cache import ConditionalGet, conditional_get
+from app.core.config import settings
+from app.core.database import get_async_read_db
+from app.services.customer_analytics import CustomerAnalyticsService, CustomerSummaryUnavailable
+
+router = APIRouter()
+
+
+def _service(db: AsyncSession) -> CustomerAnalyticsService:
+    return CustomerAnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for('customers'))
+
+
+def _customer_error(e: Exception, message: str) -> HTTPException:
+    """Resumo ainda não gerado -> 503, parâmetro inválido -> 400, demais como em analytics"""
+    if isinstance(e, CustomerSummaryUnavailable):
+        return HTTPException(status_code=503, detail=str(e))
+    if type(e) is ValueError:
+        return HTTPException(status_code=400, detail=str(e))
+    return _http_error(e, message)
+
+
+@router.get("/rfm")
+async def get_rfm_segments(
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
+):
+    """
+    Segmentação RFM (recência, frequência, valor) dos clientes
+    """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        return http_cache.respond(await _service(db).get_rfm_segments(store_ids))
+    except Exception as e:
+        raise _customer_error(e, "Erro ao calcular segmentos RFM")
+
+
+@router.get("/rfm/{segment}")
+async def get_rfm_segment_customers(
+    segment: str,
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
+    limit: int = Query(100, ge=1, le=1000, description="Número de clientes"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
+):
+    """
+    Clientes de um segmento RFM, por faturamento
+    """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        return http_cache.respond(await _service(db).get_rfm_customers(segment, store_ids, limit))
+    except Exception as e:
+        raise _customer_error(e, "Erro ao buscar clientes do segmento")
+
+
+@router.get("/cohorts")
+async def get_cohort_retention(
+    months: int = Query(12, description="Número de coortes mensais (até o mês atual)"),
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
+):
+    """
+    Matriz de retenção por coorte mensal (mês do primeiro pedido)
+    """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        return http_cache.respond(await _service(db).get_cohort_retention(store_ids, months))
+    except Exception as e:
+        raise _customer_error(e, "Erro ao calcular retenção por coorte")
+
+
+@router.get("/churn-risk")
+async def get_churn_risk(
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas"),
+    limit: int = Query(100, ge=1, le=1000, description="Número de clientes por loja"),
+    db: AsyncSession = Depends(get_async_read_db),
+    http_cache: ConditionalGet = Depends(conditional_get)
+):
+    """
+    Clientes recorrentes em risco de churn, por loja
+    """
+    if http_cache.not_modified:
+        return http_cache.not_modified_response()
+    try:
+        return http_cache.respond(await _service(db).get_churn_risk(store_ids, limit))
+    except Exception as e:
+        raise _customer_error(e, "Erro ao buscar clientes em risco de churn")
@@ -1,24 +1,26 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from typing import Optional
+from app.core.database import get_async_db, get_db
 
 router = APIRouter()
 
 @router.get("/test-overview")
-async def test_overview(db: Session = Depends(get_db)):
+async def test_overview(db: AsyncSession = Depends(get_async_db)):
     """Testar apenas o overview sem sales_trends"""
-    from app.services.query_builder import QueryBuilder
+    from app.services.query_builder import AsyncQueryBuilder
     
-    query_builder = QueryBuilder(db)
+    query_builder = AsyncQueryBuilder(db)
     filters = {
         'start_date': '2025-10-01',
         'end_date': '2025-11-03'
     }
     
-    overview = query_builder.get_kpi_overview(filters)
-    top_products = query_builder.get_top_products(filters, 5)
-    channels = query_builder.get_channel_performance(filters)
-    hourly = query_builder.get_hourly_sales(filters)
+    overview = await query_builder.get_kpi_overview(filters)
+    top_products = await query_builder.get_top_products(filters, 5)
+    channels = await query_builder.get_channel_performance(filters)
+    hourly = await query_builder.get_hourly_sales(filters)
     
     return {
         "overview": overview,
@@ -28,26 +30,102 @@ async def test_overview(db: Session = Depends(get_db)):
     }
 
 @router.get("/test-sales-only")
-async def test_sales_only(db: Session = Depends(get_db)):
+async def test_sales_only(db: AsyncSession = Depends(get_async_db)):
     """Testar apenas sales trends com schema corrigido"""
-    from app.services.query_builder import QueryBuilder
+    from app.services.query_builder import AsyncQueryBuilder
     
-    query_builder = QueryBuilder(db)
+    query_builder = AsyncQueryBuilder(db)
     filters = {
         'start_date': '2025-10-01',
         'end_date': '2025-11-03'
     }
     
-    trends = query_builder.get_sales_trends(filters, 'day')
+    trends = await query_builder.get_sales_trends(filters, 'day')
     
     # Converter dates para strings para evitar problemas
     fixed_trends = []
     for trend in trends[:5]:  # Apenas 5 primeiros
         fixed_trends.append({
-            'date': trend['period'].strftime('%Y-%m-%d') if hasattr(trend['period'], 'strftime') else str(trend['period']),
+            'date': trend['date'].strftime('%Y-%m-%d') if hasattr(trend['date'], 'strftime') else str(trend['date']),
             'revenue': trend['revenue'],
             'orders': trend['orders'],
             'avg_ticket': trend['avg_ticket']
         })
     
-    return {"sales_trends": fixed_trends}
\ No newline at end of file
+    return {"sales_trends": fixed_trends}
+
+@router.post("/rollups/refresh")
+def refresh_rollups(db: Session = Depends(get_db)):
+    """Refresh incremental das tabelas de rollup (apenas dias fechados novos)
+    
+    Manutenção síncrona e demorada: roda no threadpool, fora do event loop.
+    """
+    from app.services.rollups import RollupManager
+    from app.services.watermark import invalidate_watermark
+    
+    refreshed = RollupManager(db).refresh()
+    invalidate_watermark()
+    return {"status": "success", "rows": refreshed}
+
+
+@router.post("/matviews/refresh")
+def refresh_matviews(db: Session = Depends(get_db)):
+    """REFRESH CONCURRENTLY das materialized views (fora do agendador)"""
+    from app.services.matviews import MatviewManager
+    from app.services.watermark import invalidate_watermark
+    
+    refreshed = MatviewManager(db).refresh()
+    invalidate_watermark()
+    return {"status": "success", "seconds": refreshed}
+
+
+@router.post("/customers/refresh")
+def refresh_customer_summary(db: Session = Depends(get_db)):
+    """Refresh incremental do resumo de clientes (RFM, coortes, churn)"""
+    from app.services.customer_summary import CustomerSummaryManager
+    from app.services.watermark import invalidate_watermark
+    
+    days = CustomerSummaryManager(db).refresh()
+    invalidate_watermark()
+    return {"status": "success", "days": days}
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Estatísticas do cache de resultados (hits, misses, entradas)"""
+    from app.services.cache import result_cache
+    
+    return result_cache.stats()
+
+
+@router.delete("/cache")
+async def invalidate_cache(from_date: Optional[str] = Query(None, description="Invalidar períodos que alcançam esta data (YYYY-MM-DD)")):
+    """Invalidar o cache de resultados (tudo, ou a partir de uma data)"""
+    from app.services.cache import result_cache
+    from app.services.watermark import invalidate_watermark
+    from app.utils.helpers import parse_date
+    
+    invalidate_watermark()
+    day = parse_date(from_date)
+    if day:
+        removed = result_cache.invalidate_from(day)
+        return {"status": "success", "removed": removed}
+    
+    result_cache.clear()
+    return {"status": "success", "removed": "all"}
+
+
+@router.get("/pool-stats")
+async def pool_stats():
+    """Estado dos pools de conexão: em uso, ociosas, overflow e espera para obter conexão"""
+    from app.core.database import get_pool_stats
+    
+    return get_pool_stats()
+
+
+@router.get("/replicas")
+async def replica_stats():
+    """Réplicas de leitura: saúde, atraso de replicação e leituras roteadas"""
+    from app.core.database import replica_router
+    
+    return replica_router.stats()
@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+
+from app.api.endpoints.analytics import _http_error
+from app.core.config import settings
+from app.core.database import async_read_session, get_async_read_db
+from app.services.analytics_service import AnalyticsService
+from app.services import exports
+
+router = APIRouter()
+
+FORMAT_DESCRIPTION = "Formato: csv, ndjson ou parquet"
+
+ANALYTICS_REPORTS = ('sales-trends', 'top-products', 'channel-performance', 'hourly-sales')
+
+
+def _filters(start_date: Optional[str], end_date: Optional[str], store_ids: Optional[List[int]]) -> Dict:
+    """Mesmo padrão do AnalyticsService: últimos 30 dias"""
+    filters = {
+        'start_date': start_date or (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
+        'end_date': end_date or datetime.now().strftime('%Y-%m-%d')
+    }
+    if store_ids:
+        filters['store_ids'] = sorted(set(store_ids))
+    return filters
+
+
+def _response(body, name: str, filters: Dict, fmt: str) -> StreamingResponse:
+    media_type, _ = exports.EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{exports.filename(name, filters, fmt)}"'}
+    )
+
+
+def _validated(format: str, filters: Dict) -> str:
+    try:
+        fmt = exports.validate_format(format)
+        exports.validate_period(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fmt
+
+
+@router.get("/sales")
+async def export_sales(
+    format: str = Query("csv", description=FORMAT_DESCRIPTION),
+    start_date: Optional[str] = Query(None, description="Data inicial (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Data final (YYYY-MM-DD)"),
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas")
+):
+    """
+    Vendas concluídas do período, linha a linha (streaming)
+    """
+    filters = _filters(start_date, end_date, store_ids)
+    fmt = _validated(format, filters)
+    builder = exports.ExportQueryBuilder(async_read_session)
+    query, params = builder.sales_query(filters)
+    return _response(builder.stream(query, params, exports.SALES_COLUMNS, fmt), 'sales', filters, fmt)
+
+
+@router.get("/product-sales")
+async def export_product_sales(
+    format: str = Query("csv", description=FORMAT_DESCRIPTION),
+    start_date: Optional[str] = Query(None, description="Data inicial (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Data final (YYYY-MM-DD)"),
+    store_ids: Optional[List[int]] = Query(None, description="IDs das lojas")
+):
+    """
+    Itens das vendas concluídas do período, linha a linha (streaming)
+    """
+    filters = _filters(start_date, end_date, store_ids)
+    fmt = _validated(format, filters)
+    builder = exports.ExportQueryBuilder(async_read_session)
+    query, params = builder.product_sales_query(filters)
+    return _response(
+        builder.stream(query, params, exports.PRODUCT_SALES_COLUMNS, fmt), 'product_sales', filters, fmt
+    )
+
+
+@router.get("/analytics/{report}")
+async def export_analytics(
+    report: str,
+    format: str = Query("csv", description=FORMAT_DESCRIPTION),
+    period: str = Query("day", description="sales-trends: day, week, month"),
+    limit: int = Query(10, description="top-products: número de produtos"),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    store_ids: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Resultado agregado de um relatório de analytics
+    (sales-trends, top-products, channel-performance, hourly-sales)
+    """
+    if report not in ANALYTICS_REPORTS:
+        raise HTTPException(status_code=404, detail=f"Relatório não suportado: {report}")
+    name = report.replace('-', '_')
+    filters = _filters(start_date, end_date, store_ids)
+    fmt = _validated(format, filters)
+    store_ids = filters.get('store_ids')
+
+    try:
+        service = AnalyticsService(db, statement_timeout_ms=settings.statement_timeout_for(name))
+        if report == 'sales-trends':
+            items = await service.get_sales_trends(period, filters['start_date'], filters['end_date'], store_ids)
+        elif report == 'top-products':
+            items = (await service.get_top_products(limit, filters['start_date'], filters['end_date'], store_ids))['products']
+        elif report == 'channel-performance':
+            items = (await service.get_channel_performance(filters['start_date'], filters['end_date'], store_ids))['channels']
+        else:
+            items = await service.get_hourly_sales(filters['start_date'], filters['end_date'], store_ids)
+    except Exception as e:
+        raise _http_error(e, "Erro ao exportar relatório")
+
+    return _response(exports.stream_items(items, fmt), name, filters, fmt)
@@ -0,0 +1,88 @@
+"""
+Cache HTTP condicional dos endpoints GET de analytics.
+
+O ETag (fraco) é um hash do caminho, dos parâmetros e da marca d'água dos
+dados. Com `If-None-Match` igual, o handler responde 304 sem consultar o
+banco. Cache-Control: períodos fechados (end_date antes de hoje) recebem
+max-age longo e podem ser guardados pelo nginx; períodos que incluem hoje
+recebem max-age curto.
+
+Períodos fechados não dependem de max_sale_id nem do refresh das
+materialized views (vendas novas caem em hoje): só um novo refresh dos
+rollups troca o ETag deles.
+"""
+import hashlib
+import json
+from datetime import date
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_async_read_db
+from app.core.responses import FastJSONResponse
+from app.services.watermark import data_version, get_watermark_async
+from app.utils.helpers import parse_date
+
+
+class ConditionalGet:
+    def __init__(self, request: Request, etag: Optional[str], cache_control: str):
+        self.request = request
+        self.etag = etag
+        self.cache_control = cache_control
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'Cache-Control': self.cache_control}
+        if self.etag:
+            headers['ETag'] = self.etag
+        return headers
+
+    @property
+    def not_modified(self) -> bool:
+        if not self.etag:
+            return False
+        if_none_match = self.request.headers.get('if-none-match')
+        if not if_none_match:
+            return False
+        # Comparação fraca: ignora o prefixo W/
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in candidates or self.etag.removeprefix('W/') in candidates
+
+    def not_modified_response(self) -> Response:
+        return Response(status_code=304, headers=self.headers)
+
+    def respond(self, content: Any) -> FastJSONResponse:
+        return FastJSONResponse(content, headers=self.headers)
+
+
+def is_closed_period(end_date: Optional[str]) -> bool:
+    """Período fechado: end_date explícito e anterior a hoje"""
+    end_day = parse_date(end_date)
+    return end_day is not None and end_day < date.today()
+
+
+def make_etag(path: str, params: Dict, watermark: Dict, closed: bool) -> str:
+    payload = json.dumps(
+        {'path': path, 'params': params, 'version': data_version(watermark, closed)},
+        sort_keys=True, default=str
+    )
+    return f'W/"{hashlib.sha1(payload.encode()).hexdigest()}"'
+
+
+async def conditional_get(request: Request, db: AsyncSession = Depends(get_async_read_db)) -> ConditionalGet:
+    """Dependência: validador e Cache-Control do request atual"""
+    closed = is_closed_period(request.query_params.get('end_date'))
+    if closed:
+        cache_control = f"public, max-age={settings.HTTP_CACHE_HISTORICAL_MAX_AGE}"
+    else:
+        cache_control = f"public, max-age={settings.HTTP_CACHE_RECENT_MAX_AGE}"
+
+    if not settings.HTTP_CACHE_ENABLED:
+        return ConditionalGet(request, None, "no-cache")
+
+    params = {key: sorted(request.query_params.getlist(key)) for key in request.query_params.keys()}
+    watermark = await get_watermark_async(db)
+    etag = make_etag(request.url.path, params, watermark, closed)
+    return ConditionalGet(request, etag, cache_control)
@@ -1,15 +1,182 @@
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
+from app.core.replicas import Replica, ReplicaRouter
+
+
+class PoolMetrics:
+    """Métricas de um pool: tempo de espera para obter conexão e timeouts"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.acquisitions += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool) -> Dict:
+        with self._lock:
+            return {
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'max_overflow': settings.DB_MAX_OVERFLOW,
+                'acquisitions': self.acquisitions,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_avg': self.wait_seconds_total / self.acquisitions if self.acquisitions else 0.0,
+                'wait_seconds_max': self.wait_seconds_max
+            }
+
+
+def _instrumented_pool(pool_class, metrics: PoolMetrics):
+    """Subclasse do pool que mede o tempo para obter uma conexão"""
 
-engine = create_engine(settings.DATABASE_URL)
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.observe_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.observe_wait(time.perf_counter() - start)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def _pool_options() -> Dict:
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+    }
+
+
+sync_pool_metrics = PoolMetrics('sync')
+async_pool_metrics = PoolMetrics('async')
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=_instrumented_pool(QueuePool, sync_pool_metrics),
+    **_pool_options()
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Engine assíncrono (asyncpg) para os endpoints de analytics
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    poolclass=_instrumented_pool(AsyncAdaptedQueuePool, async_pool_metrics),
+    **_pool_options()
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def _create_replica(index: int, url: str) -> Replica:
+    name = f"replica{index}"
+    sync_metrics = PoolMetrics(f"{name}_sync")
+    async_metrics = PoolMetrics(f"{name}_async")
+    replica_engine = create_engine(
+        url,
+        poolclass=_instrumented_pool(QueuePool, sync_metrics),
+        connect_args={'connect_timeout': settings.REPLICA_CONNECT_TIMEOUT_SECONDS},
+        **_pool_options()
+    )
+    replica_async_engine = create_async_engine(
+        url.replace("postgresql://", "postgresql+asyncpg://", 1),
+        poolclass=_instrumented_pool(AsyncAdaptedQueuePool, async_metrics),
+        connect_args={'timeout': settings.REPLICA_CONNECT_TIMEOUT_SECONDS},
+        **_pool_options()
+    )
+    return Replica(
+        name, replica_engine, replica_async_engine,
+        sessionmaker(autocommit=False, autoflush=False, bind=replica_engine),
+        async_sessionmaker(replica_async_engine, autoflush=False, expire_on_commit=False),
+        pool_metrics={'sync': sync_metrics, 'async': async_metrics}
+    )
+
+
+# Réplicas de leitura (opcionais): sem DATABASE_REPLICA_URLS, tudo vai ao primário
+replica_router = ReplicaRouter(
+    [_create_replica(i, url) for i, url in enumerate(settings.DATABASE_REPLICA_URLS, start=1)],
+    max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_HEALTH_CHECK_SECONDS,
+    max_receiver_silence_seconds=settings.REPLICA_MAX_RECEIVER_SILENCE_SECONDS
+)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db():
+    """Sessão somente leitura: réplica elegível ou primário"""
+    replica = replica_router.pick()
+    session_factory = replica.session_factory if replica else SessionLocal
+    db = session_factory()
+    db.info['target'] = replica.name if replica else 'primary'
+    try:
+        yield db
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def async_read_session():
+    """Sessão assíncrona somente leitura: réplica elegível ou primário
+
+    `db.info['session_factory']` aponta para o mesmo destino, para as sessões
+    extras do dashboard concorrente lerem do mesmo servidor.
+    """
+    replica = replica_router.pick()
+    session_factory = replica.async_session_factory if replica else AsyncSessionLocal
+    async with session_factory() as db:
+        db.info['target'] = replica.name if replica else 'primary'
+        db.info['session_factory'] = session_factory
+        yield db
+
+async def get_async_read_db():
+    async with async_read_session() as db:
+        yield db
+
+def get_pool_stats() -> Dict:
+    """Estado dos pools de conexão (sync e async, primário e réplicas)"""
+    stats = {
+        'sync': sync_pool_metrics.snapshot(engine.pool),
+        'async': async_pool_metrics.snapshot(async_engine.sync_engine.pool)
+    }
+    for replica in replica_router.replicas:
+        stats[f"{replica.name}_sync"] = replica.pool_metrics['sync'].snapshot(replica.engine.pool)
+        stats[f"{replica.name}_async"] = replica.pool_metrics['async'].snapshot(
+            replica.async_engine.sync_engine.pool
+        )
+    return stats
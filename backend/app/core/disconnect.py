@@ -0,0 +1,68 @@
+"""
+Cancelamento de requests cujo cliente desconectou.
+
+Sem isto, uma query longa continua rodando (e segurando uma conexão do
+pool) depois que o navegador desistiu. O middleware passa a ser o único
+leitor de `receive`: repassa as mensagens ao app por uma fila e, ao ver
+`http.disconnect` antes do fim da resposta, cancela a task do request.
+O cancelamento chega ao asyncpg, que cancela a query no Postgres.
+"""
+import asyncio
+import contextlib
+import logging
+
+from app.core.metrics import HTTP_CANCELLED
+
+logger = logging.getLogger(__name__)
+
+# Status registrado (nginx) para requests encerrados pelo cliente
+CLIENT_CLOSED_REQUEST = 499
+
+
+class CancelOnDisconnectMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        messages = asyncio.Queue()
+        response = {'started': False, 'finished': False}
+
+        async def watch_receive():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message['type'] == 'http.disconnect':
+                    return
+
+        async def tracked_send(message):
+            if message['type'] == 'http.response.start':
+                response['started'] = True
+            elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+                response['finished'] = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, tracked_send))
+        watcher = asyncio.ensure_future(watch_receive())
+        try:
+            await asyncio.wait({app_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not app_task.done() and not response['finished']:
+                app_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await app_task
+                route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+                HTTP_CANCELLED.labels(route=route).inc()
+                logger.info("Cliente desconectou, request cancelado: %s %s", scope['method'], scope['path'])
+                if not response['started']:
+                    # Ninguém recebe esta resposta (o servidor a descarta); serve às métricas
+                    await send({'type': 'http.response.start', 'status': CLIENT_CLOSED_REQUEST, 'headers': []})
+                    await send({'type': 'http.response.body', 'body': b''})
+                return
+            await app_task
+        finally:
+            watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await watcher
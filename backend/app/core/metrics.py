@@ -0,0 +1,229 @@
+"""
+Métricas Prometheus da API.
+
+- requests HTTP: contagem, em andamento, latência e tamanho da resposta por rota;
+- queries de analytics: duração e linhas por método do QueryBuilder,
+  contador de queries lentas;
+- pools de conexão, réplicas de leitura e cache de resultados (gauges por processo).
+
+Expostas em GET /metrics (formato texto do Prometheus). Com vários workers
+do uvicorn, defina PROMETHEUS_MULTIPROC_DIR (diretório vazio a cada start):
+cada processo grava suas métricas ali e /metrics agrega todos eles.
+"""
+import os
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+
+QUERY_DURATION = Histogram(
+    'analytics_query_duration_seconds',
+    'Duração das queries de analytics por método do QueryBuilder',
+    ['query'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+QUERY_ROWS = Histogram(
+    'analytics_query_rows',
+    'Linhas retornadas pelas queries de analytics',
+    ['query'],
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+)
+
+SLOW_QUERIES = Counter(
+    'analytics_slow_queries_total',
+    'Queries de analytics acima de SLOW_QUERY_THRESHOLD_MS',
+    ['query']
+)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total',
+    'Requests HTTP por rota e status',
+    ['method', 'route', 'status']
+)
+
+HTTP_CANCELLED = Counter(
+    'http_requests_cancelled_total',
+    'Requests cancelados porque o cliente desconectou antes da resposta',
+    ['route']
+)
+
+HTTP_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'Requests HTTP em andamento',
+    ['method'],
+    multiprocess_mode='livesum'
+)
+
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Latência dos requests HTTP por rota',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Tamanho do corpo da resposta (após compressão) por rota',
+    ['method', 'route'],
+    buckets=(100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Conexões do pool por estado',
+    ['pool', 'state'],
+    multiprocess_mode='livesum'
+)
+
+DB_POOL_ACQUISITIONS = Gauge(
+    'db_pool_acquisitions',
+    'Conexões obtidas do pool desde o início do processo',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+DB_POOL_WAIT_SECONDS = Gauge(
+    'db_pool_wait_seconds',
+    'Tempo total de espera para obter conexão desde o início do processo',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+DB_POOL_TIMEOUTS = Gauge(
+    'db_pool_timeouts',
+    'Timeouts ao obter conexão desde o início do processo',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+CACHE_ENTRIES = Gauge(
+    'result_cache_entries',
+    'Entradas no cache de resultados',
+    multiprocess_mode='livesum'
+)
+
+CACHE_LOOKUPS = Gauge(
+    'result_cache_lookups',
+    'Consultas ao cache de resultados desde o início do processo',
+    ['result'],
+    multiprocess_mode='livesum'
+)
+
+CACHE_EVICTIONS = Gauge(
+    'result_cache_evictions',
+    'Entradas removidas por limite de tamanho desde o início do processo',
+    multiprocess_mode='livesum'
+)
+
+CACHE_COALESCED = Gauge(
+    'result_cache_coalesced',
+    'Chamadas que aguardaram uma computação idêntica em andamento (single-flight)',
+    multiprocess_mode='livesum'
+)
+
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds',
+    'Atraso de replicação medido no último health check',
+    ['replica'],
+    multiprocess_mode='livemax'
+)
+
+DB_REPLICA_ELIGIBLE = Gauge(
+    'db_replica_eligible',
+    'Réplica recebendo leituras (1) ou fora/atrasada (0)',
+    ['replica'],
+    multiprocess_mode='livemin'
+)
+
+# Gauges de pool/cache são atualizados no máximo a cada N segundos por processo
+RUNTIME_GAUGES_INTERVAL = 5.0
+
+_runtime_gauges = {'updated_at': 0.0}
+_runtime_gauges_lock = threading.Lock()
+
+
+def update_runtime_gauges(force: bool = False):
+    """Copiar estatísticas dos pools e do cache deste processo para os gauges"""
+    with _runtime_gauges_lock:
+        now = time.monotonic()
+        if not force and now - _runtime_gauges['updated_at'] < RUNTIME_GAUGES_INTERVAL:
+            return
+        _runtime_gauges['updated_at'] = now
+
+    from app.core.database import get_pool_stats, replica_router
+    from app.services.cache import result_cache
+
+    for pool, stats in get_pool_stats().items():
+        for state in ('checked_out', 'idle', 'overflow'):
+            DB_POOL_CONNECTIONS.labels(pool=pool, state=state).set(stats[state])
+        DB_POOL_ACQUISITIONS.labels(pool=pool).set(stats['acquisitions'])
+        DB_POOL_WAIT_SECONDS.labels(pool=pool).set(stats['wait_seconds_total'])
+        DB_POOL_TIMEOUTS.labels(pool=pool).set(stats['timeouts'])
+
+    for replica, stats in replica_router.stats()['replicas'].items():
+        if stats['lag_seconds'] is not None:
+            DB_REPLICA_LAG.labels(replica=replica).set(stats['lag_seconds'])
+        DB_REPLICA_ELIGIBLE.labels(replica=replica).set(1 if stats['eligible'] else 0)
+
+    cache_stats = result_cache.stats()
+    CACHE_ENTRIES.set(cache_stats.get('entries', 0))
+    CACHE_LOOKUPS.labels(result='hit').set(cache_stats.get('hits', 0))
+    CACHE_LOOKUPS.labels(result='miss').set(cache_stats.get('misses', 0))
+    CACHE_EVICTIONS.set(cache_stats.get('evictions', 0))
+    CACHE_COALESCED.set(cache_stats.get('singleflight', {}).get('coalesced', 0))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: contagem, latência e tamanho das respostas por rota
+
+    A rota é o template registrado (ex.: /api/v1/analytics/dashboard), não a
+    URL, para manter a cardinalidade dos labels baixa.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        state = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                state['size'] += len(message.get('body', b''))
+            await send(message)
+
+        HTTP_IN_PROGRESS.labels(method=method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.labels(method=method).dec()
+
+            route = scope.get('route')
+            route_path = getattr(route, 'path', None) or 'unmatched'
+            HTTP_REQUESTS.labels(method=method, route=route_path, status=str(state['status'])).inc()
+            HTTP_LATENCY.labels(method=method, route=route_path).observe(elapsed)
+            HTTP_RESPONSE_SIZE.labels(method=method, route=route_path).observe(state['size'])
+            update_runtime_gauges()
+
+
+def render_metrics():
+    """(corpo, content-type) no formato texto do Prometheus"""
+    update_runtime_gauges(force=True)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,170 @@
+"""
+Migrações de schema gerenciadas pela aplicação (índices de leitura).
+
+O schema base vem de database-schema.sql; aqui ficam os índices usados
+pelas queries de analytics. Cada migração é aplicada uma única vez e
+registrada em `schema_migrations`. Índices são criados com CONCURRENTLY
+(fora de transação) para não bloquear escritas; em tabelas particionadas
+(sales e filhas), onde o Postgres não aceita CONCURRENTLY, o índice é
+criado no pai e propagado para cada partição, inclusive as futuras.
+
+Uso (dentro de backend/):
+    python -m app.core.migrations            # aplicar pendentes
+    python -m app.core.migrations --status   # listar migrações
+"""
+import argparse
+import logging
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(100) PRIMARY KEY,
+    description VARCHAR(300) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Índices gerenciados: nome -> (tabela, DDL idempotente)
+INDEXES = {
+    # Recorte padrão das queries: vendas COMPLETED por período (e loja).
+    # INCLUDE cobre as colunas lidas pelo dashboard/KPIs -> index-only scan
+    'idx_sales_completed_created_store': ('sales', """
+        CREATE INDEX {concurrently} IF NOT EXISTS idx_sales_completed_created_store
+        ON sales (created_at, store_id)
+        INCLUDE (id, channel_id, customer_id, total_amount)
+        WHERE sale_status_desc = 'COMPLETED'
+    """),
+    # Join sales -> product_sales (top produtos, queries por produto)
+    'idx_product_sales_sale': ('product_sales', """
+        CREATE INDEX {concurrently} IF NOT EXISTS idx_product_sales_sale
+        ON product_sales (sale_id)
+        INCLUDE (product_id, quantity, total_price)
+    """),
+    # Join sales -> payments (queries por forma de pagamento)
+    'idx_payments_sale': ('payments', """
+        CREATE INDEX {concurrently} IF NOT EXISTS idx_payments_sale
+        ON payments (sale_id)
+        INCLUDE (payment_type_id, value)
+    """),
+}
+
+MIGRATIONS = [
+    {
+        'version': '0001_sales_covering_indexes',
+        'description': 'Índices cobrindo o recorte por período de sales e os joins de itens/pagamentos',
+        'create_indexes': [
+            'idx_sales_completed_created_store',
+            'idx_product_sales_sale',
+            'idx_payments_sale',
+        ],
+        # Índice antigo do gerador de dados (DATE(created_at)): nunca usado pela API
+        'drop_indexes': ['idx_sales_date_status'],
+        # Visibility map atualizado para o planner escolher index-only scans
+        'vacuum': ['sales', 'product_sales', 'payments'],
+    },
+]
+
+
+class MigrationRunner:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def applied(self) -> Dict[str, object]:
+        with self.engine.connect() as conn:
+            conn.execute(text(MIGRATIONS_TABLE_DDL))
+            conn.commit()
+            rows = conn.execute(text("SELECT version, applied_at FROM schema_migrations")).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def pending(self) -> List[Dict]:
+        applied = self.applied()
+        return [m for m in MIGRATIONS if m['version'] not in applied]
+
+    def migrate(self) -> List[str]:
+        """Aplicar as migrações pendentes, em ordem"""
+        done = []
+        for migration in self.pending():
+            start = time.perf_counter()
+            self._apply(migration)
+            logger.info("Migração %s aplicada em %.1fs", migration['version'], time.perf_counter() - start)
+            done.append(migration['version'])
+        return done
+
+    def _apply(self, migration: Dict):
+        # CREATE INDEX CONCURRENTLY e VACUUM não rodam dentro de transação
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name in migration.get('drop_indexes', []):
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            for name in migration.get('create_indexes', []):
+                self._create_index(conn, name)
+
+            for sql in migration.get('statements', []):
+                conn.execute(text(sql))
+
+            for table in migration.get('vacuum', []):
+                conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+
+            conn.execute(text("""
+                INSERT INTO schema_migrations (version, description)
+                VALUES (:version, :description)
+                ON CONFLICT (version) DO NOTHING
+            """), {'version': migration['version'], 'description': migration['description']})
+
+    def _create_index(self, conn, name: str):
+        table, ddl = INDEXES[name]
+        partitioned = conn.execute(
+            text("SELECT relkind = 'p' FROM pg_class WHERE relname = :table"),
+            {'table': table}
+        ).scalar()
+        concurrently = '' if partitioned else 'CONCURRENTLY'
+        self._drop_if_invalid(conn, name, concurrently)
+        conn.execute(text(ddl.format(concurrently=concurrently)))
+
+    def _drop_if_invalid(self, conn, name: str, concurrently: str = 'CONCURRENTLY'):
+        """Um CREATE INDEX CONCURRENTLY interrompido deixa o índice inválido;
+        IF NOT EXISTS o manteria, então ele é removido antes de recriar"""
+        invalid = conn.execute(text("""
+            SELECT 1
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {'name': name}).scalar()
+        if invalid:
+            logger.warning("Índice %s inválido, recriando", name)
+            conn.execute(text(f"DROP INDEX {concurrently} IF EXISTS {name}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrações de schema (índices de analytics)')
+    parser.add_argument('--status', action='store_true', help='Listar migrações aplicadas e pendentes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import engine
+
+    runner = MigrationRunner(engine)
+    if args.status:
+        applied = runner.applied()
+        for migration in MIGRATIONS:
+            applied_at = applied.get(migration['version'])
+            status = f"aplicada em {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pendente"
+            print(f"{migration['version']}: {status}")
+        return
+
+    done = runner.migrate()
+    if done:
+        for version in done:
+            print(f"✓ {version}")
+    else:
+        print("✓ Nenhuma migração pendente")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Roteamento das leituras de analytics para réplicas do Postgres.
+
+As sessões de leitura (`get_read_db` / `get_async_read_db`) vão para as
+réplicas em round-robin, tirando a agregação do dashboard do primário,
+que atende a carga de escrita do PDV. Uma réplica só recebe leituras se:
+
+- o último health check passou (conexão + `pg_is_in_recovery()`);
+- o WAL receiver está em streaming e recebeu mensagem do primário há no
+  máximo REPLICA_MAX_RECEIVER_SILENCE_SECONDS (ler `pg_stat_wal_receiver`
+  exige superusuário ou pg_read_all_stats);
+- o atraso de replicação está abaixo de REPLICA_MAX_LAG_SECONDS.
+
+Sem réplica elegível, a leitura cai no primário. O health check roda em
+uma thread em segundo plano, disparado no máximo a cada
+REPLICA_HEALTH_CHECK_SECONDS pela própria escolha da réplica; erro de
+conexão durante uma query marca a réplica como fora até o próximo check.
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+# Réplica em dia (nada recebido a reaplicar) conta como atraso zero, mesmo
+# que a última transação reaplicada seja antiga (primário sem escritas).
+# "Em dia" só vale com o WAL receiver conectado: uma réplica cortada do
+# primário também tem receive = replay. Colunas: em recovery, pid e status
+# do receiver, segundos desde a última mensagem do primário, atraso
+LAG_QUERY = text("""
+    SELECT
+        pg_is_in_recovery(),
+        w.pid,
+        w.status,
+        EXTRACT(EPOCH FROM now() - w.last_msg_receipt_time),
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    FROM (SELECT 1) AS one
+    LEFT JOIN pg_stat_wal_receiver w ON true
+""")
+
+
+class Replica:
+    def __init__(self, name: str, engine, async_engine, session_factory, async_session_factory,
+                 pool_metrics: Optional[Dict] = None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+        self.pool_metrics = pool_metrics or {}
+        # Fora até o primeiro health check
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.in_recovery: Optional[bool] = None
+        self.checked_at = 0.0
+        self.error: Optional[str] = None
+
+
+class ReplicaRouter:
+    def __init__(self, replicas: List[Replica], max_lag_seconds: float, check_interval: float,
+                 max_receiver_silence_seconds: float = 60.0):
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.max_receiver_silence_seconds = max_receiver_silence_seconds
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(replicas) if replicas else None
+        self._lock = threading.Lock()
+        self._checking = False
+        self._checked_at = 0.0
+        self.routed = {replica.name: 0 for replica in replicas}
+        self.fallbacks = 0
+        for replica in replicas:
+            self._watch_errors(replica)
+
+    def pick(self) -> Optional[Replica]:
+        """Próxima réplica elegível (round-robin) ou None para usar o primário"""
+        if not self.replicas:
+            return None
+        self._maybe_check()
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if self._eligible(replica):
+                    self.routed[replica.name] += 1
+                    return replica
+            self.fallbacks += 1
+        return None
+
+    def _eligible(self, replica: Replica) -> bool:
+        return (
+            replica.healthy
+            and replica.lag_seconds is not None
+            and replica.lag_seconds <= self.max_lag_seconds
+        )
+
+    def _maybe_check(self):
+        with self._lock:
+            if self._checking or time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checking = True
+        threading.Thread(target=self.check_all, name='replica-health', daemon=True).start()
+
+    def check_all(self):
+        """Health check e atraso de todas as réplicas (bloqueante)"""
+        try:
+            for replica in self.replicas:
+                self._check(replica)
+        finally:
+            with self._lock:
+                self._checking = False
+                self._checked_at = time.monotonic()
+
+    def _check(self, replica: Replica):
+        try:
+            with replica.engine.connect() as conn:
+                in_recovery, receiver_pid, status, silence, lag = conn.execute(LAG_QUERY).one()
+            healthy, lag, error = True, float(lag), None
+            receiver_error = in_recovery and self._receiver_error(receiver_pid, status, silence)
+            if receiver_error:
+                # Sem WAL chegando, o atraso real é desconhecido: acima do limite
+                lag, error = float('inf'), receiver_error
+        except Exception as e:
+            in_recovery, healthy, lag, error = None, False, None, str(e)
+
+        with self._lock:
+            was_eligible = self._eligible(replica)
+            replica.healthy, replica.lag_seconds, replica.error = healthy, lag, error
+            # False: réplica promovida (ou URL de um primário); continua atendendo leituras
+            replica.in_recovery = in_recovery
+            replica.checked_at = time.time()
+            eligible = self._eligible(replica)
+
+        if was_eligible and not eligible:
+            if error is None:
+                logger.warning("Réplica %s com atraso de %.1fs, leituras no primário", replica.name, lag)
+            else:
+                logger.warning("Réplica %s fora: %s", replica.name, error)
+        elif eligible and not was_eligible:
+            logger.info("Réplica %s disponível (atraso %.1fs)", replica.name, lag)
+
+    def _receiver_error(self, pid: Optional[int], status: Optional[str],
+                        silence: Optional[float]) -> Optional[str]:
+        """Motivo para não confiar no atraso medido, ou None se o receiver está recebendo WAL"""
+        if pid is None:
+            return "WAL receiver parado (réplica desconectada do primário)"
+        if status is None:
+            return "sem permissão para ler pg_stat_wal_receiver (conceda pg_read_all_stats)"
+        if status != 'streaming':
+            return f"WAL receiver em estado {status}"
+        if silence is None or float(silence) > self.max_receiver_silence_seconds:
+            return "WAL receiver sem mensagens do primário"
+        return None
+
+    def mark_failed(self, replica: Replica, error: str):
+        with self._lock:
+            if not replica.healthy:
+                return
+            replica.healthy = False
+            replica.error = error
+        logger.warning("Réplica %s marcada como fora após erro de conexão: %s", replica.name, error)
+
+    def _watch_errors(self, replica: Replica):
+        def on_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_failed(replica, str(context.original_exception))
+
+        for engine in (replica.engine, replica.async_engine.sync_engine):
+            event.listen(engine, 'handle_error', on_error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'replicas': {
+                    replica.name: {
+                        'healthy': replica.healthy,
+                        'eligible': self._eligible(replica),
+                        'lag_seconds': replica.lag_seconds,
+                        'in_recovery': replica.in_recovery,
+                        'checked_at': replica.checked_at or None,
+                        'error': replica.error,
+                        'routed': self.routed[replica.name]
+                    }
+                    for replica in self.replicas
+                },
+                'max_lag_seconds': self.max_lag_seconds,
+                'primary_fallbacks': self.fallbacks
+            }
@@ -0,0 +1,42 @@
+"""
+Serialização JSON das respostas da API.
+
+`FastJSONResponse` é a classe de resposta padrão da aplicação: usa orjson
+(datas, datetimes e Decimal nativos) e cai para o json da stdlib se ele não
+estiver instalado. Handlers que retornam resultados internos já no formato
+do schema devolvem `FastJSONResponse(data)` diretamente: assim o FastAPI
+não revalida o response_model nem passa pelo jsonable_encoder; o
+response_model continua servindo para a documentação.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fallback sem orjson
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if orjson is None and isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
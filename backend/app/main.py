@@ -1,16 +1,30 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from datetime import datetime
 from app.core.config import settings
-from app.api.endpoints import analytics, debug
+from app.core.disconnect import CancelOnDisconnectMiddleware
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.responses import FastJSONResponse
+from app.services.matviews import matview_scheduler
+from app.api.endpoints import analytics, customers, debug, exports
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
+# Cliente desconectou: cancelar o request (e a query) - middleware mais interno
+app.add_middleware(CancelOnDisconnectMiddleware)
+
 # CORS - Permitir todas as origens para desenvolvimento
 app.add_middleware(
     CORSMiddleware,
@@ -20,10 +34,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compressão: respostas abaixo de COMPRESSION_MINIMUM_SIZE seguem sem compressão
+if BrotliMiddleware is not None:
+    # Clientes sem "br" em Accept-Encoding recebem gzip
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=settings.COMPRESSION_BROTLI_QUALITY,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_fallback=True
+    )
+else:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        compresslevel=settings.COMPRESSION_GZIP_LEVEL
+    )
+
+# Métricas por rota: middleware mais externo (mede o tamanho já comprimido)
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["analytics"])
+app.include_router(customers.router, prefix="/api/v1/customers", tags=["customers"])
+app.include_router(exports.router, prefix="/api/v1/exports", tags=["exports"])
 app.include_router(debug.router, prefix="/api/v1/debug", tags=["debug"])
 
+@app.on_event("startup")
+async def start_matview_scheduler():
+    matview_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_matview_scheduler():
+    await matview_scheduler.stop()
+
 @app.get("/")
 async def root():
     return {"message": "Restaurant Analytics API", "version": settings.VERSION}
@@ -36,6 +79,11 @@ async def health_check():
 async def api_health_check():
     return {"status": "healthy", "api_version": "v1", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime, date
 
 # Schemas CORRETOS - usar 'date' em SalesTrend
@@ -8,6 +8,9 @@ class KPIOverview(BaseModel):
     total_orders: int
     avg_ticket: float
     unique_customers: int
+    # Estimativa por sketch HLL: erro padrão relativo em unique_customers_error
+    unique_customers_approximate: Optional[bool] = None
+    unique_customers_error: Optional[float] = None
     revenue_change: Optional[float] = None
     orders_change: Optional[float] = None
 
@@ -37,9 +40,45 @@ class HourlySales(BaseModel):
     orders: int
     avg_ticket: float
 
+class DataFreshness(BaseModel):
+    # Fonte da seção: rollup, materialized view ou sales
+    source: str
+    refreshed_at: Optional[datetime] = None
+    staleness_seconds: float = 0
+
 class AnalyticsResponse(BaseModel):
-    overview: KPIOverview
-    sales_trends: List[SalesTrend]
-    top_products: List[TopProduct]
-    channel_performance: List[ChannelPerformance]
-    hourly_sales: List[HourlySales]
\ No newline at end of file
+    # Com ?fields=, apenas as seções pedidas vêm na resposta
+    overview: Optional[KPIOverview] = None
+    sales_trends: Optional[List[SalesTrend]] = None
+    top_products: Optional[List[TopProduct]] = None
+    channel_performance: Optional[List[ChannelPerformance]] = None
+    hourly_sales: Optional[List[HourlySales]] = None
+    data_freshness: Optional[Dict[str, DataFreshness]] = None
+
+# Modo avançado: query customizada
+class QueryField(BaseModel):
+    field: str
+    type: Optional[str] = None
+    aggregation: Optional[str] = None
+
+class QueryFilter(BaseModel):
+    field: str
+    operator: str = "="
+    value: Any = None
+
+class CustomQueryRequest(BaseModel):
+    dimensions: List[Union[str, QueryField]] = []
+    measures: List[Union[str, QueryField]] = []
+    filters: List[QueryFilter] = []
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    store_ids: Optional[List[int]] = None
+    limit: Optional[int] = None
+
+class CustomQueryResponse(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    row_count: int
+    truncated: bool
+    source: str
+    execution_ms: float
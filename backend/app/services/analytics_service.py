@@ -1,65 +1,147 @@
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-from app.services.query_builder import QueryBuilder
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.query_builder import DASHBOARD_SECTIONS, AsyncQueryBuilder
+from app.services.cache import ResultCache, result_cache
 
 class AnalyticsService:
-    def __init__(self, db):
+    def __init__(self, db, cache: Optional[ResultCache] = None,
+                 statement_timeout_ms: Optional[int] = None):
         self.db = db
-        self.query_builder = QueryBuilder(db)
+        # Sessões extras (dashboard concorrente) no mesmo servidor da sessão do request
+        session_factory = db.info.get('session_factory', AsyncSessionLocal)
+        self.query_builder = AsyncQueryBuilder(
+            db, session_factory=session_factory, statement_timeout_ms=statement_timeout_ms
+        )
+        self.cache = cache or result_cache
     
-    def get_business_overview(self, start_date: Optional[str] = None, 
-                            end_date: Optional[str] = None,
-                            store_ids: Optional[List[int]] = None) -> Dict:
-        """Overview completo do negócio"""
-        filters = self._build_filters(start_date, end_date, store_ids)
-        
-        overview = self.query_builder.get_kpi_overview(filters)
-        sales_trends = self.query_builder.get_sales_trends(filters, 'day')
-        top_products = self.query_builder.get_top_products(filters, 10)
-        channel_performance = self.query_builder.get_channel_performance(filters)
-        hourly_sales = self.query_builder.get_hourly_sales(filters)
+    async def get_business_overview(self, start_date: Optional[str] = None, 
+                                  end_date: Optional[str] = None,
+                                  store_ids: Optional[List[int]] = None,
+                                  sections=DASHBOARD_SECTIONS,
+                                  exact: bool = False) -> Dict:
+        """Overview completo do negócio (ou apenas as seções pedidas)
         
-        # Calcular variações percentuais
+        Clientes únicos são estimados pelos sketches HLL quando os rollups
+        cobrem o período; `exact` força o COUNT DISTINCT nas vendas.
+        """
+        filters = self._build_filters(start_date, end_date, store_ids)
+        sections = tuple(s for s in DASHBOARD_SECTIONS if s in sections)
+        params = {} if sections == DASHBOARD_SECTIONS else {'sections': sections}
+        if exact:
+            params['exact'] = True
+        return await self.cache.aget_or_compute_at_watermark(
+            self.db, 'business_overview', filters,
+            lambda: self._compute_business_overview(filters, sections, exact),
+            **params
+        )
+    
+    async def _compute_business_overview(self, filters: Dict, sections=DASHBOARD_SECTIONS,
+                                         exact: bool = False) -> Dict:
+        """Calcular o overview a partir do banco (sem cache)"""
+        # Período anterior (comparação) vem na mesma query do dashboard,
+        # ou em paralelo com as demais seções no modo "concurrent"
         prev_filters = self._build_previous_period_filters(filters)
-        prev_overview = self.query_builder.get_kpi_overview(prev_filters)
+        if settings.DASHBOARD_QUERY_MODE == 'concurrent':
+            dashboard = await self.query_builder.get_dashboard_concurrent(
+                filters, prev_filters, 10, sections, exact
+            )
+        else:
+            dashboard = await self.query_builder.get_dashboard(filters, prev_filters, 10, sections, exact)
         
-        overview['revenue_change'] = self._calculate_percentage_change(
-            overview['total_revenue'], prev_overview['total_revenue']
-        )
-        overview['orders_change'] = self._calculate_percentage_change(
-            overview['total_orders'], prev_overview['total_orders']
-        )
+        if 'overview' in sections:
+            overview = dashboard['overview']
+            prev_overview = dashboard['previous_overview']
+            
+            # Calcular variações percentuais
+            overview['revenue_change'] = self._calculate_percentage_change(
+                overview['total_revenue'], prev_overview['total_revenue']
+            )
+            overview['orders_change'] = self._calculate_percentage_change(
+                overview['total_orders'], prev_overview['total_orders']
+            )
         
-        return {
-            'overview': overview,
-            'sales_trends': sales_trends,
-            'top_products': top_products,
-            'channel_performance': channel_performance,
-            'hourly_sales': hourly_sales
-        }
+        result = {section: dashboard[section] for section in sections}
+        if dashboard['data_freshness']:
+            # Fonte e defasagem de quando o resultado foi calculado: vão juntas ao cache
+            result['data_freshness'] = dashboard['data_freshness']
+        return result
     
-    def get_sales_trends(self, period: str = 'day',
-                        start_date: Optional[str] = None,
-                        end_date: Optional[str] = None,
-                        store_ids: Optional[List[int]] = None) -> List[Dict]:
+    async def get_sales_trends(self, period: str = 'day',
+                              start_date: Optional[str] = None,
+                              end_date: Optional[str] = None,
+                              store_ids: Optional[List[int]] = None) -> List[Dict]:
         """Tendências de vendas"""
         filters = self._build_filters(start_date, end_date, store_ids)
-        return self.query_builder.get_sales_trends(filters, period)
+        return await self.cache.aget_or_compute_at_watermark(
+            self.db, 'sales_trends', filters,
+            lambda: self.query_builder.get_sales_trends(filters, period),
+            period=period
+        )
     
-    def get_top_products(self, limit: int = 10,
-                        start_date: Optional[str] = None,
-                        end_date: Optional[str] = None,
-                        store_ids: Optional[List[int]] = None) -> List[Dict]:
-        """Produtos mais vendidos"""
+    async def get_top_products(self, limit: int = 10,
+                              start_date: Optional[str] = None,
+                              end_date: Optional[str] = None,
+                              store_ids: Optional[List[int]] = None) -> Dict:
+        """Produtos mais vendidos, com a fonte e a defasagem dos dados"""
         filters = self._build_filters(start_date, end_date, store_ids)
-        return self.query_builder.get_top_products(filters, limit)
+        return await self.cache.aget_or_compute_at_watermark(
+            self.db, 'top_products', filters,
+            lambda: self._with_freshness(
+                'top_products', 'products', filters,
+                lambda coverage: self.query_builder.get_top_products(filters, limit, coverage)
+            ),
+            limit=limit
+        )
     
-    def get_channel_performance(self, start_date: Optional[str] = None,
+    async def get_channel_performance(self, start_date: Optional[str] = None,
+                                    end_date: Optional[str] = None,
+                                    store_ids: Optional[List[int]] = None) -> Dict:
+        """Performance por canal, com a fonte e a defasagem dos dados"""
+        filters = self._build_filters(start_date, end_date, store_ids)
+        return await self.cache.aget_or_compute_at_watermark(
+            self.db, 'channel_performance', filters,
+            lambda: self._with_freshness(
+                'channel_performance', 'channels', filters,
+                lambda coverage: self.query_builder.get_channel_performance(filters, coverage)
+            )
+        )
+    
+    async def _with_freshness(self, section: str, key: str, filters: Dict, compute) -> Dict:
+        """Resultado da seção e a fonte/defasagem de quando foi calculado (cacheados juntos)
+        
+        A cobertura é lida uma vez e usada na query e na defasagem: a fonte
+        reportada é a que produziu as linhas.
+        """
+        coverage = await self.query_builder.get_coverage()
+        items = await compute(coverage)
+        freshness = await self.query_builder.get_freshness(section, filters, coverage)
+        return {key: items, 'data_freshness': freshness}
+    
+    async def get_hourly_sales(self, start_date: Optional[str] = None,
                               end_date: Optional[str] = None,
                               store_ids: Optional[List[int]] = None) -> List[Dict]:
-        """Performance por canal"""
+        """Vendas por hora do dia"""
         filters = self._build_filters(start_date, end_date, store_ids)
-        return self.query_builder.get_channel_performance(filters)
+        return await self.cache.aget_or_compute_at_watermark(
+            self.db, 'hourly_sales', filters,
+            lambda: self.query_builder.get_hourly_sales(filters)
+        )
+    
+    @staticmethod
+    def parse_sections(fields: Optional[str]) -> tuple:
+        """`?fields=overview,hourly_sales` -> seções do dashboard (todas se vazio)"""
+        requested = {field.strip() for field in (fields or '').split(',') if field.strip()}
+        if not requested:
+            return DASHBOARD_SECTIONS
+        unknown = requested - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise ValueError(
+                f"Seções desconhecidas: {', '.join(sorted(unknown))}. "
+                f"Disponíveis: {', '.join(DASHBOARD_SECTIONS)}"
+            )
+        return tuple(s for s in DASHBOARD_SECTIONS if s in requested)
     
     def _build_filters(self, start_date: Optional[str], end_date: Optional[str], 
                       store_ids: Optional[List[int]]) -> Dict:
@@ -87,7 +169,8 @@ class AnalyticsService:
         start_date = datetime.strptime(current_filters['start_date'], '%Y-%m-%d')
         end_date = datetime.strptime(current_filters['end_date'], '%Y-%m-%d')
         
-        period_days = (end_date - start_date).days
+        # Períodos inclusivos: o anterior tem o mesmo número de dias
+        period_days = (end_date - start_date).days + 1
         
         prev_start_date = start_date - timedelta(days=period_days)
         prev_end_date = start_date - timedelta(days=1)
@@ -0,0 +1,212 @@
+"""
+Cache de resultados do AnalyticsService.
+
+As chaves são montadas a partir dos filtros normalizados (`_build_filters`)
+e dos parâmetros do método. Períodos fechados (end_date antes de hoje)
+recebem TTL longo; períodos que incluem hoje recebem TTL curto.
+O backend é plugável: qualquer objeto com a interface de `CacheBackend`.
+Computações assíncronas idênticas e simultâneas passam pelo single-flight
+(`app.services.singleflight`): uma só query, resultado compartilhado.
+Resultados servidos com ETag usam `aget_or_compute_at_watermark`: a
+marca d'água dos dados entra na chave, e um ETag novo nunca acompanha um
+corpo calculado antes das vendas ou do refresh que ele representa.
+"""
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.singleflight import SingleFlight
+from app.services.watermark import data_version, get_watermark_async
+
+
+class CacheBackend:
+    """Interface mínima de um backend de cache"""
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float, meta: Optional[Dict] = None):
+        raise NotImplementedError
+
+    def delete_where(self, predicate: Callable[[Dict], bool]) -> int:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Cache LRU em memória, com limite de entradas e expiração por entrada"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            value, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float, meta: Optional[Dict] = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, meta or {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_where(self, predicate: Callable[[Dict], bool]) -> int:
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(entry[2])]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'lru',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class ResultCache:
+    def __init__(self, backend: CacheBackend, enabled: bool = True,
+                 flights: Optional[SingleFlight] = None):
+        self.backend = backend
+        self.enabled = enabled
+        self.flights = flights
+
+    def make_key(self, method: str, filters: Dict, **params) -> str:
+        """Chave estável a partir do método, filtros normalizados e parâmetros"""
+        normalized = dict(filters)
+        if normalized.get('store_ids'):
+            normalized['store_ids'] = sorted(set(normalized['store_ids']))
+        return json.dumps(
+            {'method': method, 'filters': normalized, 'params': params},
+            sort_keys=True, default=str
+        )
+
+    def is_closed(self, filters: Dict) -> bool:
+        """Período fechado: end_date anterior a hoje"""
+        end_day = _to_date(filters.get('end_date'))
+        return end_day is not None and end_day < date.today()
+
+    def ttl_for(self, filters: Dict) -> int:
+        """TTL longo para períodos fechados, curto para períodos que incluem hoje"""
+        if self.is_closed(filters):
+            return settings.CACHE_TTL_HISTORICAL_SECONDS
+        return settings.CACHE_TTL_RECENT_SECONDS
+
+    async def aget_or_compute(self, method: str, filters: Dict,
+                              compute: Callable[[], Awaitable[Any]], **params) -> Any:
+        """Resultado em cache ou calculado por `compute` (assíncrono) e guardado
+        
+        Requests idênticos simultâneos compartilham uma única computação
+        (single-flight).
+        """
+        key = self.make_key(method, filters, **params)
+        if self.enabled:
+            hit, value = self.backend.get(key)
+            if hit:
+                # Cópia: os handlers ajustam o resultado antes de responder
+                return copy.deepcopy(value)
+
+        async def compute_and_store():
+            value = await compute()
+            if self.enabled:
+                self._store(key, filters, value)
+            return value
+
+        if self.flights is None:
+            return await compute_and_store()
+        return await self.flights.do(key, compute_and_store)
+    
+    async def aget_or_compute_at_watermark(self, db, method: str, filters: Dict,
+                                           compute: Callable[[], Awaitable[Any]], **params) -> Any:
+        """aget_or_compute com a versão dos dados (mesmas marcas do ETag) na chave"""
+        version = data_version(await get_watermark_async(db), self.is_closed(filters))
+        return await self.aget_or_compute(method, filters, compute, data_version=version, **params)
+
+    def _store(self, key: str, filters: Dict, value: Any):
+        self.backend.set(key, copy.deepcopy(value), self.ttl_for(filters), meta={
+            'start_date': _to_date(filters.get('start_date')),
+            'end_date': _to_date(filters.get('end_date'))
+        })
+
+    def invalidate_from(self, day: date) -> int:
+        """Remover entradas cujo período alcança `day` ou dias posteriores"""
+        return self.backend.delete_where(
+            lambda meta: meta.get('end_date') is None or meta['end_date'] >= day
+        )
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        stats = self.backend.stats()
+        stats['enabled'] = self.enabled
+        if self.flights is not None:
+            stats['singleflight'] = self.flights.stats()
+        return stats
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+result_cache = ResultCache(
+    LRUCache(settings.CACHE_MAX_ENTRIES),
+    enabled=settings.CACHE_ENABLED,
+    flights=SingleFlight(
+        lock_dir=settings.SINGLEFLIGHT_LOCK_DIR or None,
+        result_ttl=settings.SINGLEFLIGHT_RESULT_TTL_SECONDS,
+        lock_timeout=settings.SINGLEFLIGHT_LOCK_TIMEOUT_SECONDS
+    ) if settings.SINGLEFLIGHT_ENABLED else None
+)
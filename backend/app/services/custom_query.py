@@ -0,0 +1,337 @@
+"""
+Motor de queries customizadas (POST /analytics/custom-query).
+
+Compila dimensões, medidas e filtros da camada semântica em SQL
+parametrizado, usando os rollups diários quando eles respondem a query.
+Cada execução tem limite de linhas e statement_timeout próprios.
+"""
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services import semantic_layer as sl
+from app.services.cache import result_cache
+from app.services.query_builder import AsyncQueryBuilder, to_datetime
+from app.services.rollups import rollups_cover
+
+
+class CustomQueryError(ValueError):
+    """Query customizada inválida (campo, operador ou valor não permitido)"""
+
+
+class CustomQueryEngine(AsyncQueryBuilder):
+    async def execute(self, spec: Dict) -> Dict:
+        """Validar, compilar e executar a query customizada"""
+        request = self.normalize(spec)
+        return await result_cache.aget_or_compute(
+            'custom_query', request['base_filters'], lambda: self._run(request),
+            dimensions=request['dimensions'], measures=request['measures'],
+            filters=request['filters'], limit=request['limit']
+        )
+
+    async def _run(self, request: Dict) -> Dict:
+        query, params, source = self.compile(request, await self._coverage())
+
+        await self.db.execute(
+            text(f"SET LOCAL statement_timeout = {int(settings.CUSTOM_QUERY_TIMEOUT_MS)}")
+        )
+        start = time.perf_counter()
+        results = await self._execute(query, params, f'custom_query:{source}')
+        execution_ms = (time.perf_counter() - start) * 1000
+
+        columns = request['dimensions'] + request['measures']
+        truncated = len(results) > request['limit']
+        rows = [
+            {column: _json_value(value) for column, value in zip(columns, row)}
+            for row in results[:request['limit']]
+        ]
+
+        return {
+            'columns': columns,
+            'rows': rows,
+            'row_count': len(rows),
+            'truncated': truncated,
+            'source': source,
+            'execution_ms': round(execution_ms, 2)
+        }
+
+    def normalize(self, spec: Dict) -> Dict:
+        """Validar campos contra a camada semântica e normalizar a requisição"""
+        dimensions = _field_names(spec.get('dimensions'))
+        measures = _field_names(spec.get('measures'))
+
+        if not dimensions and not measures:
+            raise CustomQueryError("Informe ao menos uma dimensão ou medida")
+        if len(dimensions) > settings.CUSTOM_QUERY_MAX_DIMENSIONS:
+            raise CustomQueryError(f"Máximo de {settings.CUSTOM_QUERY_MAX_DIMENSIONS} dimensões")
+        if len(measures) > settings.CUSTOM_QUERY_MAX_MEASURES:
+            raise CustomQueryError(f"Máximo de {settings.CUSTOM_QUERY_MAX_MEASURES} medidas")
+
+        for field in dimensions:
+            if field not in sl.DIMENSIONS:
+                raise CustomQueryError(f"Dimensão não suportada: {field}")
+        for field in measures:
+            if field not in sl.MEASURES:
+                raise CustomQueryError(f"Medida não suportada: {field}")
+
+        raw_filters = spec.get('filters') or []
+        if len(raw_filters) > settings.CUSTOM_QUERY_MAX_FILTERS:
+            raise CustomQueryError(f"Máximo de {settings.CUSTOM_QUERY_MAX_FILTERS} filtros")
+        filters = [self._normalize_filter(f) for f in raw_filters]
+
+        # Mesmo padrão do AnalyticsService: últimos 30 dias
+        base_filters = {
+            'start_date': spec.get('start_date') or (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
+            'end_date': spec.get('end_date') or datetime.now().strftime('%Y-%m-%d')
+        }
+        start = _period_bound('start_date', base_filters['start_date'])
+        end = _period_bound('end_date', base_filters['end_date'])
+        if end < start:
+            raise CustomQueryError("end_date anterior a start_date")
+        if spec.get('store_ids'):
+            base_filters['store_ids'] = sorted(set(spec['store_ids']))
+
+        limit = spec.get('limit') or settings.CUSTOM_QUERY_DEFAULT_ROWS
+        limit = max(1, min(int(limit), settings.CUSTOM_QUERY_MAX_ROWS))
+
+        return {
+            'dimensions': dimensions,
+            'measures': measures,
+            'filters': filters,
+            'base_filters': base_filters,
+            'limit': limit
+        }
+
+    def _normalize_filter(self, raw: Dict) -> Dict:
+        field = sl.FILTER_ALIASES.get(raw.get('field'), raw.get('field'))
+        operator = (raw.get('operator') or '=').upper()
+        if field not in sl.FILTERS:
+            raise CustomQueryError(f"Filtro não suportado: {field}")
+        if operator not in sl.OPERATORS:
+            raise CustomQueryError(f"Operador não suportado: {operator}")
+
+        value_type = sl.FILTERS[field]['type']
+        value = raw.get('value')
+
+        if operator == 'IN':
+            values = value.split(',') if isinstance(value, str) else list(value or [])
+            values = [v.strip() if isinstance(v, str) else v for v in values]
+            values = [v for v in values if v not in ('', None)]
+            if not values:
+                raise CustomQueryError(f"Filtro IN sem valores: {field}")
+            if len(values) > settings.CUSTOM_QUERY_MAX_IN_VALUES:
+                raise CustomQueryError(f"Máximo de {settings.CUSTOM_QUERY_MAX_IN_VALUES} valores em IN")
+            value = [_coerce(field, value_type, v) for v in values]
+        elif operator == 'LIKE':
+            if value_type != 'text':
+                raise CustomQueryError(f"LIKE só é permitido em campos de texto: {field}")
+            value = str(value)
+            if '%' not in value:
+                value = f"%{value}%"
+        else:
+            value = _coerce(field, value_type, value)
+
+        return {'field': field, 'operator': operator, 'value': value}
+
+    def compile(self, request: Dict, coverage: Dict) -> Tuple[str, Dict, str]:
+        """Gerar SQL parametrizado; retorna (query, params, fonte dos dados)"""
+        source = self._rollup_source(request, coverage)
+        if source:
+            query, params = self._compile_rollup(request, source)
+            return query, params, source
+
+        query, params = self._compile_raw(request)
+        return query, params, 'sales'
+
+    def _rollup_source(self, request: Dict, coverage: Dict) -> Optional[str]:
+        """Primeiro rollup capaz de responder dimensões, medidas e filtros da query"""
+        base_filters = request['base_filters']
+        for name, source in sl.ROLLUP_SOURCES.items():
+            if not set(request['dimensions']) <= set(source['dimensions']):
+                continue
+            if not set(request['measures']) <= set(source['measures']):
+                continue
+            if not {f['field'] for f in request['filters']} <= set(source['filters']):
+                continue
+            if base_filters.get('store_ids') and not source['has_store']:
+                continue
+            if rollups_cover(coverage, base_filters, [name]):
+                return name
+        return None
+
+    def _compile_rollup(self, request: Dict, name: str) -> Tuple[str, Dict]:
+        source = sl.ROLLUP_SOURCES[name]
+        conditions, params = self._build_rollup_conditions(request['base_filters'])
+        joins = []
+
+        select = []
+        for field in request['dimensions']:
+            sql, field_joins = source['dimensions'][field]
+            joins.extend(field_joins)
+            select.append((field, sql))
+        for field in request['measures']:
+            select.append((field, source['measures'][field]))
+
+        for i, f in enumerate(request['filters']):
+            sql, field_joins = source['filters'][f['field']]
+            joins.extend(field_joins)
+            conditions.append(self._filter_condition(sql, f, f"f{i}", params))
+
+        join_clause = self._join_clause(self._resolve_joins(joins, source['joins']), source['joins'])
+        query = self._assemble(
+            select, f"{name} r", join_clause, conditions,
+            len(request['dimensions']), request
+        )
+        return query, params
+
+    def _compile_raw(self, request: Dict) -> Tuple[str, Dict]:
+        grain = self._grain(request)
+        conditions, params = self._build_base_conditions(request['base_filters'])
+        joins = []
+        if grain == 'product':
+            joins.append('product_sales')
+        elif grain == 'payment':
+            joins.append('payments')
+
+        select = []
+        for field in request['dimensions']:
+            dimension = sl.DIMENSIONS[field]
+            joins.extend(dimension.get('joins', []))
+            select.append((field, dimension['sql']))
+        for field in request['measures']:
+            measure = sl.MEASURES[field]
+            if grain not in measure['sql']:
+                raise CustomQueryError(f"Medida {field} não está disponível junto de dimensões de {grain}")
+            joins.extend(measure.get('joins', []))
+            select.append((field, measure['sql'][grain]))
+
+        for i, f in enumerate(request['filters']):
+            definition = sl.FILTERS[f['field']]
+            filter_grain = definition.get('grain', 'sale')
+            condition = self._filter_condition(definition['sql'], f, f"f{i}", params)
+
+            if filter_grain in ('sale', grain):
+                joins.extend(definition.get('joins', []))
+                conditions.append(condition)
+            else:
+                # Filtro de outro grão: EXISTS evita multiplicar as linhas
+                from_clause, correlation, alias = sl.GRAIN_EXISTS[filter_grain]
+                exists_conditions = [correlation, condition] + self._child_period_conditions(alias, params)
+                conditions.append(
+                    f"EXISTS (SELECT 1 FROM {from_clause} WHERE {' AND '.join(exists_conditions)})"
+                )
+
+        resolved = self._resolve_joins(joins, sl.RAW_JOINS)
+        for name in resolved:
+            if name in sl.PARTITIONED_JOINS:
+                conditions.extend(self._child_period_conditions(sl.PARTITIONED_JOINS[name], params))
+
+        join_clause = self._join_clause(resolved, sl.RAW_JOINS)
+        query = self._assemble(
+            select, "sales s", join_clause, conditions,
+            len(request['dimensions']), request
+        )
+        return query, params
+
+    def _grain(self, request: Dict) -> str:
+        grains = {sl.DIMENSIONS[f].get('grain', 'sale') for f in request['dimensions']}
+        grains |= {sl.MEASURES[f].get('grain', 'sale') for f in request['measures']}
+        grains.discard('sale')
+        if len(grains) > 1:
+            raise CustomQueryError("Não é possível combinar produtos e pagamentos na mesma query")
+        return grains.pop() if grains else 'sale'
+
+    def _filter_condition(self, sql: str, f: Dict, param: str, params: Dict) -> str:
+        params[param] = f['value']
+        if f['operator'] == 'IN':
+            return f"{sql} IN :{param}"
+        return f"{sql} {sl.OPERATORS[f['operator']]} :{param}"
+
+    def _resolve_joins(self, names: List[str], registry: Dict) -> List[str]:
+        """Joins na ordem de dependência, sem repetição"""
+        ordered = []
+
+        def visit(name):
+            sql, deps = registry[name]
+            for dep in deps:
+                visit(dep)
+            if name not in ordered:
+                ordered.append(name)
+
+        for name in names:
+            visit(name)
+        return ordered
+
+    def _join_clause(self, names: List[str], registry: Dict) -> str:
+        return "\n            ".join(registry[name][0] for name in names)
+
+    def _assemble(self, select: List[Tuple[str, str]], from_clause: str, join_clause: str,
+                  conditions: List[str], dimension_count: int, request: Dict) -> str:
+        select_clause = ",\n                ".join(f'{sql} AS "{field}"' for field, sql in select)
+        group_clause = ""
+        if dimension_count:
+            group_clause = "GROUP BY " + ", ".join(str(i) for i in range(1, dimension_count + 1))
+
+        time_positions = [
+            str(i + 1) for i, field in enumerate(request['dimensions'])
+            if field in sl.TIME_DIMENSIONS
+        ]
+        if time_positions:
+            order_clause = "ORDER BY " + ", ".join(time_positions)
+        elif request['measures']:
+            order_clause = f"ORDER BY {dimension_count + 1} DESC NULLS LAST"
+        else:
+            order_clause = "ORDER BY 1"
+
+        # +1 linha para detectar truncamento
+        return f"""
+            SELECT
+                {select_clause}
+            FROM {from_clause}
+            {join_clause}
+            WHERE {" AND ".join(conditions)}
+            {group_clause}
+            {order_clause}
+            LIMIT {request['limit'] + 1}
+            """
+
+
+def _field_names(fields) -> List[str]:
+    """Aceita ['campo'] ou [{'field': 'campo', ...}] (formato do frontend); remove repetidos"""
+    names = []
+    for field in fields or []:
+        name = field.get('field') if isinstance(field, dict) else field
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _period_bound(name: str, value) -> datetime:
+    """start_date/end_date no formato aceito pelos filtros base (ISO), sem fuso para comparação"""
+    try:
+        return to_datetime(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        raise CustomQueryError(f"Data inválida em {name}: {value!r} (use YYYY-MM-DD)")
+
+
+def _coerce(field: str, value_type: str, value):
+    try:
+        if value_type == 'date':
+            return value if isinstance(value, date) else datetime.strptime(str(value), '%Y-%m-%d').date()
+        if value_type == 'int':
+            return int(value)
+        if value_type == 'number':
+            return float(value)
+        return str(value)
+    except (TypeError, ValueError):
+        raise CustomQueryError(f"Valor inválido para {field}: {value!r}")
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
@@ -0,0 +1,353 @@
+"""
+Analytics de clientes: segmentação RFM, retenção por coorte mensal e
+clientes em risco de churn por loja.
+
+Todas as queries leem só o resumo por cliente (app.services.customer_summary),
+nunca o histórico de vendas: o custo cresce com o número de clientes, não
+com o de pedidos. Os resultados valem até o último dia agregado no resumo
+(`as_of`, dias fechados), que serve de referência para a recência.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.cache import ResultCache, result_cache
+from app.services.customer_summary import SUMMARY_NAME
+from app.services.query_builder import AsyncQueryBuilder
+
+# Segmentos pelos scores de recência (R) e frequência (F), de 1 a 5 (quintis);
+# o primeiro que casa vence, sem condição = demais clientes
+RFM_SEGMENTS = [
+    ('champions', "r_score >= 4 AND f_score >= 4"),
+    ('loyal', "r_score >= 3 AND f_score >= 3"),
+    ('new', "r_score >= 4 AND f_score <= 1"),
+    ('potential_loyalists', "r_score >= 3"),
+    ('at_risk', "f_score >= 3"),
+    ('hibernating', "r_score = 2"),
+    ('lost', None),
+]
+
+
+class CustomerSummaryUnavailable(RuntimeError):
+    """Resumo de clientes ainda não gerado"""
+
+
+class CustomerQueryBuilder(AsyncQueryBuilder):
+    async def as_of(self) -> date:
+        """Último dia agregado no resumo de clientes"""
+        coverage = await self._coverage()
+        if SUMMARY_NAME not in coverage:
+            raise CustomerSummaryUnavailable(
+                "Resumo de clientes ainda não gerado: rode python -m app.services.customer_summary"
+            )
+        return coverage[SUMMARY_NAME][1]
+
+    def _store_conditions(self, store_ids: Optional[List[int]], alias: str) -> Tuple[List[str], Dict]:
+        if store_ids:
+            return [f"{alias}.store_id IN :store_ids"], {'store_ids': tuple(store_ids)}
+        return ["TRUE"], {}
+
+    def _rfm_scored_sql(self, store_where: str) -> str:
+        """Clientes (somando as lojas do recorte) com scores R, F e M e o segmento"""
+        segment_case = "\n".join(
+            f"                WHEN {condition} THEN '{name}'" if condition else f"                ELSE '{name}'"
+            for name, condition in RFM_SEGMENTS
+        )
+        return f"""
+        WITH customer_totals AS (
+            SELECT
+                c.customer_id,
+                MAX(c.last_order_day) AS last_order_day,
+                SUM(c.orders) AS frequency,
+                SUM(c.revenue) AS monetary
+            FROM customer_store_summary c
+            WHERE {store_where}
+            GROUP BY c.customer_id
+        ),
+        scored AS (
+            SELECT
+                t.*,
+                CAST(:as_of AS date) - t.last_order_day AS recency_days,
+                NTILE(5) OVER (ORDER BY t.last_order_day) AS r_score,
+                NTILE(5) OVER (ORDER BY t.frequency, t.monetary) AS f_score,
+                NTILE(5) OVER (ORDER BY t.monetary) AS m_score
+            FROM customer_totals t
+        ),
+        segmented AS (
+            SELECT
+                scored.*,
+                CASE
+{segment_case}
+                END AS segment
+            FROM scored
+        )
+        """
+
+    def _rfm_segments_query(self, store_ids: Optional[List[int]], as_of: date) -> Tuple[str, Dict]:
+        conditions, params = self._store_conditions(store_ids, 'c')
+        params['as_of'] = as_of
+        query = self._rfm_scored_sql(" AND ".join(conditions)) + """
+        SELECT
+            segment,
+            COUNT(*) AS customers,
+            AVG(recency_days) AS avg_recency_days,
+            AVG(frequency) AS avg_frequency,
+            AVG(monetary) AS avg_monetary,
+            SUM(monetary) AS revenue
+        FROM segmented
+        GROUP BY segment
+        ORDER BY revenue DESC
+        """
+        return query, params
+
+    def _parse_rfm_segments(self, results) -> List[Dict]:
+        total = sum(row[1] for row in results) or 1
+        return [
+            {
+                'segment': row[0],
+                'customers': row[1],
+                'share': round(row[1] / total, 4),
+                'avg_recency_days': float(row[2]) if row[2] is not None else 0,
+                'avg_frequency': float(row[3]) if row[3] is not None else 0,
+                'avg_monetary': float(row[4]) if row[4] is not None else 0,
+                'revenue': float(row[5]) if row[5] is not None else 0
+            }
+            for row in results
+        ]
+
+    def _rfm_customers_query(self, store_ids: Optional[List[int]], as_of: date,
+                             segment: str, limit: int) -> Tuple[str, Dict]:
+        conditions, params = self._store_conditions(store_ids, 'c')
+        params.update({'as_of': as_of, 'segment': segment, 'limit': limit})
+        query = self._rfm_scored_sql(" AND ".join(conditions)) + """
+        SELECT
+            sg.customer_id, cu.customer_name,
+            sg.recency_days, sg.frequency, sg.monetary,
+            sg.r_score, sg.f_score, sg.m_score
+        FROM segmented sg
+        LEFT JOIN customers cu ON cu.id = sg.customer_id
+        WHERE sg.segment = :segment
+        ORDER BY sg.monetary DESC
+        LIMIT :limit
+        """
+        return query, params
+
+    def _parse_rfm_customers(self, results) -> List[Dict]:
+        return [
+            {
+                'customer_id': row[0],
+                'customer_name': row[1],
+                'recency_days': row[2],
+                'frequency': row[3],
+                'monetary': float(row[4]) if row[4] is not None else 0,
+                'rfm_score': f"{row[5]}{row[6]}{row[7]}"
+            }
+            for row in results
+        ]
+
+    def _cohort_retention_query(self, store_ids: Optional[List[int]], as_of: date,
+                                months: int) -> Tuple[str, Dict]:
+        """Clientes ativos por coorte (mês do primeiro pedido) × meses desde a entrada"""
+        conditions, params = self._store_conditions(store_ids, 'c')
+        month_conditions, _ = self._store_conditions(store_ids, 'm')
+        params['last_cohort'] = as_of.replace(day=1)
+        params['first_cohort'] = _add_months(as_of.replace(day=1), -(months - 1))
+        query = f"""
+        WITH cohorts AS (
+            SELECT c.customer_id, DATE_TRUNC('month', MIN(c.first_order_day))::date AS cohort_month
+            FROM customer_store_summary c
+            WHERE {" AND ".join(conditions)}
+            GROUP BY c.customer_id
+            HAVING DATE_TRUNC('month', MIN(c.first_order_day))::date >= :first_cohort
+        ),
+        activity AS (
+            SELECT DISTINCT m.customer_id, m.month
+            FROM customer_store_months m
+            WHERE m.month >= :first_cohort AND {" AND ".join(month_conditions)}
+        )
+        SELECT
+            co.cohort_month,
+            ((EXTRACT(YEAR FROM a.month) - EXTRACT(YEAR FROM co.cohort_month)) * 12
+              + EXTRACT(MONTH FROM a.month) - EXTRACT(MONTH FROM co.cohort_month))::int AS month_offset,
+            COUNT(*) AS customers
+        FROM cohorts co
+        JOIN activity a ON a.customer_id = co.customer_id
+        WHERE co.cohort_month <= :last_cohort AND a.month <= :last_cohort
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        """
+        return query, params
+
+    def _parse_cohort_retention(self, results) -> List[Dict]:
+        """Matriz de retenção: uma linha por coorte, uma coluna por mês desde a entrada"""
+        cohorts: Dict[date, Dict[int, int]] = {}
+        for cohort_month, offset, customers in results:
+            cohorts.setdefault(cohort_month, {})[offset] = customers
+
+        matrix = []
+        for cohort_month, active in cohorts.items():
+            size = active.get(0, 0)
+            counts = [active.get(offset, 0) for offset in range(max(active) + 1)]
+            matrix.append({
+                'cohort_month': cohort_month,
+                'customers': size,
+                'active': counts,
+                'retention': [round(count / size, 4) if size else 0 for count in counts]
+            })
+        return matrix
+
+    def _churn_risk_query(self, store_ids: Optional[List[int]], as_of: date,
+                          limit: int) -> Tuple[str, Dict]:
+        """Clientes recorrentes sem pedir há bem mais que o seu intervalo médio (`limit` por loja)"""
+        conditions, params = self._store_conditions(store_ids, 'c')
+        params.update({
+            'as_of': as_of,
+            'limit': limit,
+            'min_orders': max(settings.CUSTOMER_CHURN_MIN_ORDERS, 2),
+            'interval_factor': settings.CUSTOMER_CHURN_INTERVAL_FACTOR,
+            'min_days': settings.CUSTOMER_CHURN_MIN_DAYS,
+            'max_days': settings.CUSTOMER_CHURN_MAX_DAYS
+        })
+        query = f"""
+        WITH at_risk AS (
+            SELECT
+                c.store_id, c.customer_id, c.orders, c.revenue, c.last_order_day,
+                r.days_since_last, r.avg_interval_days,
+                ROW_NUMBER() OVER (PARTITION BY c.store_id ORDER BY c.revenue DESC) AS position
+            FROM customer_store_summary c
+            CROSS JOIN LATERAL (
+                SELECT
+                    CAST(:as_of AS date) - c.last_order_day AS days_since_last,
+                    (c.last_order_day - c.first_order_day)::float / NULLIF(c.orders - 1, 0) AS avg_interval_days
+            ) r
+            WHERE {" AND ".join(conditions)}
+              AND c.orders >= :min_orders
+              AND r.days_since_last <= :max_days
+              AND r.days_since_last > GREATEST(:min_days, :interval_factor * r.avg_interval_days)
+        )
+        SELECT
+            a.store_id, st.name AS store_name,
+            a.customer_id, cu.customer_name,
+            a.orders, a.revenue, a.last_order_day, a.days_since_last, a.avg_interval_days
+        FROM at_risk a
+        JOIN stores st ON st.id = a.store_id
+        LEFT JOIN customers cu ON cu.id = a.customer_id
+        WHERE a.position <= :limit
+        ORDER BY a.store_id, a.revenue DESC
+        """
+        return query, params
+
+    def _parse_churn_risk(self, results) -> List[Dict]:
+        return [
+            {
+                'store_id': row[0],
+                'store_name': row[1],
+                'customer_id': row[2],
+                'customer_name': row[3],
+                'orders': row[4],
+                'revenue': float(row[5]) if row[5] is not None else 0,
+                'last_order_day': row[6],
+                'days_since_last_order': row[7],
+                'avg_interval_days': round(float(row[8]), 1),
+                # Quantos intervalos médios sem pedir
+                'risk_score': round(row[7] / max(float(row[8]), 1.0), 2)
+            }
+            for row in results
+        ]
+
+    async def get_rfm_segments(self, store_ids: Optional[List[int]], as_of: date) -> List[Dict]:
+        query, params = self._rfm_segments_query(store_ids, as_of)
+        return self._parse_rfm_segments(await self._execute(query, params, 'rfm_segments'))
+
+    async def get_rfm_customers(self, store_ids: Optional[List[int]], as_of: date,
+                                segment: str, limit: int) -> List[Dict]:
+        query, params = self._rfm_customers_query(store_ids, as_of, segment, limit)
+        return self._parse_rfm_customers(await self._execute(query, params, 'rfm_customers'))
+
+    async def get_cohort_retention(self, store_ids: Optional[List[int]], as_of: date,
+                                   months: int) -> List[Dict]:
+        query, params = self._cohort_retention_query(store_ids, as_of, months)
+        return self._parse_cohort_retention(await self._execute(query, params, 'cohort_retention'))
+
+    async def get_churn_risk(self, store_ids: Optional[List[int]], as_of: date,
+                             limit: int) -> List[Dict]:
+        query, params = self._churn_risk_query(store_ids, as_of, limit)
+        return self._parse_churn_risk(await self._execute(query, params, 'churn_risk'))
+
+
+class CustomerAnalyticsService:
+    def __init__(self, db, cache: Optional[ResultCache] = None,
+                 statement_timeout_ms: Optional[int] = None):
+        self.db = db
+        self.query_builder = CustomerQueryBuilder(db, statement_timeout_ms=statement_timeout_ms)
+        self.cache = cache or result_cache
+
+    async def get_rfm_segments(self, store_ids: Optional[List[int]] = None) -> Dict:
+        """Segmentos RFM: clientes, participação e médias de cada segmento"""
+        as_of = await self.query_builder.as_of()
+        filters = self._filters(store_ids, as_of)
+        segments = await self.cache.aget_or_compute_at_watermark(
+            self.db, 'rfm_segments', filters,
+            lambda: self.query_builder.get_rfm_segments(filters.get('store_ids'), as_of)
+        )
+        return {'as_of': as_of, 'segments': segments}
+
+    async def get_rfm_customers(self, segment: str, store_ids: Optional[List[int]] = None,
+                                limit: int = 100) -> Dict:
+        """Clientes de um segmento RFM, por faturamento"""
+        if segment not in dict(RFM_SEGMENTS):
+            raise ValueError(f"Segmento inválido: {segment} (use {', '.join(name for name, _ in RFM_SEGMENTS)})")
+        as_of = await self.query_builder.as_of()
+        filters = self._filters(store_ids, as_of)
+        customers = await self.cache.aget_or_compute_at_watermark(
+            self.db, 'rfm_customers', filters,
+            lambda: self.query_builder.get_rfm_customers(filters.get('store_ids'), as_of, segment, limit),
+            segment=segment, limit=limit
+        )
+        return {'as_of': as_of, 'segment': segment, 'customers': customers}
+
+    async def get_cohort_retention(self, store_ids: Optional[List[int]] = None,
+                                   months: int = 12) -> Dict:
+        """Retenção mensal das últimas `months` coortes"""
+        if not 1 <= months <= settings.CUSTOMER_COHORT_MAX_MONTHS:
+            raise ValueError(f"months deve estar entre 1 e {settings.CUSTOMER_COHORT_MAX_MONTHS}")
+        as_of = await self.query_builder.as_of()
+        filters = self._filters(store_ids, as_of)
+        cohorts = await self.cache.aget_or_compute_at_watermark(
+            self.db, 'cohort_retention', filters,
+            lambda: self.query_builder.get_cohort_retention(filters.get('store_ids'), as_of, months),
+            months=months
+        )
+        return {'as_of': as_of, 'cohorts': cohorts}
+
+    async def get_churn_risk(self, store_ids: Optional[List[int]] = None, limit: int = 100) -> Dict:
+        """Clientes em risco de churn por loja (até `limit` por loja), os de maior faturamento primeiro"""
+        as_of = await self.query_builder.as_of()
+        filters = self._filters(store_ids, as_of)
+        customers = await self.cache.aget_or_compute_at_watermark(
+            self.db, 'churn_risk', filters,
+            lambda: self.query_builder.get_churn_risk(filters.get('store_ids'), as_of, limit),
+            limit=limit
+        )
+        return {
+            'as_of': as_of,
+            'criteria': {
+                'min_orders': max(settings.CUSTOMER_CHURN_MIN_ORDERS, 2),
+                'interval_factor': settings.CUSTOMER_CHURN_INTERVAL_FACTOR,
+                'min_days': settings.CUSTOMER_CHURN_MIN_DAYS,
+                'max_days': settings.CUSTOMER_CHURN_MAX_DAYS
+            },
+            'customers': customers
+        }
+
+    def _filters(self, store_ids: Optional[List[int]], as_of: date) -> Dict:
+        """Filtros da chave de cache: `as_of` muda a cada refresh do resumo"""
+        filters = {'end_date': as_of.strftime('%Y-%m-%d')}
+        if store_ids:
+            filters['store_ids'] = sorted(set(store_ids))
+        return filters
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return day.replace(year=month_index // 12, month=month_index % 12 + 1)
@@ -0,0 +1,199 @@
+"""
+Resumo por cliente para analytics de clientes (RFM, coortes, churn).
+
+Duas tabelas, atualizadas de forma incremental a partir das vendas
+COMPLETED dos dias fechados ainda não processados:
+
+- `customer_store_summary`: cliente × loja (primeiro/último pedido,
+  pedidos, faturamento) — RFM e risco de churn;
+- `customer_store_months`: cliente × loja × mês com pedido — coortes.
+
+Diferente dos rollups diários, as linhas são acumuladas (upsert somando
+pedidos e faturamento), então cada bloco de dias é aplicado uma única vez:
+o bloco e o avanço do estado (`rollup_refresh_state`) vão na mesma
+transação, sob um advisory lock. Para reprocessar, `--rebuild` apaga o
+resumo e agrega todo o histórico de novo. Como os rollups, o resumo
+continua guardando o histórico de partições já desanexadas.
+
+Uso (dentro de backend/):
+    python -m app.services.customer_summary            # refresh incremental
+    python -m app.services.customer_summary --rebuild  # recriar a partir de todo o histórico
+"""
+import argparse
+import logging
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.rollups import STATE_TABLE_DDL, invalidate_coverage_cache
+from app.utils.helpers import parse_date
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_NAME = 'customer_store_summary'
+
+TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS customer_store_summary (
+        store_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        first_order_day DATE NOT NULL,
+        last_order_day DATE NOT NULL,
+        orders INTEGER NOT NULL,
+        revenue DECIMAL(14,2) NOT NULL,
+        PRIMARY KEY (store_id, customer_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS customer_store_summary_customer ON customer_store_summary (customer_id)",
+    """
+    CREATE TABLE IF NOT EXISTS customer_store_months (
+        store_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        month DATE NOT NULL,
+        orders INTEGER NOT NULL,
+        revenue DECIMAL(14,2) NOT NULL,
+        PRIMARY KEY (store_id, customer_id, month)
+    )
+    """,
+]
+
+SUMMARY_UPSERT = """
+INSERT INTO customer_store_summary (store_id, customer_id, first_order_day, last_order_day, orders, revenue)
+SELECT
+    s.store_id, s.customer_id,
+    MIN(s.created_at)::date, MAX(s.created_at)::date,
+    COUNT(*), SUM(s.total_amount)
+FROM sales s
+WHERE s.sale_status_desc = 'COMPLETED'
+  AND s.customer_id IS NOT NULL
+  AND s.created_at >= :from_day
+  AND s.created_at < :to_day_exclusive
+GROUP BY s.store_id, s.customer_id
+ON CONFLICT (store_id, customer_id) DO UPDATE SET
+    first_order_day = LEAST(customer_store_summary.first_order_day, EXCLUDED.first_order_day),
+    last_order_day = GREATEST(customer_store_summary.last_order_day, EXCLUDED.last_order_day),
+    orders = customer_store_summary.orders + EXCLUDED.orders,
+    revenue = customer_store_summary.revenue + EXCLUDED.revenue
+"""
+
+MONTHS_UPSERT = """
+INSERT INTO customer_store_months (store_id, customer_id, month, orders, revenue)
+SELECT
+    s.store_id, s.customer_id, DATE_TRUNC('month', s.created_at)::date,
+    COUNT(*), SUM(s.total_amount)
+FROM sales s
+WHERE s.sale_status_desc = 'COMPLETED'
+  AND s.customer_id IS NOT NULL
+  AND s.created_at >= :from_day
+  AND s.created_at < :to_day_exclusive
+GROUP BY s.store_id, s.customer_id, DATE_TRUNC('month', s.created_at)
+ON CONFLICT (store_id, customer_id, month) DO UPDATE SET
+    orders = customer_store_months.orders + EXCLUDED.orders,
+    revenue = customer_store_months.revenue + EXCLUDED.revenue
+"""
+
+
+class CustomerSummaryManager:
+    def __init__(self, db):
+        self.db = db
+
+    def ensure_tables(self):
+        """Criar tabelas do resumo e de estado (idempotente)"""
+        self.db.execute(text(STATE_TABLE_DDL))
+        for ddl in TABLES_DDL:
+            self.db.execute(text(ddl))
+        self.db.commit()
+
+    def rebuild(self, through: Optional[date] = None) -> int:
+        """Apagar o resumo e agregar todo o histórico de novo"""
+        self.ensure_tables()
+        self._lock()
+        self.db.execute(text("TRUNCATE customer_store_summary, customer_store_months"))
+        self.db.execute(text("DELETE FROM rollup_refresh_state WHERE rollup_name = :name"), {'name': SUMMARY_NAME})
+        self.db.commit()
+        return self.refresh(through)
+
+    def refresh(self, through: Optional[date] = None) -> int:
+        """Refresh incremental: aplica os dias fechados ainda não processados; retorna os dias aplicados"""
+        self.ensure_tables()
+
+        # Apenas dias fechados (até ontem)
+        through = through or (date.today() - timedelta(days=1))
+        days = 0
+        while True:
+            chunk = self._apply_next_chunk(through)
+            if chunk is None:
+                break
+            days += (chunk[1] - chunk[0]).days + 1
+
+        invalidate_coverage_cache()
+        return days
+
+    def _apply_next_chunk(self, through: date) -> Optional[tuple]:
+        """Aplicar o próximo bloco de dias e avançar o estado, numa transação"""
+        # Outro refresh simultâneo somaria os mesmos dias duas vezes
+        self._lock()
+        state = self.db.execute(text("""
+            SELECT covered_from, refreshed_through
+            FROM rollup_refresh_state
+            WHERE rollup_name = :name
+        """), {'name': SUMMARY_NAME}).fetchone()
+
+        if state:
+            covered_from, from_day = state[0], state[1] + timedelta(days=1)
+        else:
+            covered_from = from_day = self.db.execute(
+                text("SELECT MIN(created_at)::date FROM sales")
+            ).scalar()
+
+        if from_day is None or from_day > through:
+            self.db.rollback()
+            return None
+
+        to_day = min(from_day + timedelta(days=settings.ROLLUP_REFRESH_CHUNK_DAYS - 1), through)
+        params = {'from_day': from_day, 'to_day_exclusive': to_day + timedelta(days=1)}
+        customers = self.db.execute(text(SUMMARY_UPSERT), params).rowcount
+        self.db.execute(text(MONTHS_UPSERT), params)
+
+        self.db.execute(text("""
+            INSERT INTO rollup_refresh_state (rollup_name, covered_from, refreshed_through, refreshed_at)
+            VALUES (:name, :covered_from, :refreshed_through, CURRENT_TIMESTAMP)
+            ON CONFLICT (rollup_name) DO UPDATE SET
+                refreshed_through = EXCLUDED.refreshed_through,
+                refreshed_at = EXCLUDED.refreshed_at
+        """), {'name': SUMMARY_NAME, 'covered_from': covered_from, 'refreshed_through': to_day})
+        self.db.commit()
+
+        logger.info("Resumo de clientes: %s → %s (%s clientes × loja)", from_day, to_day, customers)
+        return from_day, to_day
+
+    def _lock(self):
+        self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': SUMMARY_NAME})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh incremental do resumo de clientes')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Apagar o resumo e agregar todo o histórico de novo')
+    parser.add_argument('--through', default=None,
+                        help='Último dia a agregar (YYYY-MM-DD, padrão: ontem)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manager = CustomerSummaryManager(db)
+        through = parse_date(args.through)
+        days = manager.rebuild(through) if args.rebuild else manager.refresh(through)
+        print(f"✓ {SUMMARY_NAME}: {days} dias aplicados")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+Exportação de resultados de analytics e de recortes de vendas.
+
+Linhas de sales/product_sales são lidas com cursor no servidor
+(`AsyncSession.stream`) em blocos de EXPORT_CHUNK_ROWS e cada bloco é
+serializado e enviado antes de buscar o próximo: a memória do processo
+não cresce com o tamanho do período exportado.
+
+Formatos: csv, ndjson e parquet (um row group por bloco; requer pyarrow).
+"""
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.responses import dumps
+from app.services.query_builder import BaseQueryBuilder, to_datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - parquet indisponível
+    pa = None
+    pq = None
+
+# Formato -> (media type, extensão)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Colunas exportadas: (nome, tipo); tipo None = inferido dos dados
+Columns = Sequence[Tuple[str, Optional[str]]]
+
+SALES_COLUMNS = [
+    ('id', 'int'),
+    ('created_at', 'timestamp'),
+    ('store_id', 'int'),
+    ('sub_brand_id', 'int'),
+    ('channel_id', 'int'),
+    ('customer_id', 'int'),
+    ('cod_sale1', 'text'),
+    ('sale_status_desc', 'text'),
+    ('total_amount_items', 'number'),
+    ('total_discount', 'number'),
+    ('total_increase', 'number'),
+    ('delivery_fee', 'number'),
+    ('service_tax_fee', 'number'),
+    ('total_amount', 'number'),
+    ('value_paid', 'number'),
+    ('production_seconds', 'int'),
+    ('delivery_seconds', 'int'),
+    ('people_quantity', 'int'),
+    ('origin', 'text'),
+]
+
+PRODUCT_SALES_COLUMNS = [
+    ('id', 'int'),
+    ('sale_id', 'int'),
+    ('sale_created_at', 'timestamp'),
+    ('store_id', 'int'),
+    ('channel_id', 'int'),
+    ('product_id', 'int'),
+    ('quantity', 'number'),
+    ('base_price', 'number'),
+    ('total_price', 'number'),
+]
+
+
+class ExportError(ValueError):
+    """Exportação inválida (formato, período ou relatório não suportado)"""
+
+
+def validate_format(fmt: str) -> str:
+    fmt = (fmt or 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Formato não suportado: {fmt} (use {', '.join(EXPORT_FORMATS)})")
+    if fmt == 'parquet' and pa is None:
+        raise ExportError("Exportação em parquet indisponível: pyarrow não está instalado")
+    return fmt
+
+
+def validate_period(filters: Dict):
+    start = to_datetime(filters['start_date'])
+    end = to_datetime(filters['end_date'])
+    if end < start:
+        raise ExportError("end_date anterior a start_date")
+    if (end - start).days + 1 > settings.EXPORT_MAX_DAYS:
+        raise ExportError(f"Período máximo de exportação: {settings.EXPORT_MAX_DAYS} dias")
+
+
+def filename(name: str, filters: Dict, fmt: str) -> str:
+    return f"{name}_{filters['start_date']}_{filters['end_date']}.{EXPORT_FORMATS[fmt][1]}"
+
+
+class ExportQueryBuilder(BaseQueryBuilder):
+    """Linhas brutas (vendas COMPLETED do período, como no dashboard)
+
+    Cada exportação abre a própria sessão (`session_factory`), que vive
+    exatamente enquanto a resposta é enviada.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def sales_query(self, filters: Dict) -> Tuple[str, Dict]:
+        conditions, params = self._build_base_conditions(filters)
+        select = ",\n                ".join(f"s.{name}" for name, _ in SALES_COLUMNS)
+        query = f"""
+            SELECT
+                {select}
+            FROM sales s
+            WHERE {" AND ".join(conditions)}
+            ORDER BY s.created_at, s.id
+        """
+        return query, params
+
+    def product_sales_query(self, filters: Dict) -> Tuple[str, Dict]:
+        conditions, params = self._build_base_conditions(filters)
+        conditions.extend(self._child_period_conditions('ps', params))
+        query = f"""
+            SELECT
+                ps.id,
+                ps.sale_id,
+                ps.sale_created_at,
+                s.store_id,
+                s.channel_id,
+                ps.product_id,
+                ps.quantity,
+                ps.base_price,
+                ps.total_price
+            FROM sales s
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+            WHERE {" AND ".join(conditions)}
+            ORDER BY ps.sale_created_at, ps.sale_id, ps.id
+        """
+        return query, params
+
+    async def stream(self, query: str, params: Dict, columns: Columns, fmt: str) -> AsyncIterator[bytes]:
+        """Executar a query com cursor no servidor e emitir o arquivo bloco a bloco"""
+        writer = WRITERS[fmt](columns)
+        async with self.session_factory() as db:
+            await db.execute(text(f"SET LOCAL statement_timeout = {int(settings.EXPORT_STATEMENT_TIMEOUT_MS)}"))
+            result = await db.stream(self._statement(query, params), params)
+            yield writer.header()
+            async for rows in result.partitions(settings.EXPORT_CHUNK_ROWS):
+                chunk = writer.write(rows)
+                if chunk:
+                    yield chunk
+        yield writer.close()
+
+
+class CsvWriter:
+    def __init__(self, columns: Columns):
+        self.columns = columns
+
+    def header(self) -> bytes:
+        return self._render([[name for name, _ in self.columns]]) if self.columns else b''
+
+    def write(self, rows: Iterable[Sequence]) -> bytes:
+        return self._render(rows)
+
+    def close(self) -> bytes:
+        return b''
+
+    def _render(self, rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(
+            [_csv_value(value) for value in row] for row in rows
+        )
+        return buffer.getvalue().encode('utf-8')
+
+
+class NdjsonWriter:
+    def __init__(self, columns: Columns):
+        self.names = [name for name, _ in columns]
+
+    def header(self) -> bytes:
+        return b''
+
+    def write(self, rows: Iterable[Sequence]) -> bytes:
+        return b''.join(dumps(dict(zip(self.names, row))) + b'\n' for row in rows)
+
+    def close(self) -> bytes:
+        return b''
+
+
+class _ChunkSink:
+    """Arquivo "de escrita" para o pyarrow: acumula bytes até serem drenados"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+class ParquetWriter:
+    ARROW_TYPES = {
+        'int': lambda: pa.int64(),
+        'number': lambda: pa.float64(),
+        'text': lambda: pa.string(),
+        'timestamp': lambda: pa.timestamp('us'),
+        'date': lambda: pa.date32(),
+    }
+
+    def __init__(self, columns: Columns):
+        self.columns = columns
+        self.sink = _ChunkSink()
+        self.writer = None
+
+    def header(self) -> bytes:
+        return b''
+
+    def write(self, rows: Iterable[Sequence]) -> bytes:
+        rows = list(rows)
+        if not rows:
+            return b''
+        arrays = []
+        for i, (_, kind) in enumerate(self.columns):
+            values = [_plain_value(row[i]) for row in rows]
+            arrays.append(pa.array(values, type=self.ARROW_TYPES[kind]() if kind else None))
+        batch = pa.RecordBatch.from_arrays(arrays, names=[name for name, _ in self.columns])
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.sink, batch.schema, compression='snappy')
+        self.writer.write_batch(batch)
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        if self.writer is None:
+            # Nenhuma linha: arquivo válido só com o schema
+            schema = pa.schema([
+                (name, self.ARROW_TYPES[kind]() if kind else pa.string())
+                for name, kind in self.columns
+            ])
+            self.writer = pq.ParquetWriter(self.sink, schema)
+        self.writer.close()
+        return self.sink.drain()
+
+
+WRITERS = {'csv': CsvWriter, 'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+async def stream_items(items: List[Dict], fmt: str) -> AsyncIterator[bytes]:
+    """Resultado agregado (lista de dicts, já em memória) no formato pedido"""
+    columns = [(name, None) for name in (items[0] if items else {})]
+    writer = WRITERS[fmt](columns)
+    yield writer.header()
+    for start in range(0, len(items), settings.EXPORT_CHUNK_ROWS):
+        chunk = items[start:start + settings.EXPORT_CHUNK_ROWS]
+        yield writer.write([[item.get(name) for name, _ in columns] for item in chunk])
+    yield writer.close()
+
+
+def _plain_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
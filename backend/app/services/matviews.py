@@ -0,0 +1,273 @@
+"""
+Materialized views dia × loja × produto e dia × loja × canal.
+
+Complementam os rollups (app.services.rollups): os rollups só guardam dias
+fechados, então qualquer período que inclua hoje cai nas tabelas brutas.
+As views cobrem os últimos MATVIEW_HISTORY_DAYS dias *incluindo hoje* até
+o instante do último refresh, e o QueryBuilder as usa quando cobrem o
+período pedido:
+
+- período que termina antes do dia do refresh: dados completos;
+- período que termina hoje, no dia do refresh: dados até o refresh,
+  aceitos se o refresh tiver no máximo MATVIEW_MAX_STALENESS_SECONDS; a
+  defasagem vai na resposta (`data_freshness`). Períodos que incluem hoje
+  têm TTL curto e ETag versionado pelo refresh das views;
+- período fechado que termina no dia do refresh (refresh de um dia que já
+  acabou): o último dia está incompleto e iria para o cache longo dos
+  períodos fechados, então a query vai para sales.
+
+O refresh usa REFRESH MATERIALIZED VIEW CONCURRENTLY (leituras não são
+bloqueadas) e é disparado por um agendador em cada worker; um advisory
+lock e a idade do último refresh garantem um único refresh por intervalo.
+O estado fica em `rollup_refresh_state`, junto dos rollups (a cobertura
+passa a considerar as views sem mudanças). Na marca d'água HTTP o refresh
+das views só conta para períodos que incluem hoje.
+
+Uso (dentro de backend/):
+    python -m app.services.matviews              # criar (se preciso) e atualizar
+    python -m app.services.matviews --recreate   # recriar (ex.: mudou MATVIEW_HISTORY_DAYS)
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.rollups import STATE_TABLE_DDL, invalidate_coverage_cache, rollup_day_range
+
+logger = logging.getLogger(__name__)
+
+MATVIEWS = {
+    # top produtos, com ou sem recorte de loja
+    'mv_daily_store_product_sales': {
+        'query': """
+        SELECT
+            DATE(s.created_at) AS day, s.store_id, ps.product_id,
+            SUM(ps.quantity) AS quantity, SUM(ps.total_price) AS revenue
+        FROM sales s
+        JOIN product_sales ps ON s.id = ps.sale_id AND s.created_at = ps.sale_created_at
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at >= CURRENT_DATE - {history_days}
+          AND ps.sale_created_at >= CURRENT_DATE - {history_days}
+        GROUP BY DATE(s.created_at), s.store_id, ps.product_id
+        """,
+        # Índice único: requisito do REFRESH ... CONCURRENTLY
+        'key': ('day', 'store_id', 'product_id'),
+    },
+    # performance por canal
+    'mv_daily_store_channel_sales': {
+        'query': """
+        SELECT
+            DATE(s.created_at) AS day, s.store_id, s.channel_id,
+            SUM(s.total_amount) AS revenue, COUNT(*) AS orders
+        FROM sales s
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at >= CURRENT_DATE - {history_days}
+        GROUP BY DATE(s.created_at), s.store_id, s.channel_id
+        """,
+        'key': ('day', 'store_id', 'channel_id'),
+    },
+}
+
+
+def matview_covers(coverage: Dict[str, tuple], filters: Dict, name: str) -> bool:
+    """Verificar se a view responde ao filtro (dias inteiros, dentro da cobertura e do limite de defasagem)"""
+    if not settings.MATVIEWS_ENABLED or name not in coverage:
+        return False
+    day_range = rollup_day_range(filters)
+    if day_range is None:
+        return False
+
+    first_day, last_day = day_range
+    covered_from, refreshed_through, refreshed_at = coverage[name]
+    if first_day < covered_from or last_day > refreshed_through:
+        return False
+    if last_day == refreshed_through:
+        # Dia do refresh: parcial, aceito só se for hoje e com refresh recente
+        return (
+            last_day >= date.today()
+            and _age_seconds(refreshed_at) <= settings.MATVIEW_MAX_STALENESS_SECONDS
+        )
+    return True
+
+
+def data_freshness(source: str, coverage: Dict[str, tuple], filters: Dict) -> Dict:
+    """Fonte que respondeu a query e defasagem dos dados em relação às vendas
+
+    Rollups (dias fechados) e views consultadas só em dias anteriores ao
+    refresh estão completos: defasagem zero.
+    """
+    if source not in coverage:
+        return {'source': source, 'refreshed_at': None, 'staleness_seconds': 0}
+
+    _, refreshed_through, refreshed_at = coverage[source]
+    staleness = 0
+    day_range = rollup_day_range(filters)
+    if source in MATVIEWS and day_range and day_range[1] >= refreshed_through:
+        staleness = round(_age_seconds(refreshed_at))
+    return {
+        'source': source,
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None,
+        'staleness_seconds': staleness
+    }
+
+
+def _age_seconds(refreshed_at: Optional[datetime]) -> float:
+    if refreshed_at is None:
+        return float('inf')
+    return (datetime.now() - refreshed_at).total_seconds()
+
+
+class MatviewManager:
+    def __init__(self, db):
+        self.db = db
+
+    def ensure_views(self, recreate: bool = False):
+        """Criar views (sem dados), índices únicos e tabela de estado (idempotente)"""
+        # Vários workers podem chegar aqui ao mesmo tempo
+        self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext('matviews_ddl'))"))
+        self.db.execute(text(STATE_TABLE_DDL))
+        for name, view in MATVIEWS.items():
+            if recreate:
+                self.db.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {name}"))
+                self.db.execute(text("DELETE FROM rollup_refresh_state WHERE rollup_name = :name"), {'name': name})
+            query = view['query'].format(history_days=int(settings.MATVIEW_HISTORY_DAYS))
+            self.db.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query} WITH NO DATA"))
+            self.db.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(view['key'])})"
+            ))
+        self.db.commit()
+
+    def refresh(self, names: Optional[List[str]] = None,
+                min_age_seconds: float = 0) -> Dict[str, Optional[float]]:
+        """Atualizar as views; retorna a duração (s) de cada uma, ou None se pulada
+
+        Pula a view se outro processo a está atualizando ou se o último
+        refresh tem menos de `min_age_seconds`.
+        """
+        self.ensure_views()
+        refreshed = {}
+        for name in names or MATVIEWS:
+            refreshed[name] = self._refresh_view(name, min_age_seconds)
+        invalidate_coverage_cache()
+        return refreshed
+
+    def _refresh_view(self, name: str, min_age_seconds: float) -> Optional[float]:
+        locked = self.db.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {'name': name}
+        ).scalar()
+        age = self.db.execute(text("""
+            SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - refreshed_at)
+            FROM rollup_refresh_state
+            WHERE rollup_name = :name
+        """), {'name': name}).scalar()
+        if not locked or (age is not None and age < min_age_seconds):
+            self.db.rollback()
+            return None
+
+        populated = self.db.execute(
+            text("SELECT relispopulated FROM pg_class WHERE relname = :name"), {'name': name}
+        ).scalar()
+        # Instante do snapshot: o mesmo da transação do REFRESH
+        refresh_day, refreshed_at = self.db.execute(text("SELECT CURRENT_DATE, LOCALTIMESTAMP")).one()
+
+        start = time.perf_counter()
+        # CONCURRENTLY exige a view já populada: o primeiro refresh é normal
+        self.db.execute(text(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY' if populated else ''} {name}"))
+        covered_from = self.db.execute(text(f"SELECT MIN(day) FROM {name}")).scalar() or refresh_day
+
+        self.db.execute(text("""
+            INSERT INTO rollup_refresh_state (rollup_name, covered_from, refreshed_through, refreshed_at)
+            VALUES (:name, :covered_from, :refreshed_through, :refreshed_at)
+            ON CONFLICT (rollup_name) DO UPDATE SET
+                covered_from = EXCLUDED.covered_from,
+                refreshed_through = EXCLUDED.refreshed_through,
+                refreshed_at = EXCLUDED.refreshed_at
+        """), {
+            'name': name, 'covered_from': covered_from,
+            'refreshed_through': refresh_day, 'refreshed_at': refreshed_at
+        })
+        self.db.commit()
+
+        seconds = time.perf_counter() - start
+        logger.info("View %s atualizada em %.1fs (%s → %s)", name, seconds, covered_from, refresh_day)
+        return seconds
+
+
+def refresh_matviews(min_age_seconds: float = 0) -> Dict[str, Optional[float]]:
+    """Refresh em uma sessão própria no primário (bloqueante)"""
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return MatviewManager(db).refresh(min_age_seconds=min_age_seconds)
+    finally:
+        db.close()
+
+
+class MatviewScheduler:
+    """Refresh periódico em segundo plano (uma task por worker)"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval_seconds > 0 and settings.MATVIEWS_ENABLED and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        from app.services.watermark import invalidate_watermark
+
+        while True:
+            try:
+                # Metade do intervalo: outro worker que acabou de atualizar faz este pular
+                refreshed = await asyncio.to_thread(refresh_matviews, self.interval_seconds / 2)
+                if any(seconds is not None for seconds in refreshed.values()):
+                    invalidate_watermark()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha no refresh das materialized views")
+            await asyncio.sleep(self.interval_seconds)
+
+
+matview_scheduler = MatviewScheduler(settings.MATVIEW_REFRESH_INTERVAL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialized views de analytics')
+    parser.add_argument('--recreate', action='store_true',
+                        help='Recriar as views (ex.: após mudar MATVIEW_HISTORY_DAYS)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        manager = MatviewManager(db)
+        manager.ensure_views(recreate=args.recreate)
+        for name, seconds in manager.refresh().items():
+            status = f"{seconds:.1f}s" if seconds is not None else "pulada (refresh em andamento)"
+            print(f"✓ {name}: {status}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
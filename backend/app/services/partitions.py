@@ -0,0 +1,159 @@
+"""
+Partições mensais de sales e das tabelas filhas (ver database-schema.sql).
+
+- cria partições futuras (inserts fora de qualquer partição falham);
+- desanexa (DETACH) meses mais antigos que a retenção configurada.
+  Os rollups diários continuam guardando o histórico agregado.
+
+Partições desanexadas (sem --drop) viram tabelas avulsas: perdem as
+foreign keys para as tabelas particionadas (sales, product_sales, ...),
+senão o DETACH do mês correspondente da tabela referenciada falharia.
+Os dados continuam lá para consulta ou arquivamento.
+
+Uso (dentro de backend/):
+    python -m app.services.partitions                       # criar próximos meses
+    python -m app.services.partitions --retention-months 24 # e desanexar os antigos
+    python -m app.services.partitions --retention-months 24 --drop
+"""
+import argparse
+import logging
+import re
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ordem de DETACH: filhas antes das tabelas que elas referenciam
+PARTITIONED_TABLES = [
+    'item_item_product_sales',
+    'item_product_sales',
+    'product_sales',
+    'delivery_addresses',
+    'delivery_sales',
+    'payments',
+    'coupon_sales',
+    'sales',
+]
+
+# Foreign keys da tabela desanexada que apontam para tabelas particionadas
+PARTITION_FKS_SQL = """
+SELECT conname
+FROM pg_constraint
+WHERE conrelid = CAST(:table AS regclass)
+  AND contype = 'f'
+  AND CAST(confrelid AS regclass)::text = ANY(:parents)
+"""
+
+PARTITION_NAME = re.compile(r'^(?P<parent>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$')
+
+PARTITIONS_SQL = """
+SELECT child.relname
+FROM pg_inherits i
+JOIN pg_class parent ON parent.oid = i.inhparent
+JOIN pg_class child ON child.oid = i.inhrelid
+WHERE parent.relname = :parent
+ORDER BY child.relname
+"""
+
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return date(int(match.group('year')), int(match.group('month')), 1)
+
+
+class PartitionManager:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def ensure_future(self, months_ahead: int = None, from_day: Optional[date] = None,
+                      to_day: Optional[date] = None) -> int:
+        """Criar partições do mês de `from_day` até `months_ahead` meses após `to_day` (padrão: hoje)"""
+        months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        first_month = (from_day or date.today()).replace(day=1)
+        last_month = add_months((to_day or date.today()).replace(day=1), months_ahead)
+
+        with self.engine.begin() as conn:
+            created = conn.execute(
+                text("SELECT create_monthly_partitions(:from_day, :to_day)"),
+                {'from_day': first_month, 'to_day': last_month}
+            ).scalar()
+        logger.info("Partições %s → %s: %s criadas", first_month, last_month, created)
+        return created
+
+    def list_partitions(self) -> Dict[str, List[str]]:
+        with self.engine.connect() as conn:
+            return {
+                table: [row[0] for row in conn.execute(text(PARTITIONS_SQL), {'parent': table})]
+                for table in PARTITIONED_TABLES
+            }
+
+    def detach_older_than(self, retention_months: int, drop: bool = False) -> List[str]:
+        """Desanexar (e opcionalmente remover) meses anteriores à retenção"""
+        cutoff = add_months(date.today().replace(day=1), -retention_months)
+        detached = []
+
+        partitions = self.list_partitions()
+        # CONCURRENTLY não roda dentro de transação
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in PARTITIONED_TABLES:
+                for name in partitions[table]:
+                    month = partition_month(name)
+                    if month is None or month >= cutoff:
+                        continue
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY"))
+                    if drop:
+                        conn.execute(text(f"DROP TABLE {name}"))
+                    else:
+                        self._drop_partition_fks(conn, name)
+                    logger.info("Partição %s %s", name, "removida" if drop else "desanexada")
+                    detached.append(name)
+        return detached
+
+    def _drop_partition_fks(self, conn, name: str):
+        """Tabela avulsa: sem FKs para as particionadas (antes do DETACH da referenciada)"""
+        constraints = conn.execute(
+            text(PARTITION_FKS_SQL), {'table': name, 'parents': PARTITIONED_TABLES}
+        ).scalars().all()
+        for constraint in constraints:
+            conn.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manutenção das partições mensais de sales')
+    parser.add_argument('--ahead', type=int, default=None,
+                        help='Meses futuros a criar (padrão: PARTITION_MONTHS_AHEAD)')
+    parser.add_argument('--from', dest='from_day', default=None,
+                        help='Criar partições a partir deste dia (YYYY-MM-DD)')
+    parser.add_argument('--retention-months', type=int, default=settings.PARTITION_RETENTION_MONTHS,
+                        help='Desanexar meses mais antigos que isto (0 = manter tudo)')
+    parser.add_argument('--drop', action='store_true',
+                        help='Remover as partições desanexadas')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import engine
+
+    manager = PartitionManager(engine)
+    from_day = date.fromisoformat(args.from_day) if args.from_day else None
+    created = manager.ensure_future(args.ahead, from_day)
+    print(f"✓ {created} partições criadas")
+
+    if args.retention_months:
+        detached = manager.detach_older_than(args.retention_months, drop=args.drop)
+        print(f"✓ {len(detached)} partições {'removidas' if args.drop else 'desanexadas'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,161 @@
-from sqlalchemy import text
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from sqlalchemy import bindparam, text
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
 import logging
+import re
+import time
+
+from app.core.config import settings
+from app.core.metrics import QUERY_DURATION, QUERY_ROWS, SLOW_QUERIES
+from app.services.matviews import data_freshness, matview_covers
+from app.services.rollups import (
+    closed_day_filters, get_rollup_coverage, get_rollup_coverage_async, rollup_day_range,
+    rollup_tail_day, rollups_cover
+)
+from app.services.sketches import HLL_RELATIVE_ERROR, hll_estimate_sql
 
 logger = logging.getLogger(__name__)
 
-class QueryBuilder:
-    def __init__(self, db):
-        self.db = db
+# Seções do dashboard (chaves de AnalyticsResponse), na ordem da resposta
+DASHBOARD_SECTIONS = ('overview', 'sales_trends', 'top_products', 'channel_performance', 'hourly_sales')
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS) "
+
+# Guarda de custo: só queries que leem sales diretamente (não os rollups)
+COST_EXPLAIN_PREFIX = "EXPLAIN (FORMAT JSON) "
+READS_SALES = re.compile(r'\bFROM sales s\b')
+
+# KPIs sem ler sales: faturamento/pedidos do rollup de canais + clientes únicos do sketch HLL
+KPI_ROLLUPS = ['daily_store_channel_sales', 'daily_store_customer_hll']
+
+# Seções calculadas no mesmo GROUPING SETS
+GROUPED_SECTIONS = ('sales_trends', 'hourly_sales', 'channel_performance')
+
+
+def to_datetime(value) -> datetime:
+    """Converter filtro de data (str ISO, date ou datetime) em datetime"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
+
+
+def end_exclusive(value) -> datetime:
+    """Limite superior aberto para end_date: o dia informado entra inteiro
+
+    `created_at < dia seguinte` (em vez de `<= meia-noite`) mantém o
+    predicado sargável e não descarta o último dia do período.
+    """
+    end = to_datetime(value)
+    if end.time() == datetime.min.time():
+        return end + timedelta(days=1)
+    return end + timedelta(microseconds=1)
+
+
+class QueryTooExpensive(ValueError):
+    """Query recusada pela guarda de custo (leitura estimada de sales acima do limite)"""
+
+
+def sales_scan_rows(plan) -> float:
+    """Linhas de sales (e partições) que o plano estima ler"""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    if isinstance(plan, list):
+        return sum(sales_scan_rows(node) for node in plan)
+    node = plan.get('Plan', plan)
+    relation = node.get('Relation Name', '')
+    rows = node.get('Plan Rows', 0) if relation == 'sales' or relation.startswith('sales_p') else 0
+    return rows + sum(sales_scan_rows(child) for child in node.get('Plans', []))
+
+
+def describe_params(params: Dict) -> Dict:
+    """Parâmetros da query em forma legível para log (datas ISO, listas resumidas)"""
+    described = {}
+    for name, value in params.items():
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        elif isinstance(value, (list, tuple)):
+            value = list(value) if len(value) <= 10 else f"{len(value)} valores"
+        described[name] = value
+    return described
+
+
+class BaseQueryBuilder:
+    """SQL e parsing das queries de analytics, independentes do modo de execução"""
     
-    def get_kpi_overview(self, filters: Dict) -> Dict:
-        """Query para KPIs principais do dashboard"""
+    def _build_base_conditions(self, filters: Dict) -> Tuple[List[str], Dict]:
+        """Condições padrão (status, período e lojas) sobre a tabela sales"""
         base_conditions = ["s.sale_status_desc = 'COMPLETED'"]
         params = {}
         
-        # Filtros de data
         if filters.get('start_date'):
             base_conditions.append("s.created_at >= :start_date")
-            params['start_date'] = filters['start_date']
+            params['start_date'] = to_datetime(filters['start_date'])
         
         if filters.get('end_date'):
-            base_conditions.append("s.created_at <= :end_date")
-            params['end_date'] = filters['end_date']
+            base_conditions.append("s.created_at < :end_date")
+            params['end_date'] = end_exclusive(filters['end_date'])
         
-        # Filtros de loja
         if filters.get('store_ids'):
             base_conditions.append("s.store_id IN :store_ids")
             params['store_ids'] = tuple(filters['store_ids'])
         
+        return base_conditions, params
+    
+    def _child_period_conditions(self, alias: str, params: Dict,
+                                 start_param: str = 'start_date') -> List[str]:
+        """Período repetido em sale_created_at da tabela filha
+
+        As filhas são particionadas pela data da venda; sem o recorte
+        explícito o planner varreria todas as partições delas no join.
+        """
+        conditions = []
+        if start_param in params:
+            conditions.append(f"{alias}.sale_created_at >= :{start_param}")
+        if 'end_date' in params:
+            conditions.append(f"{alias}.sale_created_at < :end_date")
+        return conditions
+    
+    def _build_rollup_conditions(self, filters: Dict, alias: str = 'r') -> Tuple[List[str], Dict]:
+        """Condições sobre as tabelas de rollup (alias r), em dias inteiros"""
+        first_day, last_day = rollup_day_range(filters)
+        conditions = [f"{alias}.day >= :rollup_start_day", f"{alias}.day <= :rollup_end_day"]
+        params = {'rollup_start_day': first_day, 'rollup_end_day': last_day}
+        
+        if filters.get('store_ids'):
+            conditions.append(f"{alias}.store_id IN :store_ids")
+            params['store_ids'] = tuple(filters['store_ids'])
+        
+        return conditions, params
+    
+    def _period_expressions(self, period: str, column: str) -> Tuple[str, str]:
+        """Expressões de agrupamento e de rótulo para o período (day, week, month)"""
+        if period == 'day':
+            return f"DATE({column})", f"DATE({column})"
+        elif period == 'week':
+            label = f"TO_CHAR({column}, 'YYYY-WW')"
+        else:  # month
+            label = f"TO_CHAR({column}, 'YYYY-MM')"
+        return label, label
+    
+    def _kpi_overview_query(self, filters: Dict, coverage: Dict, exact: bool = False) -> Tuple[str, Dict]:
+        """Query para KPIs principais do dashboard
+        
+        Com os rollups cobrindo os dias fechados do período (e sem `exact`),
+        só a cauda ainda não agregada (tipicamente hoje) é lida de sales:
+        clientes únicos vêm da combinação dos sketches HLL com os
+        registradores das vendas da cauda.
+        """
+        if not exact:
+            tail_day = rollup_tail_day(coverage, filters, KPI_ROLLUPS)
+            closed_filters = closed_day_filters(filters, tail_day)
+            if rollups_cover(coverage, closed_filters, KPI_ROLLUPS):
+                return self._kpi_overview_rollup_query(filters, closed_filters, tail_day)
+        
+        base_conditions, params = self._build_base_conditions(filters)
         where_clause = " AND ".join(base_conditions)
         
         query = f"""
@@ -45,67 +173,107 @@ class QueryBuilder:
             END as avg_ticket,
             
             -- Clientes únicos
-            COUNT(DISTINCT s.customer_id) as unique_customers
+            COUNT(DISTINCT s.customer_id) as unique_customers,
+            'exact' as unique_customers_method
             
         FROM sales s
         WHERE {where_clause}
         """
         
-        result = self.db.execute(text(query), params).fetchone()
+        return query, params
+    
+    def _kpi_overview_rollup_query(self, filters: Dict, closed_filters: Dict,
+                                   tail_day: Optional[date]) -> Tuple[str, Dict]:
+        """KPIs dos rollups nos dias fechados, somados aos da cauda lida de sales (UNION ALL)"""
+        conditions, params = self._build_rollup_conditions(closed_filters)
+        sketch_conditions, _ = self._build_rollup_conditions(closed_filters, alias='h')
+        sources = [f"""
+                SELECT SUM(r.revenue) AS revenue, SUM(r.orders) AS orders
+                FROM daily_store_channel_sales r
+                WHERE {" AND ".join(conditions)}"""]
+        tail_customers = None
+        if tail_day is not None:
+            tail_conditions, tail_params = self._build_base_conditions(dict(filters, start_date=tail_day.isoformat()))
+            params.update(tail_params)
+            tail_where = " AND ".join(tail_conditions)
+            sources.append(f"""
+                SELECT SUM(s.total_amount), COUNT(*)
+                FROM sales s
+                WHERE {tail_where}""")
+            tail_customers = f"SELECT s.customer_id FROM sales s WHERE {tail_where}"
+        union_clause = "\n                UNION ALL".join(sources)
         
-        return {
+        query = f"""
+            SELECT 
+                COALESCE(SUM(k.revenue), 0) as total_revenue,
+                COALESCE(SUM(k.orders), 0) as total_orders,
+                COALESCE(SUM(k.revenue) / NULLIF(SUM(k.orders), 0), 0) as avg_ticket,
+                {hll_estimate_sql(" AND ".join(sketch_conditions), tail_customers)} as unique_customers,
+                'sketch' as unique_customers_method
+            FROM ({union_clause}
+            ) k
+            """
+        return query, params
+    
+    def _parse_kpi_overview(self, results) -> Dict:
+        result = results[0]
+        
+        overview = {
             'total_revenue': float(result[0]) if result[0] else 0,
             'total_orders': result[1] or 0,
             'avg_ticket': float(result[2]) if result[2] else 0,
             'unique_customers': result[3] or 0
         }
+        overview.update(self._unique_customers_method(result[4]))
+        return overview
     
-    def get_sales_trends(self, filters: Dict, period: str = 'day') -> List[Dict]:
+    def _unique_customers_method(self, method: str) -> Dict:
+        """Exato (COUNT DISTINCT) ou estimado pelo sketch, com o erro padrão relativo"""
+        approximate = method == 'sketch'
+        return {
+            'unique_customers_approximate': approximate,
+            'unique_customers_error': HLL_RELATIVE_ERROR if approximate else None
+        }
+    
+    def _sales_trends_query(self, filters: Dict, period: str, coverage: Dict) -> Tuple[str, Dict]:
         """Tendências de vendas por período"""
-        base_conditions = ["s.sale_status_desc = 'COMPLETED'"]
-        params = {}
-        
-        if filters.get('start_date'):
-            base_conditions.append("s.created_at >= :start_date")
-            params['start_date'] = filters['start_date']
-        
-        if filters.get('end_date'):
-            base_conditions.append("s.created_at <= :end_date")
-            params['end_date'] = filters['end_date']
-        
-        if filters.get('store_ids'):
-            base_conditions.append("s.store_id IN :store_ids")
-            params['store_ids'] = tuple(filters['store_ids'])
-        
-        where_clause = " AND ".join(base_conditions)
-        
-        if period == 'day':
-            group_by = "DATE(s.created_at)"
-            date_format = "DATE(s.created_at)"
-        elif period == 'week':
-            group_by = "EXTRACT(YEAR FROM s.created_at), EXTRACT(WEEK FROM s.created_at)"
-            date_format = "TO_CHAR(s.created_at, 'YYYY-WW')"
-        else:  # month
-            group_by = "EXTRACT(YEAR FROM s.created_at), EXTRACT(MONTH FROM s.created_at)"
-            date_format = "TO_CHAR(s.created_at, 'YYYY-MM')"
-        
-        query = f"""
-        SELECT 
-            {date_format} as period,
-            SUM(s.total_amount) as revenue,
-            COUNT(*) as orders,
-            AVG(s.total_amount) as avg_ticket
-        FROM sales s
-        WHERE {where_clause}
-        GROUP BY {group_by}
-        ORDER BY period
-        """
-        
-        results = self.db.execute(text(query), params).fetchall()
+        if rollups_cover(coverage, filters, ['daily_store_channel_sales']):
+            conditions, params = self._build_rollup_conditions(filters)
+            group_by, date_format = self._period_expressions(period, 'r.day')
+            
+            query = f"""
+            SELECT 
+                {date_format} as period,
+                SUM(r.revenue) as revenue,
+                SUM(r.orders) as orders,
+                SUM(r.revenue) / NULLIF(SUM(r.orders), 0) as avg_ticket
+            FROM daily_store_channel_sales r
+            WHERE {" AND ".join(conditions)}
+            GROUP BY {group_by}
+            ORDER BY period
+            """
+        else:
+            base_conditions, params = self._build_base_conditions(filters)
+            group_by, date_format = self._period_expressions(period, 's.created_at')
+            
+            query = f"""
+            SELECT 
+                {date_format} as period,
+                SUM(s.total_amount) as revenue,
+                COUNT(*) as orders,
+                AVG(s.total_amount) as avg_ticket
+            FROM sales s
+            WHERE {" AND ".join(base_conditions)}
+            GROUP BY {group_by}
+            ORDER BY period
+            """
         
+        return query, params
+    
+    def _parse_sales_trends(self, results) -> List[Dict]:
         return [
             {
-                'period': row[0],
+                'date': row[0],
                 'revenue': float(row[1]) if row[1] else 0,
                 'orders': row[2],
                 'avg_ticket': float(row[3]) if row[3] else 0
@@ -113,44 +281,62 @@ class QueryBuilder:
             for row in results
         ]
     
-    def get_top_products(self, filters: Dict, limit: int = 10) -> List[Dict]:
+    def _top_products_source(self, filters: Dict, coverage: Dict) -> str:
+        """Rollup dia × produto (sem loja), view dia × loja × produto ou sales"""
+        if not filters.get('store_ids') and rollups_cover(coverage, filters, ['daily_product_sales']):
+            return 'daily_product_sales'
+        if matview_covers(coverage, filters, 'mv_daily_store_product_sales'):
+            return 'mv_daily_store_product_sales'
+        return 'sales'
+    
+    def _top_products_query(self, filters: Dict, limit: int, coverage: Dict) -> Tuple[str, Dict]:
         """Produtos mais vendidos"""
-        base_conditions = ["s.sale_status_desc = 'COMPLETED'", "ps.product_id IS NOT NULL"]
-        params = {'limit': limit}
-        
-        if filters.get('start_date'):
-            base_conditions.append("s.created_at >= :start_date")
-            params['start_date'] = filters['start_date']
-        
-        if filters.get('end_date'):
-            base_conditions.append("s.created_at <= :end_date")
-            params['end_date'] = filters['end_date']
-        
-        if filters.get('store_ids'):
-            base_conditions.append("s.store_id IN :store_ids")
-            params['store_ids'] = tuple(filters['store_ids'])
-        
-        where_clause = " AND ".join(base_conditions)
-        
-        query = f"""
-        SELECT 
-            p.id as product_id,
-            p.name as product_name,
-            c.name as category_name,
-            SUM(ps.quantity) as quantity_sold,
-            SUM(ps.total_price) as revenue
-        FROM sales s
-        JOIN product_sales ps ON s.id = ps.sale_id
-        JOIN products p ON ps.product_id = p.id
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE {where_clause}
-        GROUP BY p.id, p.name, c.name
-        ORDER BY quantity_sold DESC
-        LIMIT :limit
-        """
-        
-        results = self.db.execute(text(query), params).fetchall()
+        source = self._top_products_source(filters, coverage)
+        if source != 'sales':
+            conditions, params = self._build_rollup_conditions(filters)
+            params['limit'] = limit
+            
+            query = f"""
+            SELECT 
+                p.id as product_id,
+                p.name as product_name,
+                c.name as category_name,
+                SUM(r.quantity) as quantity_sold,
+                SUM(r.revenue) as revenue
+            FROM {source} r
+            JOIN products p ON r.product_id = p.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY p.id, p.name, c.name
+            ORDER BY quantity_sold DESC
+            LIMIT :limit
+            """
+        else:
+            base_conditions, params = self._build_base_conditions(filters)
+            base_conditions.extend(self._child_period_conditions('ps', params))
+            base_conditions.append("ps.product_id IS NOT NULL")
+            params['limit'] = limit
+            
+            query = f"""
+            SELECT 
+                p.id as product_id,
+                p.name as product_name,
+                c.name as category_name,
+                SUM(ps.quantity) as quantity_sold,
+                SUM(ps.total_price) as revenue
+            FROM sales s
+            JOIN product_sales ps ON s.id = ps.sale_id AND s.created_at = ps.sale_created_at
+            JOIN products p ON ps.product_id = p.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE {" AND ".join(base_conditions)}
+            GROUP BY p.id, p.name, c.name
+            ORDER BY quantity_sold DESC
+            LIMIT :limit
+            """
         
+        return query, params
+    
+    def _parse_top_products(self, results) -> List[Dict]:
         return [
             {
                 'product_id': row[0],
@@ -162,44 +348,56 @@ class QueryBuilder:
             for row in results
         ]
     
-    def get_channel_performance(self, filters: Dict) -> List[Dict]:
+    def _channel_performance_source(self, filters: Dict, coverage: Dict) -> str:
+        """Rollup dia × loja × canal (dias fechados), view de mesmo grão ou sales"""
+        if rollups_cover(coverage, filters, ['daily_store_channel_sales']):
+            return 'daily_store_channel_sales'
+        if matview_covers(coverage, filters, 'mv_daily_store_channel_sales'):
+            return 'mv_daily_store_channel_sales'
+        return 'sales'
+    
+    def _channel_performance_query(self, filters: Dict, coverage: Dict) -> Tuple[str, Dict]:
         """Performance por canal de venda"""
-        base_conditions = ["s.sale_status_desc = 'COMPLETED'"]
-        params = {}
-        
-        if filters.get('start_date'):
-            base_conditions.append("s.created_at >= :start_date")
-            params['start_date'] = filters['start_date']
-        
-        if filters.get('end_date'):
-            base_conditions.append("s.created_at <= :end_date")
-            params['end_date'] = filters['end_date']
-        
-        if filters.get('store_ids'):
-            base_conditions.append("s.store_id IN :store_ids")
-            params['store_ids'] = tuple(filters['store_ids'])
-        
-        where_clause = " AND ".join(base_conditions)
-        
-        query = f"""
-        SELECT 
-            c.id as channel_id,
-            c.name as channel_name,
-            SUM(s.total_amount) as revenue,
-            COUNT(*) as orders,
-            CASE 
-                WHEN COUNT(*) > 0 THEN SUM(s.total_amount) / COUNT(*)
-                ELSE 0 
-            END as avg_ticket
-        FROM sales s
-        JOIN channels c ON s.channel_id = c.id
-        WHERE {where_clause}
-        GROUP BY c.id, c.name
-        ORDER BY revenue DESC
-        """
-        
-        results = self.db.execute(text(query), params).fetchall()
+        source = self._channel_performance_source(filters, coverage)
+        if source != 'sales':
+            conditions, params = self._build_rollup_conditions(filters)
+            
+            query = f"""
+            SELECT 
+                c.id as channel_id,
+                c.name as channel_name,
+                SUM(r.revenue) as revenue,
+                SUM(r.orders) as orders,
+                SUM(r.revenue) / NULLIF(SUM(r.orders), 0) as avg_ticket
+            FROM {source} r
+            JOIN channels c ON r.channel_id = c.id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY c.id, c.name
+            ORDER BY revenue DESC
+            """
+        else:
+            base_conditions, params = self._build_base_conditions(filters)
+            
+            query = f"""
+            SELECT 
+                c.id as channel_id,
+                c.name as channel_name,
+                SUM(s.total_amount) as revenue,
+                COUNT(*) as orders,
+                CASE 
+                    WHEN COUNT(*) > 0 THEN SUM(s.total_amount) / COUNT(*)
+                    ELSE 0 
+                END as avg_ticket
+            FROM sales s
+            JOIN channels c ON s.channel_id = c.id
+            WHERE {" AND ".join(base_conditions)}
+            GROUP BY c.id, c.name
+            ORDER BY revenue DESC
+            """
         
+        return query, params
+    
+    def _parse_channel_performance(self, results) -> List[Dict]:
         return [
             {
                 'channel_id': row[0],
@@ -211,48 +409,773 @@ class QueryBuilder:
             for row in results
         ]
     
-    def get_hourly_sales(self, filters: Dict) -> List[Dict]:
+    def _hourly_sales_query(self, filters: Dict, coverage: Dict) -> Tuple[str, Dict]:
         """Vendas por hora do dia"""
-        base_conditions = ["s.sale_status_desc = 'COMPLETED'"]
-        params = {}
+        if rollups_cover(coverage, filters, ['daily_store_hour_sales']):
+            conditions, params = self._build_rollup_conditions(filters)
+            
+            query = f"""
+            SELECT 
+                r.hour as hour,
+                SUM(r.revenue) as revenue,
+                SUM(r.orders) as orders,
+                SUM(r.revenue) / NULLIF(SUM(r.orders), 0) as avg_ticket
+            FROM daily_store_hour_sales r
+            WHERE {" AND ".join(conditions)}
+            GROUP BY r.hour
+            ORDER BY hour
+            """
+        else:
+            base_conditions, params = self._build_base_conditions(filters)
+            
+            query = f"""
+            SELECT 
+                EXTRACT(HOUR FROM s.created_at) as hour,
+                SUM(s.total_amount) as revenue,
+                COUNT(*) as orders,
+                CASE 
+                    WHEN COUNT(*) > 0 THEN SUM(s.total_amount) / COUNT(*)
+                    ELSE 0 
+                END as avg_ticket
+            FROM sales s
+            WHERE {" AND ".join(base_conditions)}
+            GROUP BY EXTRACT(HOUR FROM s.created_at)
+            ORDER BY hour
+            """
         
-        if filters.get('start_date'):
-            base_conditions.append("s.created_at >= :start_date")
-            params['start_date'] = filters['start_date']
+        return query, params
+    
+    def _parse_hourly_sales(self, results) -> List[Dict]:
+        return [
+            {
+                'hour': int(row[0]),
+                'revenue': float(row[1]) if row[1] else 0,
+                'orders': row[2],
+                'avg_ticket': float(row[3]) if row[3] else 0
+            }
+            for row in results
+        ]
+    
+    def _dashboard_query(self, filters: Dict, prev_filters: Dict, limit: int,
+                         coverage: Dict, sections=DASHBOARD_SECTIONS,
+                         exact: bool = False) -> Tuple[str, Dict]:
+        """Dashboard completo em uma única query
         
-        if filters.get('end_date'):
-            base_conditions.append("s.created_at <= :end_date")
-            params['end_date'] = filters['end_date']
+        O recorte de vendas (período atual + período anterior, lojas) é lido
+        uma única vez num CTE materializado; KPIs, tendência diária, canais,
+        horários e top produtos são agregados a partir dele e devolvidos
+        juntos via UNION ALL, com a coluna `section` identificando cada bloco.
+        Seções servidas pelos rollups leem deles os dias fechados e do CTE
+        só a cauda ainda não agregada (tipicamente hoje). Seções fora de
+        `sections` não entram na query; se todas vêm de rollups, views ou
+        sketches sem cauda, o CTE de vendas também não.
+        """
+        plan = self._dashboard_plan(filters, coverage, sections)
+        tail_day = plan['tail_day']
         
-        if filters.get('store_ids'):
-            base_conditions.append("s.store_id IN :store_ids")
-            params['store_ids'] = tuple(filters['store_ids'])
+        # Período atual + anterior: KPIs dos rollups/sketches se cobrirem os dias fechados dos dois
+        overview_filters = dict(plan['closed_filters'], start_date=prev_filters['start_date'])
+        overview_from_rollups = (
+            'overview' in sections and not exact
+            and rollups_cover(coverage, overview_filters, KPI_ROLLUPS)
+        )
+        
+        # Início do CTE: o período anterior só é lido para a comparação dos
+        # KPIs; seções dos rollups leem só a cauda
+        window_starts = []
+        if 'overview' in sections and not overview_from_rollups:
+            window_starts.append(to_datetime(prev_filters['start_date']))
+        if (plan['grouped'] and not plan['grouped_from_rollups']) or plan.get('products_source') == 'sales':
+            window_starts.append(to_datetime(filters['start_date']))
+        from_rollups = overview_from_rollups or plan['grouped_from_rollups'] or plan.get('products_split')
+        if tail_day is not None and from_rollups:
+            window_starts.append(to_datetime(tail_day))
+        reads_base = bool(window_starts)
+        
+        window_filters = dict(filters, start_date=min(window_starts)) if reads_base else dict(filters)
+        base_conditions, params = self._build_base_conditions(window_filters)
+        params['current_start_date'] = to_datetime(filters['start_date'])
         
         where_clause = " AND ".join(base_conditions)
         
-        query = f"""
-        SELECT 
-            EXTRACT(HOUR FROM s.created_at) as hour,
-            SUM(s.total_amount) as revenue,
-            COUNT(*) as orders,
-            CASE 
-                WHEN COUNT(*) > 0 THEN SUM(s.total_amount) / COUNT(*)
-                ELSE 0 
-            END as avg_ticket
-        FROM sales s
-        WHERE {where_clause}
-        GROUP BY EXTRACT(HOUR FROM s.created_at)
-        ORDER BY hour
+        rollup_where = ""
+        if from_rollups or plan.get('products_source', 'sales') != 'sales':
+            rollup_conditions, rollup_params = self._build_rollup_conditions(filters)
+            rollup_where = " AND ".join(rollup_conditions)
+            params.update(rollup_params)
+        tail = tail_day is not None and bool(from_rollups)
+        if tail:
+            # Dias a partir de tail_day: só do CTE, nunca de um rollup mais adiantado que os outros
+            params['tail_day'] = tail_day
+            params['tail_start'] = to_datetime(tail_day)
+        
+        parts = []
+        if overview_from_rollups:
+            params['overview_start_day'] = rollup_day_range(overview_filters)[0]
+            parts.append(self._dashboard_overview_rollup_sql(filters, tail))
+        elif 'overview' in sections:
+            parts.append(self._dashboard_overview_sql())
+        
+        if plan['grouped_from_rollups']:
+            parts.append(self._dashboard_grouped_rollup_sql(rollup_where, plan['grouped'], tail))
+        elif plan['grouped']:
+            parts.append(self._dashboard_grouped_sql(plan['grouped']))
+        
+        if 'top_products' in sections:
+            params['limit'] = limit
+            source = plan['products_source']
+            if source != 'sales':
+                parts.append(self._dashboard_products_rollup_sql(source, rollup_where, plan['products_split']))
+            else:
+                product_conditions = self._child_period_conditions('ps', params, 'current_start_date')
+                parts.append(self._dashboard_products_sql(" AND ".join(product_conditions)))
+        
+        union_clause = "\n        UNION ALL\n".join(parts)
+        
+        if reads_base:
+            with_clause = f"""
+        WITH base AS MATERIALIZED (
+            SELECT
+                s.id, s.created_at, s.total_amount, s.customer_id, s.channel_id,
+                CASE
+                    WHEN s.created_at >= :current_start_date THEN 'current'
+                    ELSE 'previous'
+                END AS slice
+            FROM sales s
+            WHERE {where_clause}
+        )"""
+        else:
+            with_clause = ""
+            for name in ('start_date', 'end_date', 'current_start_date'):
+                params.pop(name)
+        
+        # ORDER BY posicional: section, day, hour, quantity DESC, revenue DESC
+        query = f"""{with_clause}
+        {union_clause}
+        ORDER BY 1, 2, 3, 9 DESC, 7 DESC
         """
         
-        results = self.db.execute(text(query), params).fetchall()
+        return query, params
+    
+    def _dashboard_plan(self, filters: Dict, coverage: Dict, sections) -> Dict:
+        """Fonte das seções do dashboard que podem vir de rollups (ou views) na query única
         
-        return [
-            {
-                'hour': int(row[0]),
-                'revenue': float(row[1]) if row[1] else 0,
-                'orders': row[2],
-                'avg_ticket': float(row[3]) if row[3] else 0
+        `tail_day` é o primeiro dia que os rollups das seções pedidas ainda
+        não agregaram: as seções servidas por eles leem os dias fechados
+        (`closed_filters`) dos rollups e a cauda do CTE. Tendência, canais
+        e horários saem dos rollups todos ou nenhum.
+        """
+        grouped = [section for section in GROUPED_SECTIONS if section in sections]
+        grouped_rollups = []
+        if 'sales_trends' in grouped or 'channel_performance' in grouped:
+            grouped_rollups.append('daily_store_channel_sales')
+        if 'hourly_sales' in grouped:
+            grouped_rollups.append('daily_store_hour_sales')
+        products_from_rollup = 'top_products' in sections and not filters.get('store_ids')
+        
+        rollup_names = list(grouped_rollups)
+        if 'overview' in sections:
+            rollup_names.extend(KPI_ROLLUPS)
+        if products_from_rollup:
+            rollup_names.append('daily_product_sales')
+        tail_day = rollup_tail_day(coverage, filters, rollup_names)
+        closed_filters = closed_day_filters(filters, tail_day)
+        
+        plan = {
+            'tail_day': tail_day,
+            'closed_filters': closed_filters,
+            'grouped': grouped,
+            'grouped_from_rollups': bool(grouped) and rollups_cover(coverage, closed_filters, grouped_rollups),
+        }
+        if 'top_products' in sections:
+            plan['products_split'] = False
+            if products_from_rollup and rollups_cover(coverage, closed_filters, ['daily_product_sales']):
+                plan['products_source'] = 'daily_product_sales'
+                plan['products_split'] = tail_day is not None
+            else:
+                plan['products_source'] = self._top_products_source(filters, coverage)
+        return plan
+    
+    def _dashboard_freshness(self, filters: Dict, coverage: Dict, sections,
+                             concurrent: bool = False) -> Dict:
+        """Fonte e defasagem das seções do dashboard que podem vir de rollups ou views
+        
+        Na query única os canais vêm do rollup ou de sales; no modo
+        concorrente a seção roda sozinha e pode usar a view. Um rollup
+        completado pela cauda lida de sales não tem defasagem.
+        """
+        freshness = {}
+        if concurrent:
+            for section in ('top_products', 'channel_performance'):
+                if section in sections:
+                    freshness[section] = self._freshness(section, filters, coverage)
+            return freshness
+        
+        plan = self._dashboard_plan(filters, coverage, sections)
+        if 'top_products' in sections:
+            freshness['top_products'] = data_freshness(plan['products_source'], coverage, filters)
+        if 'channel_performance' in sections:
+            source = 'daily_store_channel_sales' if plan['grouped_from_rollups'] else 'sales'
+            freshness['channel_performance'] = data_freshness(source, coverage, filters)
+        return freshness
+    
+    def _parse_dashboard(self, results) -> Dict:
+        """Separar as linhas da query do dashboard por seção"""
+        dashboard = {
+            'overview': None,
+            'previous_overview': None,
+            'sales_trends': [],
+            'top_products': [],
+            'channel_performance': [],
+            'hourly_sales': []
+        }
+        
+        for row in results:
+            section = row[0]
+            revenue = float(row[6]) if row[6] else 0
+            
+            if section == 'overview':
+                orders = row[7] or 0
+                prev_orders = row[11] or 0
+                dashboard['overview'] = {
+                    'total_revenue': revenue,
+                    'total_orders': orders,
+                    'avg_ticket': revenue / orders if orders > 0 else 0,
+                    'unique_customers': row[9] or 0
+                }
+                # Coluna `category` da linha de overview: método dos clientes únicos
+                dashboard['overview'].update(self._unique_customers_method(row[5]))
+                dashboard['previous_overview'] = {
+                    'total_revenue': float(row[10]) if row[10] else 0,
+                    'total_orders': prev_orders
+                }
+            elif section == 'sales_trends':
+                dashboard['sales_trends'].append({
+                    'date': row[1],
+                    'revenue': revenue,
+                    'orders': row[7],
+                    'avg_ticket': revenue / row[7] if row[7] else 0
+                })
+            elif section == 'hourly_sales':
+                dashboard['hourly_sales'].append({
+                    'hour': int(row[2]),
+                    'revenue': revenue,
+                    'orders': row[7],
+                    'avg_ticket': revenue / row[7] if row[7] else 0
+                })
+            elif section == 'channel_performance':
+                dashboard['channel_performance'].append({
+                    'channel_id': row[3],
+                    'channel_name': row[4],
+                    'revenue': revenue,
+                    'orders': row[7],
+                    'avg_ticket': revenue / row[7] if row[7] else 0
+                })
+            elif section == 'top_products':
+                dashboard['top_products'].append({
+                    'product_id': row[3],
+                    'product_name': row[4],
+                    'category': row[5],
+                    'quantity_sold': float(row[8]) if row[8] else 0,
+                    'revenue': revenue
+                })
+        
+        return dashboard
+    
+    def _dashboard_overview_sql(self) -> str:
+        """KPIs do período atual e do período anterior (comparação)"""
+        return """
+        SELECT
+            'overview' AS section,
+            NULL::date AS day, NULL::int AS hour, NULL::int AS key_id,
+            NULL::text AS label, 'exact'::text AS category,
+            COALESCE(SUM(b.total_amount) FILTER (WHERE b.slice = 'current'), 0)::numeric AS revenue,
+            COUNT(*) FILTER (WHERE b.slice = 'current') AS orders,
+            NULL::float AS quantity,
+            COUNT(DISTINCT b.customer_id) FILTER (WHERE b.slice = 'current') AS unique_customers,
+            COALESCE(SUM(b.total_amount) FILTER (WHERE b.slice = 'previous'), 0)::numeric AS prev_revenue,
+            COUNT(*) FILTER (WHERE b.slice = 'previous') AS prev_orders
+        FROM base b
+        """
+    
+    def _dashboard_overview_rollup_sql(self, filters: Dict, tail: bool = False) -> str:
+        """KPIs do período atual e do anterior a partir dos rollups; clientes únicos pelos sketches
+        
+        Com `tail`, os dias a partir de :tail_day vêm do CTE e os clientes
+        deles entram no sketch como registradores calculados na hora.
+        """
+        store_condition = "AND r.store_id IN :store_ids" if filters.get('store_ids') else ""
+        tail_condition = "AND r.day < :tail_day" if tail else ""
+        sketch_conditions, _ = self._build_rollup_conditions(filters, alias='h')
+        sources = [f"""
+            SELECT
+                SUM(r.revenue) FILTER (WHERE r.day >= :rollup_start_day) AS revenue,
+                SUM(r.orders) FILTER (WHERE r.day >= :rollup_start_day) AS orders,
+                SUM(r.revenue) FILTER (WHERE r.day < :rollup_start_day) AS prev_revenue,
+                SUM(r.orders) FILTER (WHERE r.day < :rollup_start_day) AS prev_orders
+            FROM daily_store_channel_sales r
+            WHERE r.day >= :overview_start_day AND r.day <= :rollup_end_day {store_condition} {tail_condition}"""]
+        tail_customers = None
+        if tail:
+            sketch_conditions.append("h.day < :tail_day")
+            sources.append("""
+            SELECT
+                SUM(b.total_amount) FILTER (WHERE b.slice = 'current'),
+                COUNT(*) FILTER (WHERE b.slice = 'current'),
+                SUM(b.total_amount) FILTER (WHERE b.slice = 'previous'),
+                COUNT(*) FILTER (WHERE b.slice = 'previous')
+            FROM base b
+            WHERE b.created_at >= :tail_start""")
+            tail_customers = "SELECT b.customer_id FROM base b WHERE b.slice = 'current' AND b.created_at >= :tail_start"
+        union_clause = "\n            UNION ALL".join(sources)
+        return f"""
+        SELECT
+            'overview' AS section,
+            NULL::date AS day, NULL::int AS hour, NULL::int AS key_id,
+            NULL::text AS label, 'sketch'::text AS category,
+            COALESCE(SUM(k.revenue), 0)::numeric AS revenue,
+            COALESCE(SUM(k.orders), 0)::bigint AS orders,
+            NULL::float AS quantity,
+            {hll_estimate_sql(" AND ".join(sketch_conditions), tail_customers)} AS unique_customers,
+            COALESCE(SUM(k.prev_revenue), 0)::numeric AS prev_revenue,
+            COALESCE(SUM(k.prev_orders), 0)::bigint AS prev_orders
+        FROM ({union_clause}
+        ) k
+        """
+    
+    def _dashboard_grouped_sql(self, grouped=GROUPED_SECTIONS, tail: bool = False) -> str:
+        """Tendência diária, vendas por hora e canais em uma só passada sobre o CTE (ou só a cauda)"""
+        tail_condition = "AND b.created_at >= :tail_start" if tail else ""
+        grouping_sets = {
+            'sales_trends': "(DATE(b.created_at))",
+            'hourly_sales': "(EXTRACT(HOUR FROM b.created_at))",
+            'channel_performance': "(b.channel_id)",
+        }
+        sets_clause = ",\n                ".join(grouping_sets[section] for section in grouped)
+        return f"""
+        SELECT
+            CASE
+                WHEN g.day IS NOT NULL THEN 'sales_trends'
+                WHEN g.hour IS NOT NULL THEN 'hourly_sales'
+                ELSE 'channel_performance'
+            END,
+            g.day, g.hour, g.channel_id, ch.name, NULL::text,
+            g.revenue, g.orders, NULL::float, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM (
+            SELECT
+                DATE(b.created_at) AS day,
+                EXTRACT(HOUR FROM b.created_at)::int AS hour,
+                b.channel_id,
+                SUM(b.total_amount)::numeric AS revenue,
+                COUNT(*) AS orders
+            FROM base b
+            WHERE b.slice = 'current' {tail_condition}
+            GROUP BY GROUPING SETS (
+                {sets_clause}
+            )
+        ) g
+        LEFT JOIN channels ch ON g.channel_id = ch.id
+        """
+    
+    def _dashboard_grouped_rollup_sql(self, rollup_where: str, grouped=GROUPED_SECTIONS,
+                                      tail: bool = False) -> str:
+        """Tendência diária, canais e vendas por hora a partir dos rollups
+        
+        Com `tail`, as linhas dos rollups (até :tail_day) e as da cauda no
+        CTE são somadas por seção e chave.
+        """
+        if tail:
+            rollup_where += " AND r.day < :tail_day"
+        parts = []
+        channel_sets = [
+            grouping_set for section, grouping_set in
+            (('sales_trends', "(r.day)"), ('channel_performance', "(r.channel_id)"))
+            if section in grouped
+        ]
+        if channel_sets:
+            parts.append(f"""
+        SELECT
+            CASE WHEN g.day IS NOT NULL THEN 'sales_trends' ELSE 'channel_performance' END,
+            g.day, NULL::int, g.channel_id, ch.name, NULL::text,
+            g.revenue, g.orders, NULL::float, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM (
+            SELECT
+                r.day,
+                r.channel_id,
+                SUM(r.revenue)::numeric AS revenue,
+                SUM(r.orders)::bigint AS orders
+            FROM daily_store_channel_sales r
+            WHERE {rollup_where}
+            GROUP BY GROUPING SETS ({", ".join(channel_sets)})
+        ) g
+        LEFT JOIN channels ch ON g.channel_id = ch.id
+        """)
+        if 'hourly_sales' in grouped:
+            parts.append(f"""
+        SELECT
+            'hourly_sales', NULL::date, r.hour::int, NULL::int, NULL::text, NULL::text,
+            SUM(r.revenue)::numeric, SUM(r.orders)::bigint, NULL::float, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM daily_store_hour_sales r
+        WHERE {rollup_where}
+        GROUP BY r.hour
+        """)
+        if not tail:
+            return "UNION ALL".join(parts)
+        
+        parts.append(self._dashboard_grouped_sql(grouped, tail=True))
+        return f"""
+        SELECT
+            m.section, m.day, m.hour, m.key_id, m.label, NULL::text,
+            SUM(m.revenue)::numeric, SUM(m.orders)::bigint, NULL::float, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM ({"UNION ALL".join(parts)}) m (
+            section, day, hour, key_id, label, category,
+            revenue, orders, quantity, unique_customers, prev_revenue, prev_orders
+        )
+        GROUP BY m.section, m.day, m.hour, m.key_id, m.label
+        """
+    
+    def _dashboard_products_sql(self, product_where: str) -> str:
+        """Produtos mais vendidos a partir do CTE"""
+        return f"""
+        SELECT
+            'top_products', NULL::date, NULL::int, tp.product_id, tp.product_name, tp.category_name,
+            tp.revenue::numeric, NULL::bigint, tp.quantity_sold, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM (
+            SELECT
+                p.id as product_id,
+                p.name as product_name,
+                c.name as category_name,
+                SUM(ps.quantity) as quantity_sold,
+                SUM(ps.total_price) as revenue
+            FROM base b
+            JOIN product_sales ps ON b.id = ps.sale_id AND b.created_at = ps.sale_created_at
+            JOIN products p ON ps.product_id = p.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE b.slice = 'current' AND {product_where}
+            GROUP BY p.id, p.name, c.name
+            ORDER BY quantity_sold DESC
+            LIMIT :limit
+        ) tp
+        """
+    
+    def _dashboard_products_rollup_sql(self, source: str, rollup_where: str, tail: bool = False) -> str:
+        """Produtos mais vendidos a partir do rollup dia × produto ou da view dia × loja × produto
+        
+        Com `tail`, as vendas da cauda no CTE somam-se às linhas do rollup
+        antes do ranking.
+        """
+        rows = f"""(
+                SELECT r.product_id, r.quantity, r.revenue
+                FROM {source} r
+                WHERE {rollup_where}
+            )"""
+        if tail:
+            rows = f"""(
+                SELECT r.product_id, r.quantity, r.revenue
+                FROM {source} r
+                WHERE {rollup_where} AND r.day < :tail_day
+                UNION ALL
+                SELECT ps.product_id, ps.quantity, ps.total_price
+                FROM base b
+                JOIN product_sales ps ON b.id = ps.sale_id AND b.created_at = ps.sale_created_at
+                WHERE b.slice = 'current' AND b.created_at >= :tail_start
+                  AND ps.sale_created_at >= :tail_start AND ps.sale_created_at < :end_date
+                  AND ps.product_id IS NOT NULL
+            )"""
+        return f"""
+        SELECT
+            'top_products', NULL::date, NULL::int, tp.product_id, tp.product_name, tp.category_name,
+            tp.revenue::numeric, NULL::bigint, tp.quantity_sold, NULL::bigint, NULL::numeric, NULL::bigint
+        FROM (
+            SELECT
+                p.id as product_id,
+                p.name as product_name,
+                c.name as category_name,
+                SUM(r.quantity) as quantity_sold,
+                SUM(r.revenue) as revenue
+            FROM {rows} r
+            JOIN products p ON r.product_id = p.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            GROUP BY p.id, p.name, c.name
+            ORDER BY quantity_sold DESC
+            LIMIT :limit
+        ) tp
+        """
+    
+    def _freshness(self, section: str, filters: Dict, coverage: Dict) -> Dict:
+        if section == 'top_products':
+            source = self._top_products_source(filters, coverage)
+        elif section == 'channel_performance':
+            source = self._channel_performance_source(filters, coverage)
+        else:
+            raise ValueError(f"Seção sem fonte pré-agregada: {section}")
+        return data_freshness(source, coverage, filters)
+    
+    def _observe(self, name: str, params: Dict, seconds: float, row_count: int) -> bool:
+        """Registrar duração e linhas da query; True se ela passou do limite de query lenta"""
+        QUERY_DURATION.labels(query=name).observe(seconds)
+        QUERY_ROWS.labels(query=name).observe(row_count)
+        
+        elapsed_ms = seconds * 1000
+        if elapsed_ms < settings.SLOW_QUERY_THRESHOLD_MS:
+            logger.debug("Query %s: %.1f ms, %d linhas", name, elapsed_ms, row_count)
+            return False
+        
+        SLOW_QUERIES.labels(query=name).inc()
+        logger.warning(
+            "Query lenta %s: %.1f ms, %d linhas, parâmetros=%s",
+            name, elapsed_ms, row_count, describe_params(params)
+        )
+        return True
+    
+    def _check_cost(self, name: str, params: Dict, plan):
+        estimated = sales_scan_rows(plan)
+        if estimated > settings.QUERY_MAX_SCAN_ROWS:
+            logger.warning(
+                "Query %s recusada: ~%.0f linhas de sales estimadas, parâmetros=%s",
+                name, estimated, describe_params(params)
+            )
+            raise QueryTooExpensive(
+                f"Consulta muito ampla: ~{estimated:,.0f} vendas a ler "
+                f"(limite {settings.QUERY_MAX_SCAN_ROWS:,}). Reduza o período ou filtre por loja"
+            )
+    
+    def _guards_cost(self, query: str, params: Dict) -> bool:
+        """EXPLAIN prévio só para queries que leem sales numa janela longa (ou sem limites)
+
+        Janelas de até QUERY_COST_CHECK_MIN_DAYS dias ficam bem abaixo do
+        limite e não pagam um segundo planejamento.
+        """
+        if settings.QUERY_MAX_SCAN_ROWS <= 0 or not READS_SALES.search(query):
+            return False
+        start, end = params.get('start_date'), params.get('end_date')
+        if start is None or end is None:
+            return True
+        return end - start > timedelta(days=settings.QUERY_COST_CHECK_MIN_DAYS)
+    
+    def _timeout_statement(self):
+        return text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+    
+    def _log_plan(self, name: str, plan_rows):
+        logger.warning("Plano da query lenta %s:\n%s", name, "\n".join(row[0] for row in plan_rows))
+    
+    def _statement(self, query: str, params: Dict):
+        """text() com listas expandidas (IN :store_ids, IN :f0...) para qualquer driver"""
+        statement = text(query)
+        expanding = [
+            bindparam(name, expanding=True)
+            for name, value in params.items() if isinstance(value, (list, tuple))
+        ]
+        if expanding:
+            statement = statement.bindparams(*expanding)
+        return statement
+
+
+class QueryBuilder(BaseQueryBuilder):
+    """Execução síncrona (Session)"""
+    
+    def __init__(self, db, statement_timeout_ms: Optional[int] = None):
+        self.db = db
+        self.statement_timeout_ms = statement_timeout_ms
+    
+    def _execute(self, query: str, params: Dict, name: str = 'query'):
+        if self.statement_timeout_ms:
+            self.db.execute(self._timeout_statement())
+        if self._guards_cost(query, params):
+            plan = self.db.execute(self._statement(COST_EXPLAIN_PREFIX + query, params), params).scalar()
+            self._check_cost(name, params, plan)
+        
+        start = time.perf_counter()
+        rows = self.db.execute(self._statement(query, params), params).fetchall()
+        slow = self._observe(name, params, time.perf_counter() - start, len(rows))
+        if slow and settings.SLOW_QUERY_EXPLAIN:
+            self._explain(query, params, name)
+        return rows
+    
+    def _explain(self, query: str, params: Dict, name: str):
+        # Savepoint: uma falha no EXPLAIN não invalida a transação do request
+        try:
+            with self.db.begin_nested():
+                plan = self.db.execute(self._statement(EXPLAIN_PREFIX + query, params), params).fetchall()
+            self._log_plan(name, plan)
+        except Exception:
+            logger.exception("Falha no EXPLAIN da query %s", name)
+    
+    def _coverage(self) -> Dict:
+        return get_rollup_coverage(self.db)
+    
+    def get_coverage(self) -> Dict:
+        """Cobertura de rollups e views: passar a mesma às queries e a get_freshness"""
+        return self._coverage()
+    
+    def get_freshness(self, section: str, filters: Dict, coverage: Optional[Dict] = None) -> Dict:
+        """Fonte (rollup, view ou sales) e defasagem dos dados da seção"""
+        return self._freshness(section, filters, self._coverage() if coverage is None else coverage)
+    
+    def get_kpi_overview(self, filters: Dict, exact: bool = False) -> Dict:
+        """Query para KPIs principais do dashboard"""
+        query, params = self._kpi_overview_query(filters, self._coverage(), exact)
+        return self._parse_kpi_overview(self._execute(query, params, 'kpi_overview'))
+    
+    def get_sales_trends(self, filters: Dict, period: str = 'day') -> List[Dict]:
+        """Tendências de vendas por período"""
+        query, params = self._sales_trends_query(filters, period, self._coverage())
+        return self._parse_sales_trends(self._execute(query, params, 'sales_trends'))
+    
+    def get_top_products(self, filters: Dict, limit: int = 10,
+                         coverage: Optional[Dict] = None) -> List[Dict]:
+        """Produtos mais vendidos"""
+        coverage = self._coverage() if coverage is None else coverage
+        query, params = self._top_products_query(filters, limit, coverage)
+        return self._parse_top_products(self._execute(query, params, 'top_products'))
+    
+    def get_channel_performance(self, filters: Dict, coverage: Optional[Dict] = None) -> List[Dict]:
+        """Performance por canal de venda"""
+        coverage = self._coverage() if coverage is None else coverage
+        query, params = self._channel_performance_query(filters, coverage)
+        return self._parse_channel_performance(self._execute(query, params, 'channel_performance'))
+    
+    def get_hourly_sales(self, filters: Dict) -> List[Dict]:
+        """Vendas por hora do dia"""
+        query, params = self._hourly_sales_query(filters, self._coverage())
+        return self._parse_hourly_sales(self._execute(query, params, 'hourly_sales'))
+    
+    def get_dashboard(self, filters: Dict, prev_filters: Dict, limit: int = 10,
+                      sections=DASHBOARD_SECTIONS, exact: bool = False) -> Dict:
+        """Dashboard completo em uma única query, com a fonte/defasagem das seções pré-agregadas"""
+        coverage = self._coverage()
+        query, params = self._dashboard_query(filters, prev_filters, limit, coverage, sections, exact)
+        dashboard = self._parse_dashboard(self._execute(query, params, 'dashboard'))
+        dashboard['data_freshness'] = self._dashboard_freshness(filters, coverage, sections)
+        return dashboard
+
+
+class AsyncQueryBuilder(BaseQueryBuilder):
+    """Execução assíncrona (AsyncSession)
+    
+    Com `session_factory`, `get_dashboard_concurrent` executa cada seção do
+    dashboard em uma sessão (conexão) própria, em paralelo.
+    Com `statement_timeout_ms`, cada query roda com SET LOCAL statement_timeout.
+    """
+    
+    def __init__(self, db, session_factory=None, statement_timeout_ms: Optional[int] = None):
+        self.db = db
+        self.session_factory = session_factory
+        self.statement_timeout_ms = statement_timeout_ms
+    
+    async def _execute(self, query: str, params: Dict, name: str = 'query'):
+        if self.statement_timeout_ms:
+            await self.db.execute(self._timeout_statement())
+        if self._guards_cost(query, params):
+            result = await self.db.execute(self._statement(COST_EXPLAIN_PREFIX + query, params), params)
+            self._check_cost(name, params, result.scalar())
+        
+        start = time.perf_counter()
+        result = await self.db.execute(self._statement(query, params), params)
+        rows = result.fetchall()
+        slow = self._observe(name, params, time.perf_counter() - start, len(rows))
+        if slow and settings.SLOW_QUERY_EXPLAIN:
+            await self._explain(query, params, name)
+        return rows
+    
+    async def _explain(self, query: str, params: Dict, name: str):
+        # Savepoint: uma falha no EXPLAIN não invalida a transação do request
+        try:
+            async with self.db.begin_nested():
+                result = await self.db.execute(self._statement(EXPLAIN_PREFIX + query, params), params)
+                plan = result.fetchall()
+            self._log_plan(name, plan)
+        except Exception:
+            logger.exception("Falha no EXPLAIN da query %s", name)
+    
+    async def _coverage(self) -> Dict:
+        return await get_rollup_coverage_async(self.db)
+    
+    async def get_coverage(self) -> Dict:
+        """Cobertura de rollups e views: passar a mesma às queries e a get_freshness"""
+        return await self._coverage()
+    
+    async def get_freshness(self, section: str, filters: Dict, coverage: Optional[Dict] = None) -> Dict:
+        """Fonte (rollup, view ou sales) e defasagem dos dados da seção"""
+        return self._freshness(section, filters, await self._coverage() if coverage is None else coverage)
+    
+    async def get_kpi_overview(self, filters: Dict, exact: bool = False) -> Dict:
+        """Query para KPIs principais do dashboard"""
+        query, params = self._kpi_overview_query(filters, await self._coverage(), exact)
+        return self._parse_kpi_overview(await self._execute(query, params, 'kpi_overview'))
+    
+    async def get_sales_trends(self, filters: Dict, period: str = 'day') -> List[Dict]:
+        """Tendências de vendas por período"""
+        query, params = self._sales_trends_query(filters, period, await self._coverage())
+        return self._parse_sales_trends(await self._execute(query, params, 'sales_trends'))
+    
+    async def get_top_products(self, filters: Dict, limit: int = 10,
+                               coverage: Optional[Dict] = None) -> List[Dict]:
+        """Produtos mais vendidos"""
+        coverage = await self._coverage() if coverage is None else coverage
+        query, params = self._top_products_query(filters, limit, coverage)
+        return self._parse_top_products(await self._execute(query, params, 'top_products'))
+    
+    async def get_channel_performance(self, filters: Dict, coverage: Optional[Dict] = None) -> List[Dict]:
+        """Performance por canal de venda"""
+        coverage = await self._coverage() if coverage is None else coverage
+        query, params = self._channel_performance_query(filters, coverage)
+        return self._parse_channel_performance(await self._execute(query, params, 'channel_performance'))
+    
+    async def get_hourly_sales(self, filters: Dict) -> List[Dict]:
+        """Vendas por hora do dia"""
+        query, params = self._hourly_sales_query(filters, await self._coverage())
+        return self._parse_hourly_sales(await self._execute(query, params, 'hourly_sales'))
+    
+    async def get_dashboard(self, filters: Dict, prev_filters: Dict, limit: int = 10,
+                            sections=DASHBOARD_SECTIONS, exact: bool = False) -> Dict:
+        """Dashboard completo em uma única query, com a fonte/defasagem das seções pré-agregadas"""
+        coverage = await self._coverage()
+        query, params = self._dashboard_query(filters, prev_filters, limit, coverage, sections, exact)
+        dashboard = self._parse_dashboard(await self._execute(query, params, 'dashboard'))
+        dashboard['data_freshness'] = self._dashboard_freshness(filters, coverage, sections)
+        return dashboard
+    
+    async def get_dashboard_concurrent(self, filters: Dict, prev_filters: Dict, limit: int = 10,
+                                       sections=DASHBOARD_SECTIONS, exact: bool = False) -> Dict:
+        """Dashboard com as seções em paralelo, cada uma em sua própria conexão"""
+        if self.session_factory is None:
+            raise RuntimeError("get_dashboard_concurrent requer session_factory")
+        
+        # Uma só leitura da cobertura: a fonte reportada é a que as seções usaram
+        coverage = await self._coverage()
+        calls = {
+            'overview': ('get_kpi_overview', filters, exact),
+            'previous_overview': ('get_kpi_overview', prev_filters, exact),
+            'sales_trends': ('get_sales_trends', filters, 'day'),
+            'top_products': ('get_top_products', filters, limit, coverage),
+            'channel_performance': ('get_channel_performance', filters, coverage),
+            'hourly_sales': ('get_hourly_sales', filters),
+        }
+        names = [
+            name for name in calls
+            if name in sections or (name == 'previous_overview' and 'overview' in sections)
+        ]
+        results = await asyncio.gather(*(self._in_own_session(*calls[name]) for name in names))
+        
+        dashboard = {
+            'overview': None,
+            'previous_overview': None,
+            'sales_trends': [],
+            'top_products': [],
+            'channel_performance': [],
+            'hourly_sales': []
+        }
+        dashboard.update(zip(names, results))
+        if dashboard['previous_overview']:
+            dashboard['previous_overview'] = {
+                'total_revenue': dashboard['previous_overview']['total_revenue'],
+                'total_orders': dashboard['previous_overview']['total_orders']
             }
-            for row in results
-        ]
\ No newline at end of file
+        dashboard['data_freshness'] = self._dashboard_freshness(filters, coverage, sections, concurrent=True)
+        return dashboard
+    
+    async def _in_own_session(self, method: str, *args):
+        async with self.session_factory() as session:
+            builder = AsyncQueryBuilder(session, statement_timeout_ms=self.statement_timeout_ms)
+            return await getattr(builder, method)(*args)
@@ -0,0 +1,383 @@
+"""
+Tabelas de rollup diárias (pré-agregadas) sobre sales/product_sales.
+
+Cada rollup guarda uma linha por dia × chave e é atualizado de forma
+incremental: apenas os dias fechados ainda não processados são agregados.
+O estado de cada rollup fica em `rollup_refresh_state`.
+
+Uso (dentro de backend/):
+    python -m app.services.rollups            # refresh incremental
+    python -m app.services.rollups --from 2025-06-01   # reprocessar a partir de um dia
+"""
+import argparse
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.sketches import HLL_REGISTER_SQL, HLL_RHO_SQL, hll_hash_sql
+
+logger = logging.getLogger(__name__)
+
+STATE_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS rollup_refresh_state (
+    rollup_name VARCHAR(100) PRIMARY KEY,
+    covered_from DATE NOT NULL,
+    refreshed_through DATE NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+ROLLUPS = {
+    # dia × loja × canal: tendências, canais e KPIs de faturamento/pedidos
+    'daily_store_channel_sales': {
+        'ddl': """
+        CREATE TABLE IF NOT EXISTS daily_store_channel_sales (
+            day DATE NOT NULL,
+            store_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            orders INTEGER NOT NULL,
+            PRIMARY KEY (day, store_id, channel_id)
+        )
+        """,
+        'refresh': """
+        INSERT INTO daily_store_channel_sales (day, store_id, channel_id, revenue, orders)
+        SELECT
+            DATE(s.created_at), s.store_id, s.channel_id,
+            SUM(s.total_amount), COUNT(*)
+        FROM sales s
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at >= :from_day
+          AND s.created_at < :to_day_exclusive
+        GROUP BY DATE(s.created_at), s.store_id, s.channel_id
+        """
+    },
+    # dia × loja × hora: vendas por hora do dia
+    'daily_store_hour_sales': {
+        'ddl': """
+        CREATE TABLE IF NOT EXISTS daily_store_hour_sales (
+            day DATE NOT NULL,
+            store_id INTEGER NOT NULL,
+            hour SMALLINT NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            orders INTEGER NOT NULL,
+            PRIMARY KEY (day, store_id, hour)
+        )
+        """,
+        'refresh': """
+        INSERT INTO daily_store_hour_sales (day, store_id, hour, revenue, orders)
+        SELECT
+            DATE(s.created_at), s.store_id, EXTRACT(HOUR FROM s.created_at)::smallint,
+            SUM(s.total_amount), COUNT(*)
+        FROM sales s
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at >= :from_day
+          AND s.created_at < :to_day_exclusive
+        GROUP BY DATE(s.created_at), s.store_id, EXTRACT(HOUR FROM s.created_at)
+        """
+    },
+    # dia × produto: produtos mais vendidos (sem recorte por loja)
+    'daily_product_sales': {
+        'ddl': """
+        CREATE TABLE IF NOT EXISTS daily_product_sales (
+            day DATE NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity FLOAT NOT NULL,
+            revenue FLOAT NOT NULL,
+            PRIMARY KEY (day, product_id)
+        )
+        """,
+        'refresh': """
+        INSERT INTO daily_product_sales (day, product_id, quantity, revenue)
+        SELECT
+            DATE(s.created_at), ps.product_id,
+            SUM(ps.quantity), SUM(ps.total_price)
+        FROM sales s
+        JOIN product_sales ps ON s.id = ps.sale_id AND s.created_at = ps.sale_created_at
+        WHERE s.sale_status_desc = 'COMPLETED'
+          AND s.created_at >= :from_day
+          AND s.created_at < :to_day_exclusive
+          AND ps.sale_created_at >= :from_day
+          AND ps.sale_created_at < :to_day_exclusive
+        GROUP BY DATE(s.created_at), ps.product_id
+        """
+    },
+    # dia × loja: sketch HLL dos clientes (app.services.sketches), um registrador por linha
+    'daily_store_customer_hll': {
+        'ddl': """
+        CREATE TABLE IF NOT EXISTS daily_store_customer_hll (
+            day DATE NOT NULL,
+            store_id INTEGER NOT NULL,
+            register SMALLINT NOT NULL,
+            rho SMALLINT NOT NULL,
+            PRIMARY KEY (day, store_id, register)
+        )
+        """,
+        'refresh': f"""
+        INSERT INTO daily_store_customer_hll (day, store_id, register, rho)
+        SELECT day, store_id, register, MAX(rho)
+        FROM (
+            SELECT
+                DATE(s.created_at) AS day, s.store_id,
+                {HLL_REGISTER_SQL} AS register,
+                {HLL_RHO_SQL} AS rho
+            FROM sales s
+            {hll_hash_sql('s.customer_id')}
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND s.customer_id IS NOT NULL
+              AND s.created_at >= :from_day
+              AND s.created_at < :to_day_exclusive
+        ) hashed_sales
+        GROUP BY day, store_id, register
+        """
+    },
+}
+
+# Cobertura dos rollups por processo (evita consultar o estado a cada request)
+_coverage_cache = {'loaded_at': 0.0, 'coverage': {}}
+
+
+def rollup_day_range(filters: Dict) -> Optional[tuple]:
+    """Dias (inclusivos) equivalentes ao filtro, ou None se não alinhado a dias inteiros"""
+    start = _parse_day(filters.get('start_date'))
+    end = _parse_day(filters.get('end_date'))
+    if start is None or end is None or end < start:
+        return None
+    # Mesmo recorte do filtro bruto: end_date entra inteiro
+    return start, end
+
+
+COVERAGE_EXISTS_SQL = "SELECT to_regclass('rollup_refresh_state')"
+
+COVERAGE_SQL = """
+SELECT rollup_name, covered_from, refreshed_through, refreshed_at
+FROM rollup_refresh_state
+"""
+
+
+def get_rollup_coverage(db) -> Dict[str, tuple]:
+    """Período coberto por cada rollup: {nome: (covered_from, refreshed_through, refreshed_at)}"""
+    if _coverage_is_fresh():
+        return _coverage_cache['coverage']
+
+    rows = []
+    if db.execute(text(COVERAGE_EXISTS_SQL)).scalar():
+        rows = db.execute(text(COVERAGE_SQL)).fetchall()
+    return _store_coverage(rows)
+
+
+async def get_rollup_coverage_async(db) -> Dict[str, tuple]:
+    """Mesmo que get_rollup_coverage, para AsyncSession"""
+    if _coverage_is_fresh():
+        return _coverage_cache['coverage']
+
+    rows = []
+    if (await db.execute(text(COVERAGE_EXISTS_SQL))).scalar():
+        rows = (await db.execute(text(COVERAGE_SQL))).fetchall()
+    return _store_coverage(rows)
+
+
+def rollups_cover(coverage: Dict[str, tuple], filters: Dict, rollup_names: List[str]) -> bool:
+    """Verificar se os rollups respondem ao filtro (dias inteiros, período já agregado)"""
+    if not settings.ROLLUPS_ENABLED:
+        return False
+    day_range = rollup_day_range(filters)
+    if day_range is None:
+        return False
+
+    first_day, last_day = day_range
+    for name in rollup_names:
+        if name not in coverage:
+            return False
+        covered_from, refreshed_through, _ = coverage[name]
+        if first_day < covered_from or last_day > refreshed_through:
+            return False
+    return True
+
+
+def rollup_tail_day(coverage: Dict[str, tuple], filters: Dict, rollup_names: List[str]) -> Optional[date]:
+    """Primeiro dia do filtro ainda não agregado pelos rollups, ou None
+
+    Os rollups guardam só dias fechados: um período que termina hoje (o
+    padrão dos endpoints) lê dos rollups os dias até `refreshed_through` e
+    só a cauda a partir deste dia de sales.
+    """
+    day_range = rollup_day_range(filters)
+    refreshed = [coverage[name][1] for name in rollup_names if name in coverage]
+    if day_range is None or not refreshed:
+        return None
+    tail_day = min(refreshed) + timedelta(days=1)
+    return tail_day if tail_day <= day_range[1] else None
+
+
+def closed_day_filters(filters: Dict, tail_day: Optional[date]) -> Dict:
+    """Filtro restrito aos dias anteriores à cauda (o próprio filtro sem cauda)"""
+    if tail_day is None:
+        return filters
+    return dict(filters, end_date=(tail_day - timedelta(days=1)).isoformat())
+
+
+def _coverage_is_fresh() -> bool:
+    age = time.monotonic() - _coverage_cache['loaded_at']
+    return age < settings.ROLLUP_COVERAGE_TTL_SECONDS
+
+
+def _store_coverage(rows) -> Dict[str, tuple]:
+    coverage = {row[0]: (row[1], row[2], row[3]) for row in rows}
+    _coverage_cache['coverage'] = coverage
+    _coverage_cache['loaded_at'] = time.monotonic()
+    return coverage
+
+
+def invalidate_coverage_cache():
+    _coverage_cache['loaded_at'] = 0.0
+
+
+def _parse_day(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return None
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+class RollupManager:
+    def __init__(self, db):
+        self.db = db
+
+    def ensure_tables(self):
+        """Criar tabelas de rollup e de estado (idempotente)"""
+        self.db.execute(text(STATE_TABLE_DDL))
+        for rollup in ROLLUPS.values():
+            self.db.execute(text(rollup['ddl']))
+        self.db.commit()
+
+    def refresh(self, rebuild_from: Optional[date] = None,
+                through: Optional[date] = None) -> Dict[str, int]:
+        """Refresh incremental: agrega apenas os dias fechados ainda não processados"""
+        self.ensure_tables()
+
+        # Apenas dias fechados (até ontem)
+        through = through or (date.today() - timedelta(days=1))
+        first_sale_day = self.db.execute(
+            text("SELECT MIN(created_at)::date FROM sales")
+        ).scalar()
+
+        refreshed = {}
+        for name, rollup in ROLLUPS.items():
+            state = self.db.execute(text("""
+                SELECT covered_from, refreshed_through
+                FROM rollup_refresh_state
+                WHERE rollup_name = :name
+            """), {'name': name}).fetchone()
+
+            if rebuild_from:
+                from_day = rebuild_from
+            elif state:
+                from_day = state[1] + timedelta(days=1)
+            else:
+                from_day = first_sale_day
+
+            if from_day is None or from_day > through:
+                refreshed[name] = 0
+                continue
+
+            covered_from = min(state[0], from_day) if state else from_day
+            refreshed[name] = self._refresh_range(
+                name, rollup, from_day, through, covered_from, incremental=rebuild_from is None
+            )
+
+        invalidate_coverage_cache()
+        return refreshed
+
+    def _refresh_range(self, name: str, rollup: Dict, from_day: date,
+                       through: date, covered_from: date, incremental: bool = True) -> int:
+        """Reagregar [from_day, through] em blocos, um commit por bloco
+        
+        Cada bloco roda sob um advisory lock do rollup (cron/CLI e o endpoint
+        de debug podem se sobrepor). No modo incremental, o estado é relido
+        sob o lock e dias já agregados por outro refresh são pulados.
+        """
+        chunk_days = settings.ROLLUP_REFRESH_CHUNK_DAYS
+        total_rows = 0
+        chunk_start = from_day
+
+        while chunk_start <= through:
+            self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': name})
+            if incremental:
+                refreshed_through = self.db.execute(text("""
+                    SELECT refreshed_through
+                    FROM rollup_refresh_state
+                    WHERE rollup_name = :name
+                """), {'name': name}).scalar()
+                if refreshed_through is not None:
+                    chunk_start = max(chunk_start, refreshed_through + timedelta(days=1))
+                if chunk_start > through:
+                    self.db.rollback()
+                    break
+
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), through)
+            params = {
+                'from_day': chunk_start,
+                'to_day': chunk_end,
+                'to_day_exclusive': chunk_end + timedelta(days=1)
+            }
+
+            self.db.execute(
+                text(f"DELETE FROM {name} WHERE day >= :from_day AND day <= :to_day"),
+                params
+            )
+            result = self.db.execute(text(rollup['refresh']), params)
+            total_rows += result.rowcount or 0
+
+            self.db.execute(text("""
+                INSERT INTO rollup_refresh_state (rollup_name, covered_from, refreshed_through, refreshed_at)
+                VALUES (:name, :covered_from, :refreshed_through, CURRENT_TIMESTAMP)
+                ON CONFLICT (rollup_name) DO UPDATE SET
+                    covered_from = LEAST(rollup_refresh_state.covered_from, EXCLUDED.covered_from),
+                    refreshed_through = GREATEST(rollup_refresh_state.refreshed_through, EXCLUDED.refreshed_through),
+                    refreshed_at = EXCLUDED.refreshed_at
+            """), {'name': name, 'covered_from': covered_from, 'refreshed_through': chunk_end})
+            self.db.commit()
+
+            logger.info("Rollup %s: %s → %s (%s linhas)", name, chunk_start, chunk_end, result.rowcount)
+            chunk_start = chunk_end + timedelta(days=1)
+
+        return total_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh incremental das tabelas de rollup')
+    parser.add_argument('--from', dest='rebuild_from', default=None,
+                        help='Reprocessar a partir deste dia (YYYY-MM-DD)')
+    parser.add_argument('--through', default=None,
+                        help='Último dia a agregar (YYYY-MM-DD, padrão: ontem)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        result = RollupManager(db).refresh(
+            rebuild_from=_parse_day(args.rebuild_from),
+            through=_parse_day(args.through)
+        )
+        for name, rows in result.items():
+            print(f"✓ {name}: {rows:,} linhas agregadas")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
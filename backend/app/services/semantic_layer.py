@@ -0,0 +1,196 @@
+"""
+Camada semântica das queries customizadas (modo avançado).
+
+Somente os campos declarados aqui podem ser usados: cada dimensão, medida
+e filtro tem sua expressão SQL fixa e os joins de que depende. Os valores
+dos filtros são sempre passados como parâmetros.
+
+Grão da query:
+- 'sale': uma linha por venda (padrão)
+- 'product': uma linha por item vendido (product_sales)
+- 'payment': uma linha por pagamento (payments)
+Produtos e pagamentos não podem ser combinados na mesma query.
+"""
+
+# Joins sobre sales (alias s): nome -> (sql, dependências)
+RAW_JOINS = {
+    'stores': ("JOIN stores st ON st.id = s.store_id", []),
+    'channels': ("JOIN channels ch ON ch.id = s.channel_id", []),
+    'product_sales': ("JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at", []),
+    'products': ("JOIN products p ON p.id = ps.product_id", ['product_sales']),
+    'categories': ("LEFT JOIN categories cat ON cat.id = p.category_id", ['products']),
+    'payments': ("JOIN payments pay ON pay.sale_id = s.id AND pay.sale_created_at = s.created_at", []),
+    'payment_types': ("LEFT JOIN payment_types pt ON pt.id = pay.payment_type_id", ['payments']),
+}
+
+# Joins com tabelas particionadas por sale_created_at: alias que recebe o recorte de período
+PARTITIONED_JOINS = {
+    'product_sales': 'ps',
+    'payments': 'pay',
+}
+
+DIMENSIONS = {
+    'date': {'sql': "DATE(s.created_at)"},
+    'hour': {'sql': "EXTRACT(HOUR FROM s.created_at)::int"},
+    'weekday': {'sql': "EXTRACT(ISODOW FROM s.created_at)::int"},
+    'store': {'sql': "st.name", 'joins': ['stores']},
+    'channel': {'sql': "ch.name", 'joins': ['channels']},
+    'product_name': {'sql': "p.name", 'joins': ['products'], 'grain': 'product'},
+    'category': {'sql': "cat.name", 'joins': ['categories'], 'grain': 'product'},
+    'payment_type': {'sql': "pt.description", 'joins': ['payment_types'], 'grain': 'payment'},
+}
+
+# Expressões por grão: medidas ausentes num grão não podem ser usadas nele
+MEASURES = {
+    'total_sales': {'sql': {
+        'sale': "SUM(s.total_amount)",
+        'product': "SUM(ps.total_price)",
+        'payment': "SUM(pay.value)",
+    }},
+    'quantity': {'sql': {
+        'product': "SUM(ps.quantity)",
+    }, 'grain': 'product', 'joins': ['product_sales']},
+    'order_count': {'sql': {
+        'sale': "COUNT(*)",
+        'product': "COUNT(DISTINCT s.id)",
+        'payment': "COUNT(DISTINCT s.id)",
+    }},
+    'avg_ticket': {'sql': {
+        'sale': "SUM(s.total_amount) / NULLIF(COUNT(*), 0)",
+        'product': "SUM(ps.total_price) / NULLIF(COUNT(DISTINCT s.id), 0)",
+        'payment': "SUM(pay.value) / NULLIF(COUNT(DISTINCT s.id), 0)",
+    }},
+    'unique_customers': {'sql': {
+        'sale': "COUNT(DISTINCT s.customer_id)",
+        'product': "COUNT(DISTINCT s.customer_id)",
+        'payment': "COUNT(DISTINCT s.customer_id)",
+    }},
+    'avg_preparation_time': {'sql': {
+        'sale': "AVG(s.production_seconds)",
+    }},
+}
+
+# type: date | int | number | text
+FILTERS = {
+    'date': {'sql': "DATE(s.created_at)", 'type': 'date'},
+    'hour': {'sql': "EXTRACT(HOUR FROM s.created_at)::int", 'type': 'int'},
+    'weekday': {'sql': "EXTRACT(ISODOW FROM s.created_at)::int", 'type': 'int'},
+    'store': {'sql': "st.name", 'type': 'text', 'joins': ['stores']},
+    'store_id': {'sql': "s.store_id", 'type': 'int'},
+    'channel': {'sql': "ch.name", 'type': 'text', 'joins': ['channels']},
+    'price_range': {'sql': "s.total_amount", 'type': 'number'},
+    'product_name': {'sql': "p.name", 'type': 'text', 'joins': ['products'], 'grain': 'product'},
+    'category': {'sql': "cat.name", 'type': 'text', 'joins': ['categories'], 'grain': 'product'},
+    'payment_type': {'sql': "pt.description", 'type': 'text', 'joins': ['payment_types'], 'grain': 'payment'},
+}
+
+# Nomes usados pelo frontend para os mesmos filtros
+FILTER_ALIASES = {
+    'date_range': 'date',
+}
+
+# Filtros de outro grão viram EXISTS para não multiplicar as linhas da query:
+# grão -> (from, correlação, alias particionado)
+GRAIN_EXISTS = {
+    'product': (
+        "product_sales ps JOIN products p ON p.id = ps.product_id "
+        "LEFT JOIN categories cat ON cat.id = p.category_id",
+        "ps.sale_id = s.id AND ps.sale_created_at = s.created_at",
+        'ps'
+    ),
+    'payment': (
+        "payments pay LEFT JOIN payment_types pt ON pt.id = pay.payment_type_id",
+        "pay.sale_id = s.id AND pay.sale_created_at = s.created_at",
+        'pay'
+    ),
+}
+
+OPERATORS = {
+    '=': '=',
+    '!=': '<>',
+    '>': '>',
+    '<': '<',
+    '>=': '>=',
+    '<=': '<=',
+    'LIKE': 'ILIKE',
+    'IN': 'IN',
+}
+
+# Rollups que respondem queries customizadas (alias r)
+ROLLUP_SOURCES = {
+    'daily_store_channel_sales': {
+        'joins': {
+            'stores': ("JOIN stores st ON st.id = r.store_id", []),
+            'channels': ("JOIN channels ch ON ch.id = r.channel_id", []),
+        },
+        'dimensions': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'store': ("st.name", ['stores']),
+            'channel': ("ch.name", ['channels']),
+        },
+        'measures': {
+            'total_sales': "SUM(r.revenue)",
+            'order_count': "SUM(r.orders)",
+            'avg_ticket': "SUM(r.revenue) / NULLIF(SUM(r.orders), 0)",
+        },
+        'filters': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'store': ("st.name", ['stores']),
+            'store_id': ("r.store_id", []),
+            'channel': ("ch.name", ['channels']),
+        },
+        'has_store': True,
+    },
+    'daily_store_hour_sales': {
+        'joins': {
+            'stores': ("JOIN stores st ON st.id = r.store_id", []),
+        },
+        'dimensions': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'hour': ("r.hour::int", []),
+            'store': ("st.name", ['stores']),
+        },
+        'measures': {
+            'total_sales': "SUM(r.revenue)",
+            'order_count': "SUM(r.orders)",
+            'avg_ticket': "SUM(r.revenue) / NULLIF(SUM(r.orders), 0)",
+        },
+        'filters': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'hour': ("r.hour::int", []),
+            'store': ("st.name", ['stores']),
+            'store_id': ("r.store_id", []),
+        },
+        'has_store': True,
+    },
+    'daily_product_sales': {
+        'joins': {
+            'products': ("JOIN products p ON p.id = r.product_id", []),
+            'categories': ("LEFT JOIN categories cat ON cat.id = p.category_id", ['products']),
+        },
+        'dimensions': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'product_name': ("p.name", ['products']),
+            'category': ("cat.name", ['categories']),
+        },
+        'measures': {
+            'total_sales': "SUM(r.revenue)",
+            'quantity': "SUM(r.quantity)",
+        },
+        'filters': {
+            'date': ("r.day", []),
+            'weekday': ("EXTRACT(ISODOW FROM r.day)::int", []),
+            'product_name': ("p.name", ['products']),
+            'category': ("cat.name", ['categories']),
+        },
+        'has_store': False,
+    },
+}
+
+# Dimensões temporais: ordenam o resultado em ordem crescente
+TIME_DIMENSIONS = ['date', 'hour', 'weekday']
@@ -0,0 +1,146 @@
+"""
+Deduplicação de computações concorrentes idênticas (single-flight).
+
+Requests simultâneos com a mesma chave aguardam uma única computação em
+andamento e recebem o mesmo resultado, em vez de repetir a query N vezes.
+
+- dentro do worker: um Future por chave, compartilhado entre as tasks;
+- entre workers (opcional, `lock_dir`): lock de arquivo por chave. Quem
+  pega o lock calcula e grava o resultado no diretório; os demais workers
+  esperam o lock e leem o resultado gravado (válido por `result_ttl`).
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - sem flock (Windows)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_SECONDS = 0.05
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: Optional[str] = None, result_ttl: float = 5.0,
+                 lock_timeout: float = 30.0):
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self._flights: Dict[str, asyncio.Future] = {}
+        self._stats_lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.shared_from_workers = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Resultado de `compute`, executado uma única vez por chave entre os chamadores simultâneos"""
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            try:
+                value = await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                # Líder cancelado (cliente desconectou): outro chamador assume
+                if flight.cancelled():
+                    continue
+                raise
+            self._count('coalesced')
+            return copy.deepcopy(value)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self._count('leaders')
+        try:
+            value = await self._compute(key, compute)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as exc:
+            flight.set_exception(exc)
+            # Exceção já propagada ao líder; evita aviso de "never retrieved"
+            flight.exception()
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            self._flights.pop(key, None)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.lock_dir:
+            return await compute()
+
+        path = os.path.join(self.lock_dir, hashlib.sha1(key.encode()).hexdigest())
+        fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            locked = await self._acquire(fd)
+            if locked:
+                shared = self._read_result(path)
+                if shared is not None:
+                    self._count('shared_from_workers')
+                    return shared[0]
+            value = await compute()
+            if locked:
+                self._write_result(path, value)
+            return value
+        finally:
+            # Fechar o descritor libera o flock
+            os.close(fd)
+
+    async def _acquire(self, fd: int) -> bool:
+        """flock exclusivo sem bloquear o event loop; False após lock_timeout"""
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning("Single-flight: lock não obtido em %.0fs, calculando sem lock", self.lock_timeout)
+                    return False
+                await asyncio.sleep(LOCK_POLL_SECONDS)
+
+    def _read_result(self, path: str) -> Optional[tuple]:
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return None
+            with open(path, 'rb') as f:
+                return (pickle.load(f),)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _write_result(self, path: str, value: Any):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PickleError):
+            logger.exception("Single-flight: falha ao gravar resultado compartilhado")
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'shared_from_workers': self.shared_from_workers,
+                'cross_worker': self.lock_dir is not None
+            }
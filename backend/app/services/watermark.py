@@ -0,0 +1,80 @@
+"""
+Marca d'água dos dados de analytics: muda sempre que os resultados podem mudar.
+
+- `max_sale_id`: última venda carregada (períodos que incluem hoje);
+- `matviews_refreshed_at`: último refresh das materialized views (períodos
+  que incluem hoje; as views servem o dia corrente até o refresh);
+- `rollups_refreshed_at`: último refresh dos rollups e do resumo de
+  clientes (todos os períodos; os endpoints /customers leem o resumo).
+
+Views e rollups dividem `rollup_refresh_state`, mas cada marca olha só os
+seus nomes: o refresh periódico das views reagrega dias fechados que não
+mudaram e não pode trocar o ETag de períodos fechados.
+
+Usada nos validadores HTTP (ETag) e na chave do cache de resultados
+(`data_version`): o corpo servido com um ETag é sempre calculado na mesma
+versão dos dados. Fica em cache por processo por alguns segundos, então
+requests repetidos não consultam o banco.
+"""
+import time
+from typing import Dict
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.customer_summary import SUMMARY_NAME
+from app.services.matviews import MATVIEWS
+from app.services.rollups import COVERAGE_EXISTS_SQL, ROLLUPS
+
+MAX_SALE_ID_SQL = "SELECT MAX(id) FROM sales"
+
+REFRESHED_SQL = """
+SELECT
+    MAX(refreshed_at) FILTER (WHERE rollup_name = ANY(:rollups)),
+    MAX(refreshed_at) FILTER (WHERE rollup_name = ANY(:matviews))
+FROM rollup_refresh_state
+"""
+
+# Tabelas pré-agregadas de dias fechados (rollups diários e resumo de clientes)
+CLOSED_DAY_TABLES = [*ROLLUPS, SUMMARY_NAME]
+
+# Marcas que não entram no ETag de períodos fechados
+OPEN_PERIOD_KEYS = ('max_sale_id', 'matviews_refreshed_at')
+
+_watermark_cache = {'loaded_at': 0.0, 'watermark': {}}
+
+
+async def get_watermark_async(db) -> Dict:
+    """{'max_sale_id': ..., 'matviews_refreshed_at': ..., 'rollups_refreshed_at': ...}"""
+    age = time.monotonic() - _watermark_cache['loaded_at']
+    if age < settings.DATA_WATERMARK_TTL_SECONDS:
+        return _watermark_cache['watermark']
+
+    max_sale_id = (await db.execute(text(MAX_SALE_ID_SQL))).scalar()
+    rollups_refreshed_at = matviews_refreshed_at = None
+    if (await db.execute(text(COVERAGE_EXISTS_SQL))).scalar():
+        rollups_refreshed_at, matviews_refreshed_at = (await db.execute(
+            text(REFRESHED_SQL), {'rollups': CLOSED_DAY_TABLES, 'matviews': list(MATVIEWS)}
+        )).one()
+
+    watermark = {
+        'max_sale_id': max_sale_id,
+        'matviews_refreshed_at': matviews_refreshed_at.isoformat() if matviews_refreshed_at else None,
+        'rollups_refreshed_at': rollups_refreshed_at.isoformat() if rollups_refreshed_at else None
+    }
+    _watermark_cache['watermark'] = watermark
+    _watermark_cache['loaded_at'] = time.monotonic()
+    return watermark
+
+
+def data_version(watermark: Dict, closed: bool) -> Dict:
+    """Marcas que versionam um resultado: períodos fechados ignoram as de períodos abertos"""
+    version = dict(watermark)
+    if closed:
+        for key in OPEN_PERIOD_KEYS:
+            version.pop(key, None)
+    return version
+
+
+def invalidate_watermark():
+    _watermark_cache['loaded_at'] = 0.0
@@ -0,0 +1,6 @@
+"""
+Benchmarks do QueryBuilder e dos endpoints de analytics.
+
+Uso (dentro de backend/):
+    python -m benchmarks.run --help
+"""
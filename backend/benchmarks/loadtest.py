@@ -0,0 +1,296 @@
+"""
+Teste de carga da API de analytics com tráfego de dashboard.
+
+Mistura ponderada de /dashboard, /sales-trends, /top-products,
+/channel-performance e /hourly-sales, com períodos variados (mais peso em
+7 e 30 dias) e recortes de loja (todas, uma, algumas). Dois modos:
+
+- closed (padrão): rampa de concorrência, cada cliente faz um request
+  após o outro (ex.: --concurrency 1,2,4,8,16);
+- open: taxa de chegada fixa por estágio, chegadas de Poisson
+  (ex.: --rate 5,10,20,40). A latência conta a partir do instante
+  programado, então fila no cliente/servidor aparece no resultado.
+
+Ao final, cada estágio mostra vazão, erros e p50/p95/p99, e o relatório
+indica o ponto de saturação: o primeiro estágio em que a vazão para de
+crescer enquanto a latência sobe, ou em que os erros passam de 1%.
+
+Uso (dentro de backend/, com o docker-compose de pé):
+    python -m benchmarks.loadtest --concurrency 1,2,4,8,16,32 --stage-seconds 30
+    python -m benchmarks.loadtest --mode open --rate 10,20,40,80 --stage-seconds 60
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from benchmarks.stats import summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Rota -> (peso, parâmetros extras)
+TRAFFIC_MIX = {
+    '/api/v1/analytics/dashboard': (50, {}),
+    '/api/v1/analytics/sales-trends': (15, {'period': ['day', 'day', 'week', 'month']}),
+    '/api/v1/analytics/top-products': (15, {'limit': [5, 10, 20]}),
+    '/api/v1/analytics/channel-performance': (10, {}),
+    '/api/v1/analytics/hourly-sales': (10, {}),
+}
+
+# Tamanho do período (dias) -> peso: presets do dashboard dominam
+WINDOWS = {1: 5, 7: 35, 30: 40, 90: 15, 180: 5}
+
+# Recorte de lojas -> peso
+STORE_SCOPES = {'all': 60, 'one': 30, 'some': 10}
+
+# Saturação: vazão cresce menos que isto enquanto o p95 cresce mais que aquilo
+SATURATION_THROUGHPUT_GAIN = 0.05
+SATURATION_LATENCY_GROWTH = 0.5
+SATURATION_ERROR_RATE = 0.01
+
+
+class TrafficGenerator:
+    """Requests sorteados segundo TRAFFIC_MIX, WINDOWS e STORE_SCOPES"""
+
+    def __init__(self, base_url: str, anchor: date, store_ids: List[int], seed: int):
+        self.base_url = base_url.rstrip('/')
+        self.anchor = anchor
+        self.store_ids = store_ids
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next_request(self) -> Dict:
+        with self.lock:
+            rnd = self.random
+            route = _weighted(rnd, {r: w for r, (w, _) in TRAFFIC_MIX.items()})
+            window = _weighted(rnd, WINDOWS)
+            # Fim do período: em geral hoje, às vezes um período fechado no passado
+            end = self.anchor - timedelta(days=rnd.choice([0, 0, 0, 0, 1, 7, 30]))
+            params = {
+                'start_date': (end - timedelta(days=window - 1)).isoformat(),
+                'end_date': end.isoformat(),
+            }
+            scope = _weighted(rnd, STORE_SCOPES)
+            if scope == 'one':
+                params['store_ids'] = [rnd.choice(self.store_ids)]
+            elif scope == 'some':
+                params['store_ids'] = sorted(rnd.sample(self.store_ids, min(3, len(self.store_ids))))
+            for name, choices in TRAFFIC_MIX[route][1].items():
+                params[name] = rnd.choice(choices)
+
+        query = urllib.parse.urlencode(params, doseq=True)
+        return {'route': route, 'url': f"{self.base_url}{route}?{query}"}
+
+
+class StageRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route: str, seconds: float, ok: bool):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, wall_seconds: float) -> Dict:
+        with self.lock:
+            all_latencies = [s for samples in self.latencies.values() for s in samples]
+            errors = sum(self.errors.values())
+            routes = {
+                route: dict(summarize(samples, wall_seconds), errors=self.errors[route])
+                for route, samples in sorted(self.latencies.items())
+            }
+        overall = summarize(all_latencies, wall_seconds)
+        overall['errors'] = errors
+        overall['error_rate'] = errors / overall['count'] if overall['count'] else 0.0
+        return {'overall': overall, 'routes': routes}
+
+
+def send(request: Dict, timeout: float) -> bool:
+    try:
+        with urllib.request.urlopen(request['url'], timeout=timeout) as response:
+            response.read()
+            return response.status < 400
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def run_closed_stage(traffic: TrafficGenerator, concurrency: int, seconds: float, timeout: float) -> Dict:
+    """`concurrency` clientes, cada um com um request por vez, durante `seconds`"""
+    recorder = StageRecorder()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            request = traffic.next_request()
+            start = time.perf_counter()
+            ok = send(request, timeout)
+            recorder.record(request['route'], time.perf_counter() - start, ok)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def run_open_stage(traffic: TrafficGenerator, rate: float, seconds: float, timeout: float,
+                   max_in_flight: int, seed: int) -> Dict:
+    """Chegadas de Poisson a `rate` req/s durante `seconds`, independentes das respostas"""
+    recorder = StageRecorder()
+    arrivals = random.Random(seed)
+    dropped = 0
+
+    def fire(request: Dict, scheduled: float):
+        ok = send(request, timeout)
+        # Latência desde o instante programado: inclui espera por thread livre
+        recorder.record(request['route'], time.perf_counter() - scheduled, ok)
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def release(_future):
+        in_flight.release()
+
+    started = time.perf_counter()
+    next_at = started
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while True:
+            next_at += arrivals.expovariate(rate)
+            if next_at - started >= seconds:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not in_flight.acquire(blocking=False):
+                # Cliente saturado: conta como erro em vez de atrasar as próximas chegadas
+                dropped += 1
+                recorder.record('client_dropped', 0.0, False)
+                continue
+            future = pool.submit(fire, traffic.next_request(), next_at)
+            future.add_done_callback(release)
+
+    report = recorder.report(time.perf_counter() - started)
+    report['overall']['offered_rps'] = rate
+    report['overall']['dropped'] = dropped
+    return report
+
+
+def find_saturation(stages: List[Dict]) -> Optional[Dict]:
+    """Primeiro estágio em que a vazão estagna com latência crescente, ou com erros"""
+    previous = None
+    for stage in stages:
+        overall = stage['report']['overall']
+        if overall['error_rate'] > SATURATION_ERROR_RATE:
+            return {'stage': stage['label'], 'reason': f"erros {overall['error_rate']:.1%}"}
+        if previous:
+            prev = previous['report']['overall']
+            gain = overall['throughput_rps'] / prev['throughput_rps'] - 1 if prev['throughput_rps'] else 0
+            growth = overall['p95_ms'] / prev['p95_ms'] - 1 if prev['p95_ms'] else 0
+            if gain < SATURATION_THROUGHPUT_GAIN and growth > SATURATION_LATENCY_GROWTH:
+                return {
+                    'stage': stage['label'],
+                    'reason': f"vazão {gain:+.0%} com p95 {growth:+.0%} em relação a {previous['label']}"
+                }
+        previous = stage
+    return None
+
+
+def _weighted(rnd: random.Random, weights: Dict):
+    keys = list(weights)
+    return rnd.choices(keys, weights=[weights[k] for k in keys])[0]
+
+
+def _parse_list(value: str, cast):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def _parse_stores(value: str) -> List[int]:
+    """'1-50' ou '1,2,5'"""
+    if '-' in value:
+        first, last = value.split('-', 1)
+        return list(range(int(first), int(last) + 1))
+    return _parse_list(value, int)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga da API de analytics')
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32',
+                        help='Modo closed: clientes simultâneos por estágio')
+    parser.add_argument('--rate', default='5,10,20,40,80',
+                        help='Modo open: chegadas por segundo por estágio')
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help='Modo open: requests simultâneos no cliente antes de descartar chegadas')
+    parser.add_argument('--stage-seconds', type=float, default=30.0, help='Duração de cada estágio')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Timeout por request (s)')
+    parser.add_argument('--stores', default='1-50', help="Lojas sorteadas: '1-50' ou '1,2,5'")
+    parser.add_argument('--anchor', default=None, help='Último dia dos períodos (YYYY-MM-DD); padrão: hoje')
+    parser.add_argument('--seed', type=int, default=42, help='Semente do sorteio de requests')
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída (padrão: benchmarks/results/)')
+    args = parser.parse_args()
+
+    anchor = date.fromisoformat(args.anchor) if args.anchor else date.today()
+    traffic = TrafficGenerator(args.base_url, anchor, _parse_stores(args.stores), args.seed)
+
+    if args.mode == 'closed':
+        levels = _parse_list(args.concurrency, int)
+    else:
+        levels = _parse_list(args.rate, float)
+
+    stages = []
+    for i, level in enumerate(levels):
+        if args.mode == 'closed':
+            label = f"{level} clientes"
+            report = run_closed_stage(traffic, level, args.stage_seconds, args.timeout)
+        else:
+            label = f"{level:g} req/s"
+            report = run_open_stage(traffic, level, args.stage_seconds, args.timeout,
+                                    args.max_in_flight, args.seed + i)
+        overall = report['overall']
+        print(f"{label:>14}: {overall['throughput_rps']:7.1f} req/s  "
+              f"p50 {overall['p50_ms']:7.1f} ms  p95 {overall['p95_ms']:7.1f} ms  "
+              f"p99 {overall['p99_ms']:7.1f} ms  erros {overall['error_rate']:.1%}")
+        stages.append({'label': label, 'level': level, 'report': report})
+
+    saturation = find_saturation(stages)
+    if saturation:
+        print(f"→ Saturação em {saturation['stage']}: {saturation['reason']}")
+    else:
+        print("→ Sem saturação nos estágios testados")
+
+    result = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'base_url': args.base_url,
+            'mode': args.mode,
+            'stage_seconds': args.stage_seconds,
+            'anchor': anchor.isoformat(),
+            'seed': args.seed,
+            'traffic_mix': {route: weight for route, (weight, _) in TRAFFIC_MIX.items()},
+        },
+        'stages': stages,
+        'saturation': saturation,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"✓ Resultados salvos em {output}")
+
+
+if __name__ == '__main__':
+    main()
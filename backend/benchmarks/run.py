@@ -0,0 +1,347 @@
+"""
+Benchmark do QueryBuilder e das rotas /api/v1/analytics/*.
+
+Cada método/rota roda sobre os mesmos cenários: janelas de 7, 30 e 180 dias
+terminando no último dia com vendas, todas as lojas e uma única loja, e
+cada período de tendência (day, week, month). O resultado (p50/p95/p99,
+vazão) é salvo em JSON para comparar execuções.
+
+Uso (dentro de backend/):
+    # dataset determinístico num banco vazio (gera, migra e agrega rollups);
+    # as vendas terminam em --end-date, não na data da execução
+    python -m benchmarks.run --seed-data --months 6 --stores 20 --seed 42 --end-date 2025-06-30 --targets none
+
+    python -m benchmarks.run --targets queries
+    python -m benchmarks.run --targets endpoints --base-url http://localhost:8000 --clear-cache
+    python -m benchmarks.run --compare benchmarks/results/baseline.json --max-regression 0.15
+
+Com --compare, o processo termina com código 1 se algum p95 piorou mais
+que --max-regression em relação à execução de referência.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from benchmarks.stats import summarize
+
+WINDOWS = (7, 30, 180)
+TREND_PERIODS = ('day', 'week', 'month')
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+GENERATOR = os.path.join(os.path.dirname(__file__), '..', '..', 'generate_data.py')
+# Âncora do dataset gerado: as mesmas vendas em qualquer dia de execução
+DATASET_END_DATE = '2025-06-30'
+
+# Métodos do QueryBuilder: nome -> chamada(builder, filtros, período anterior)
+QUERY_BENCHMARKS = {
+    'kpi_overview': lambda qb, f, prev: qb.get_kpi_overview(f),
+    'kpi_overview:exact': lambda qb, f, prev: qb.get_kpi_overview(f, exact=True),
+    'top_products': lambda qb, f, prev: qb.get_top_products(f, 10),
+    'channel_performance': lambda qb, f, prev: qb.get_channel_performance(f),
+    'hourly_sales': lambda qb, f, prev: qb.get_hourly_sales(f),
+    'dashboard': lambda qb, f, prev: qb.get_dashboard(f, prev, 10),
+}
+for _period in TREND_PERIODS:
+    QUERY_BENCHMARKS[f'sales_trends:{_period}'] = (
+        lambda qb, f, prev, period=_period: qb.get_sales_trends(f, period)
+    )
+
+# Rotas: nome -> (caminho, parâmetros extras)
+ENDPOINT_BENCHMARKS = {
+    'dashboard': ('/api/v1/analytics/dashboard', {}),
+    'top-products': ('/api/v1/analytics/top-products', {'limit': 10}),
+    'channel-performance': ('/api/v1/analytics/channel-performance', {}),
+    'hourly-sales': ('/api/v1/analytics/hourly-sales', {}),
+}
+for _period in TREND_PERIODS:
+    ENDPOINT_BENCHMARKS[f'sales-trends:{_period}'] = ('/api/v1/analytics/sales-trends', {'period': _period})
+
+
+def build_scenarios(anchor: date, store_id: Optional[int]) -> List[Dict]:
+    """Janelas × escopo de lojas, terminando em `anchor` (inclusive)"""
+    scenarios = []
+    for window in WINDOWS:
+        filters = {
+            'start_date': (anchor - timedelta(days=window - 1)).isoformat(),
+            'end_date': anchor.isoformat()
+        }
+        scenarios.append({'name': f'{window}d/all_stores', 'filters': filters})
+        if store_id is not None:
+            scenarios.append({
+                'name': f'{window}d/one_store',
+                'filters': dict(filters, store_ids=[store_id])
+            })
+    return scenarios
+
+
+def previous_period(filters: Dict) -> Dict:
+    """Mesmo recorte do AnalyticsService: período imediatamente anterior, mesmo tamanho"""
+    start = date.fromisoformat(filters['start_date'])
+    end = date.fromisoformat(filters['end_date'])
+    days = (end - start).days + 1
+    return dict(
+        filters,
+        start_date=(start - timedelta(days=days)).isoformat(),
+        end_date=(start - timedelta(days=1)).isoformat()
+    )
+
+
+def measure(call: Callable[[], object], iterations: int, warmup: int,
+            before_each: Optional[Callable[[], None]] = None) -> Dict:
+    for _ in range(warmup):
+        if before_each:
+            before_each()
+        call()
+
+    samples = []
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def dataset_info(db) -> Dict:
+    row = db.execute(text("""
+        SELECT COUNT(*), MIN(created_at)::date, MAX(created_at)::date
+        FROM sales
+        WHERE sale_status_desc = 'COMPLETED'
+    """)).fetchone()
+    store_id = db.execute(text("""
+        SELECT store_id FROM sales
+        GROUP BY store_id
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+    """)).scalar()
+    return {
+        'completed_sales': row[0],
+        'first_day': row[1].isoformat() if row[1] else None,
+        'last_day': row[2].isoformat() if row[2] else None,
+        'benchmark_store_id': store_id,
+    }
+
+
+def seed_dataset(args) -> None:
+    """Gerar o dataset com generate_data.py (banco vazio), migrar e agregar rollups"""
+    from app.core.config import settings
+    from app.core.database import SessionLocal, engine
+    from app.core.migrations import MigrationRunner
+    from app.services.partitions import PartitionManager
+    from app.services.rollups import RollupManager
+
+    with SessionLocal() as db:
+        existing = db.execute(text("SELECT EXISTS (SELECT 1 FROM sales)")).scalar()
+    if existing:
+        sys.exit("✗ sales já tem dados: use um banco vazio para um dataset reproduzível "
+                 "(ex.: docker compose down -v && docker compose up -d postgres)")
+
+    end_date = date.fromisoformat(args.end_date)
+    PartitionManager(engine).ensure_future(
+        from_day=end_date - timedelta(days=30 * args.months + 1), to_day=end_date
+    )
+    command = [
+        sys.executable, args.generator,
+        '--db-url', settings.DATABASE_URL,
+        '--months', str(args.months),
+        '--stores', str(args.stores),
+        '--seed', str(args.seed),
+        '--end-date', end_date.isoformat(),
+        '--workers', str(args.workers),
+    ]
+    print(f"→ {' '.join(command)}")
+    subprocess.run(command, check=True)
+
+    MigrationRunner(engine).migrate()
+    with SessionLocal() as db:
+        RollupManager(db).refresh()
+
+
+def run_query_benchmarks(scenarios: List[Dict], args) -> List[Dict]:
+    from app.core.database import SessionLocal
+    from app.services.query_builder import QueryBuilder
+
+    results = []
+    with SessionLocal() as db:
+        builder = QueryBuilder(db)
+        for name, benchmark in QUERY_BENCHMARKS.items():
+            for scenario in scenarios:
+                filters = scenario['filters']
+                prev = previous_period(filters)
+
+                def call():
+                    benchmark(builder, filters, prev)
+                    db.rollback()
+
+                summary = measure(call, args.iterations, args.warmup)
+                results.append(dict(target='query', name=name, scenario=scenario['name'], **summary))
+                print(f"  query    {name:<24} {scenario['name']:<16} "
+                      f"p50 {summary['p50_ms']:8.1f} ms  p95 {summary['p95_ms']:8.1f} ms")
+    return results
+
+
+def run_endpoint_benchmarks(scenarios: List[Dict], args) -> List[Dict]:
+    base_url = args.base_url.rstrip('/')
+
+    def clear_cache():
+        request = urllib.request.Request(f"{base_url}/api/v1/debug/cache", method='DELETE')
+        urllib.request.urlopen(request, timeout=args.timeout).read()
+
+    results = []
+    for name, (path, extra) in ENDPOINT_BENCHMARKS.items():
+        for scenario in scenarios:
+            query = urllib.parse.urlencode(dict(scenario['filters'], **extra), doseq=True)
+            url = f"{base_url}{path}?{query}"
+
+            def call():
+                with urllib.request.urlopen(url, timeout=args.timeout) as response:
+                    response.read()
+
+            summary = measure(call, args.iterations, args.warmup,
+                              before_each=clear_cache if args.clear_cache else None)
+            results.append(dict(target='endpoint', name=name, scenario=scenario['name'], **summary))
+            print(f"  endpoint {name:<24} {scenario['name']:<16} "
+                  f"p50 {summary['p50_ms']:8.1f} ms  p95 {summary['p95_ms']:8.1f} ms")
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, max_regression: float) -> List[Dict]:
+    """Resultados cujo p95 piorou mais que `max_regression` (fração) em relação ao baseline"""
+    with open(baseline_path) as f:
+        baseline = {
+            (r['target'], r['name'], r['scenario']): r
+            for r in json.load(f)['results']
+        }
+
+    regressions = []
+    for result in results:
+        reference = baseline.get((result['target'], result['name'], result['scenario']))
+        if reference is None or reference['p95_ms'] <= 0:
+            continue
+        change = result['p95_ms'] / reference['p95_ms'] - 1
+        # Diferenças abaixo de 1 ms são ruído de medição
+        if change > max_regression and result['p95_ms'] - reference['p95_ms'] > 1.0:
+            regressions.append({
+                'target': result['target'], 'name': result['name'], 'scenario': result['scenario'],
+                'baseline_p95_ms': reference['p95_ms'], 'p95_ms': result['p95_ms'], 'change': change
+            })
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do QueryBuilder e dos endpoints de analytics')
+    parser.add_argument('--targets', default='queries,endpoints',
+                        help='queries, endpoints, ambos (separados por vírgula) ou none')
+    parser.add_argument('--iterations', type=int, default=20, help='Amostras por cenário')
+    parser.add_argument('--warmup', type=int, default=2, help='Execuções descartadas antes das amostras')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='API para os benchmarks de endpoints')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Timeout por request (s)')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Limpar o cache de resultados da API antes de cada request (mede o caminho até o banco)')
+    parser.add_argument('--anchor', default=None,
+                        help='Último dia das janelas (YYYY-MM-DD); padrão: último dia com vendas')
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída (padrão: benchmarks/results/)')
+    parser.add_argument('--compare', default=None, help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='Piora máxima aceitável do p95 em --compare (fração)')
+
+    seed = parser.add_argument_group('dataset')
+    seed.add_argument('--seed-data', action='store_true', help='Gerar o dataset antes (banco vazio)')
+    seed.add_argument('--generator', default=GENERATOR, help='Caminho do generate_data.py')
+    seed.add_argument('--months', type=int, default=6)
+    seed.add_argument('--stores', type=int, default=20)
+    seed.add_argument('--seed', type=int, default=42)
+    seed.add_argument('--end-date', default=DATASET_END_DATE,
+                      help='Último dia de vendas do dataset (YYYY-MM-DD); fixo para ser reproduzível')
+    seed.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    targets = {t.strip() for t in args.targets.split(',') if t.strip()}
+
+    if args.seed_data:
+        seed_dataset(args)
+
+    if not targets & {'queries', 'endpoints'}:
+        return
+
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        dataset = dataset_info(db)
+    if not dataset['completed_sales']:
+        sys.exit("✗ Nenhuma venda no banco: rode com --seed-data")
+
+    anchor = date.fromisoformat(args.anchor or dataset['last_day'])
+    scenarios = build_scenarios(anchor, dataset['benchmark_store_id'])
+    print(f"Dataset: {dataset['completed_sales']} vendas, {dataset['first_day']} → {dataset['last_day']}")
+
+    results = []
+    if 'queries' in targets:
+        results += run_query_benchmarks(scenarios, args)
+    if 'endpoints' in targets:
+        results += run_endpoint_benchmarks(scenarios, args)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'anchor': anchor.isoformat(),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'clear_cache': args.clear_cache,
+            'dataset': dataset,
+            'seed': {
+                'months': args.months,
+                'stores': args.stores,
+                'seed': args.seed,
+                'end_date': args.end_date,
+            } if args.seed_data else None,
+            'settings': {
+                'DASHBOARD_QUERY_MODE': settings.DASHBOARD_QUERY_MODE,
+                'ROLLUPS_ENABLED': settings.ROLLUPS_ENABLED,
+                'CACHE_ENABLED': settings.CACHE_ENABLED,
+                'DB_POOL_SIZE': settings.DB_POOL_SIZE,
+            },
+        },
+        'results': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Resultados salvos em {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        for r in regressions:
+            print(f"✗ {r['target']} {r['name']} {r['scenario']}: "
+                  f"p95 {r['baseline_p95_ms']:.1f} → {r['p95_ms']:.1f} ms ({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ Nenhuma regressão de p95 acima de {args.max_regression:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Estatísticas de latência dos benchmarks"""
+import math
+from typing import Dict, List, Sequence
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Percentil com interpolação linear (valores já ordenados)"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return sorted_values[lower]
+    weight = rank - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+def summarize(samples: List[float], wall_seconds: float = None) -> Dict:
+    """Resumo de amostras em segundos: percentis em ms e vazão (ops/s)
+
+    Sem `wall_seconds`, a vazão é a de um único cliente sequencial
+    (amostras / soma das durações).
+    """
+    values = sorted(samples)
+    count = len(values)
+    elapsed = wall_seconds if wall_seconds is not None else sum(values)
+    return {
+        'count': count,
+        'mean_ms': sum(values) / count * 1000 if count else 0.0,
+        'min_ms': values[0] * 1000 if count else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': values[-1] * 1000 if count else 0.0,
+        'throughput_rps': count / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,135 @@
+"""
+ResultCache: chave, TTL por período, invalidação por data e computação
+compartilhada entre requests simultâneos (single-flight).
+"""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from app.services.cache import LRUCache, ResultCache
+from app.services.singleflight import SingleFlight
+
+TODAY = date.today()
+CLOSED = {'start_date': '2025-06-01', 'end_date': '2025-06-30'}
+RECENT = {'start_date': (TODAY - timedelta(days=7)).isoformat(), 'end_date': TODAY.isoformat()}
+
+
+@pytest.fixture
+def cache():
+    return ResultCache(LRUCache(), flights=SingleFlight())
+
+
+def counting(value):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return value
+
+    return compute, calls
+
+
+def test_key_ignores_store_order_and_duplicates(cache):
+    assert (
+        cache.make_key('top_products', dict(CLOSED, store_ids=[3, 1, 3]), limit=10)
+        == cache.make_key('top_products', dict(CLOSED, store_ids=[1, 3]), limit=10)
+    )
+    assert cache.make_key('top_products', CLOSED, limit=10) != cache.make_key('top_products', CLOSED, limit=5)
+
+
+def test_ttl_for_closed_and_recent_periods(cache, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.CACHE_TTL_HISTORICAL_SECONDS', 21600)
+    monkeypatch.setattr('app.core.config.settings.CACHE_TTL_RECENT_SECONDS', 60)
+
+    assert cache.ttl_for(CLOSED) == 21600
+    assert cache.ttl_for(RECENT) == 60
+    assert cache.ttl_for({'start_date': '2025-06-01'}) == 60
+
+
+def test_second_call_is_served_from_cache_as_a_copy(cache):
+    compute, calls = counting({'rows': [1]})
+
+    first = asyncio.run(cache.aget_or_compute('hourly_sales', CLOSED, compute))
+    first['rows'].append(2)
+    second = asyncio.run(cache.aget_or_compute('hourly_sales', CLOSED, compute))
+
+    assert len(calls) == 1
+    assert second == {'rows': [1]}
+
+
+def test_concurrent_identical_requests_compute_once(cache):
+    compute, calls = counting({'rows': [1]})
+
+    async def scenario():
+        return await asyncio.gather(*(
+            cache.aget_or_compute('hourly_sales', CLOSED, compute) for _ in range(5)
+        ))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert results == [{'rows': [1]}] * 5
+    assert cache.stats()['singleflight']['coalesced'] == 4
+
+
+def test_disabled_cache_still_coalesces_but_does_not_store():
+    cache = ResultCache(LRUCache(), enabled=False, flights=SingleFlight())
+    compute, calls = counting({'rows': [1]})
+
+    asyncio.run(cache.aget_or_compute('hourly_sales', CLOSED, compute))
+    asyncio.run(cache.aget_or_compute('hourly_sales', CLOSED, compute))
+
+    assert len(calls) == 2
+
+
+def test_invalidate_from_drops_periods_reaching_the_day(cache):
+    compute, calls = counting({'rows': [1]})
+    for filters in (CLOSED, RECENT):
+        asyncio.run(cache.aget_or_compute('hourly_sales', filters, compute))
+
+    assert cache.invalidate_from(TODAY) == 1
+    asyncio.run(cache.aget_or_compute('hourly_sales', CLOSED, compute))
+    asyncio.run(cache.aget_or_compute('hourly_sales', RECENT, compute))
+    assert len(calls) == 3
+
+
+# Versão dos dados (marca d'água) na chave
+
+def watermark_sequence(monkeypatch, *watermarks):
+    pending = list(watermarks)
+
+    async def get_watermark(db):
+        return pending.pop(0)
+
+    monkeypatch.setattr('app.services.cache.get_watermark_async', get_watermark)
+
+
+def test_new_sales_recompute_results_of_periods_including_today(cache, monkeypatch):
+    watermark_sequence(
+        monkeypatch,
+        {'max_sale_id': 10, 'matviews_refreshed_at': None, 'rollups_refreshed_at': 'r1'},
+        {'max_sale_id': 11, 'matviews_refreshed_at': None, 'rollups_refreshed_at': 'r1'},
+    )
+    compute, calls = counting({'rows': [1]})
+
+    for _ in range(2):
+        asyncio.run(cache.aget_or_compute_at_watermark(None, 'hourly_sales', RECENT, compute))
+
+    assert len(calls) == 2
+
+
+def test_closed_periods_follow_only_rollup_refreshes(cache, monkeypatch):
+    watermark_sequence(
+        monkeypatch,
+        {'max_sale_id': 10, 'matviews_refreshed_at': 'm1', 'rollups_refreshed_at': 'r1'},
+        {'max_sale_id': 11, 'matviews_refreshed_at': 'm2', 'rollups_refreshed_at': 'r1'},
+        {'max_sale_id': 12, 'matviews_refreshed_at': 'm2', 'rollups_refreshed_at': 'r2'},
+    )
+    compute, calls = counting({'rows': [1]})
+
+    for _ in range(3):
+        asyncio.run(cache.aget_or_compute_at_watermark(None, 'hourly_sales', CLOSED, compute))
+
+    assert len(calls) == 2
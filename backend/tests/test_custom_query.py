@@ -0,0 +1,210 @@
+"""
+Compilação das queries customizadas: validação contra a camada semântica,
+SQL gerado (joins, EXISTS entre grãos, recorte das partições filhas) e
+escolha do rollup. Não acessa o banco.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services.custom_query import CustomQueryEngine, CustomQueryError
+
+PERIOD = {'start_date': '2025-06-01', 'end_date': '2025-06-30'}
+
+# Rollups cobrindo o período inteiro: (covered_from, refreshed_through, refreshed_at)
+COVERED = {
+    name: (date(2025, 1, 1), date(2025, 12, 31), datetime(2026, 1, 1))
+    for name in ('daily_store_channel_sales', 'daily_store_hour_sales', 'daily_product_sales')
+}
+
+
+@pytest.fixture
+def engine():
+    return CustomQueryEngine(None)
+
+
+def spec(**overrides):
+    return dict(PERIOD, **overrides)
+
+
+def compile_spec(engine, coverage=None, **overrides):
+    return engine.compile(engine.normalize(spec(**overrides)), coverage or {})
+
+
+# normalize
+
+def test_normalize_accepts_frontend_format_and_removes_duplicates(engine):
+    request = engine.normalize(spec(
+        dimensions=[{'field': 'channel'}, 'channel', 'date'],
+        measures=['total_sales'],
+        filters=[{'field': 'date_range', 'operator': '>=', 'value': '2025-06-10'}],
+        store_ids=[3, 1, 3],
+    ))
+
+    assert request['dimensions'] == ['channel', 'date']
+    assert request['filters'] == [{'field': 'date', 'operator': '>=', 'value': date(2025, 6, 10)}]
+    assert request['base_filters'] == dict(PERIOD, store_ids=[1, 3])
+
+
+def test_normalize_defaults_to_last_30_days(engine):
+    request = engine.normalize({'measures': ['order_count']})
+
+    start = datetime.strptime(request['base_filters']['start_date'], '%Y-%m-%d').date()
+    end = datetime.strptime(request['base_filters']['end_date'], '%Y-%m-%d').date()
+    assert end - start == timedelta(days=30)
+
+
+def test_normalize_clamps_limit(engine, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.CUSTOM_QUERY_MAX_ROWS', 50)
+
+    assert engine.normalize(spec(measures=['order_count'], limit=10_000))['limit'] == 50
+    assert engine.normalize(spec(measures=['order_count'], limit=-5))['limit'] == 1
+
+
+def test_normalize_coerces_filter_values(engine):
+    request = engine.normalize(spec(measures=['total_sales'], filters=[
+        {'field': 'store_id', 'operator': 'IN', 'value': '1, 2,,3'},
+        {'field': 'channel', 'operator': 'like', 'value': 'iFood'},
+        {'field': 'price_range', 'operator': '>', 'value': '19.9'},
+    ]))
+
+    assert [f['value'] for f in request['filters']] == [[1, 2, 3], '%iFood%', 19.9]
+    assert request['filters'][1]['operator'] == 'LIKE'
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({}, 'ao menos uma'),
+    ({'dimensions': ['s.id; DROP TABLE sales']}, 'Dimensão não suportada'),
+    ({'measures': ['SUM(s.total_amount)']}, 'Medida não suportada'),
+    ({'measures': ['total_sales'], 'filters': [{'field': 'cpf', 'value': 'x'}]}, 'Filtro não suportado'),
+    ({'measures': ['total_sales'], 'filters': [{'field': 'hour', 'operator': 'OR 1=1', 'value': 1}]},
+     'Operador não suportado'),
+    ({'measures': ['total_sales'], 'filters': [{'field': 'hour', 'operator': 'LIKE', 'value': 1}]},
+     'LIKE só é permitido'),
+    ({'measures': ['total_sales'], 'filters': [{'field': 'hour', 'operator': 'IN', 'value': []}]},
+     'IN sem valores'),
+    ({'measures': ['total_sales'], 'filters': [{'field': 'hour', 'value': 'noon'}]}, 'Valor inválido'),
+    ({'measures': ['total_sales'], 'start_date': '2025-13-01'}, 'Data inválida em start_date'),
+    ({'measures': ['total_sales'], 'end_date': 'ontem'}, 'Data inválida em end_date'),
+    ({'measures': ['total_sales'], 'start_date': '2025-07-01'}, 'end_date anterior a start_date'),
+])
+def test_normalize_rejects_invalid_specs(engine, overrides, message):
+    raw = dict(PERIOD, **overrides)
+
+    with pytest.raises(CustomQueryError, match=message):
+        engine.normalize(raw)
+
+
+def test_normalize_enforces_field_limits(engine, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.CUSTOM_QUERY_MAX_DIMENSIONS', 1)
+
+    with pytest.raises(CustomQueryError, match='Máximo de 1 dimensões'):
+        engine.normalize(spec(dimensions=['date', 'channel']))
+
+
+# compile: vendas brutas
+
+def test_compile_raw_sale_grain(engine):
+    query, params, source = compile_spec(
+        engine, dimensions=['channel'], measures=['total_sales', 'order_count'],
+        filters=[{'field': 'store', 'operator': '=', 'value': 'Loja 1'}],
+    )
+
+    assert source == 'sales'
+    assert 'FROM sales s' in query
+    assert 'JOIN channels ch ON ch.id = s.channel_id' in query
+    assert 'JOIN stores st ON st.id = s.store_id' in query
+    assert 'st.name = :f0' in query
+    # Valores do usuário só como parâmetros
+    assert 'Loja 1' not in query
+    assert params['f0'] == 'Loja 1'
+    assert 'GROUP BY 1' in query
+    assert 'ORDER BY 2 DESC NULLS LAST' in query
+
+
+def test_compile_raw_product_grain_cuts_child_partitions(engine):
+    query, params, source = compile_spec(engine, dimensions=['category'], measures=['quantity'])
+
+    assert source == 'sales'
+    # Joins em ordem de dependência
+    assert (query.index('JOIN product_sales ps') < query.index('JOIN products p')
+            < query.index('LEFT JOIN categories cat'))
+    assert 'ps.sale_created_at >= :start_date' in query
+    assert 'ps.sale_created_at < :end_date' in query
+    assert 'SUM(ps.quantity)' in query
+    assert params['end_date'] == datetime(2025, 7, 1)
+
+
+def test_compile_cross_grain_filter_uses_exists(engine):
+    query, params, _ = compile_spec(
+        engine, dimensions=['date'], measures=['order_count'],
+        filters=[{'field': 'category', 'operator': '=', 'value': 'Bebidas'}],
+    )
+
+    # Filtro de produto numa query por venda: EXISTS, sem join que multiplique linhas
+    assert 'EXISTS (SELECT 1 FROM product_sales ps' in query
+    assert 'ps.sale_id = s.id AND ps.sale_created_at = s.created_at' in query
+    assert 'cat.name = :f0' in query
+    assert 'ps.sale_created_at >= :start_date' in query
+    assert 'JOIN product_sales ps ON' not in query
+    assert 'COUNT(*)' in query
+    assert query.index('ORDER BY 1') > query.index('GROUP BY 1')
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'dimensions': ['product_name', 'payment_type'], 'measures': ['total_sales']},
+     'combinar produtos e pagamentos'),
+    ({'dimensions': ['payment_type'], 'measures': ['avg_preparation_time']}, 'não está disponível'),
+])
+def test_compile_rejects_incompatible_grains(engine, overrides, message):
+    with pytest.raises(CustomQueryError, match=message):
+        compile_spec(engine, **overrides)
+
+
+# compile: rollups
+
+def test_compile_uses_covering_rollup(engine):
+    query, params, source = compile_spec(
+        engine, COVERED, dimensions=['date', 'channel'], measures=['total_sales'], store_ids=[2],
+    )
+
+    assert source == 'daily_store_channel_sales'
+    assert 'FROM daily_store_channel_sales r' in query
+    assert 'FROM sales' not in query
+    assert 'r.store_id IN :store_ids' in query
+    assert params['rollup_start_day'] == date(2025, 6, 1)
+    assert params['rollup_end_day'] == date(2025, 6, 30)
+
+
+def test_compile_picks_rollup_with_requested_fields(engine):
+    _, _, source = compile_spec(engine, COVERED, dimensions=['hour'], measures=['order_count'])
+    assert source == 'daily_store_hour_sales'
+
+    _, _, source = compile_spec(engine, COVERED, dimensions=['category'], measures=['quantity'])
+    assert source == 'daily_product_sales'
+
+
+@pytest.mark.parametrize('coverage, overrides', [
+    # Período fora da cobertura
+    ({name: (date(2025, 6, 15), end, at) for name, (_, end, at) in COVERED.items()}, {}),
+    # Medida sem coluna no rollup
+    (COVERED, {'measures': ['unique_customers']}),
+    # Recorte por loja num rollup sem loja
+    (COVERED, {'dimensions': ['category'], 'measures': ['quantity'], 'store_ids': [1]}),
+    # Período que não é de dias inteiros
+    (COVERED, {'start_date': '2025-06-01T12:00:00'}),
+])
+def test_compile_falls_back_to_raw_sales(engine, coverage, overrides):
+    overrides = dict({'dimensions': ['date'], 'measures': ['total_sales']}, **overrides)
+
+    _, _, source = compile_spec(engine, coverage, **overrides)
+
+    assert source == 'sales'
+
+
+def test_compile_rollups_disabled(engine, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.ROLLUPS_ENABLED', False)
+
+    _, _, source = compile_spec(engine, COVERED, dimensions=['date'], measures=['total_sales'])
+
+    assert source == 'sales'
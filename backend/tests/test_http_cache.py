@@ -0,0 +1,174 @@
+"""
+Validadores HTTP dos endpoints de analytics: ETag por período (fechado ou
+incluindo hoje), comparação de If-None-Match e Cache-Control. Não acessa o banco.
+"""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from starlette.requests import Request
+
+from app.api import http_cache
+from app.api.http_cache import ConditionalGet, conditional_get, is_closed_period, make_etag
+from app.services import watermark as watermark_module
+
+PATH = '/api/v1/analytics/dashboard'
+PARAMS = {'end_date': ['2025-06-30'], 'start_date': ['2025-06-01']}
+
+WATERMARK = {
+    'max_sale_id': 1000,
+    'matviews_refreshed_at': '2025-07-01T10:00:00',
+    'rollups_refreshed_at': '2025-07-01T03:00:00'
+}
+
+
+def request(query_string: str = '', if_none_match: str = None) -> Request:
+    headers = [(b'host', b'testserver')]
+    if if_none_match is not None:
+        headers.append((b'if-none-match', if_none_match.encode()))
+    return Request({
+        'type': 'http', 'method': 'GET', 'scheme': 'http', 'path': PATH,
+        'query_string': query_string.encode(), 'headers': headers
+    })
+
+
+# make_etag
+
+@pytest.mark.parametrize('change', [
+    {'max_sale_id': 1001},
+    {'matviews_refreshed_at': '2025-07-01T10:10:00'},
+])
+def test_closed_period_etag_ignores_new_sales_and_matview_refreshes(change):
+    changed = dict(WATERMARK, **change)
+
+    assert make_etag(PATH, PARAMS, WATERMARK, closed=True) == make_etag(PATH, PARAMS, changed, closed=True)
+    assert make_etag(PATH, PARAMS, WATERMARK, closed=False) != make_etag(PATH, PARAMS, changed, closed=False)
+
+
+@pytest.mark.parametrize('closed', [True, False])
+def test_rollup_refresh_changes_every_etag(closed):
+    changed = dict(WATERMARK, rollups_refreshed_at='2025-07-02T03:00:00')
+
+    assert make_etag(PATH, PARAMS, WATERMARK, closed) != make_etag(PATH, PARAMS, changed, closed)
+
+
+def test_etag_depends_on_path_and_params():
+    etag = make_etag(PATH, PARAMS, WATERMARK, closed=True)
+
+    assert etag.startswith('W/"')
+    assert etag != make_etag('/api/v1/analytics/overview', PARAMS, WATERMARK, closed=True)
+    assert etag != make_etag(PATH, dict(PARAMS, store_ids=['1']), WATERMARK, closed=True)
+
+
+def test_etag_stable_when_query_params_are_reordered(monkeypatch):
+    async def watermark(db):
+        return WATERMARK
+
+    monkeypatch.setattr(http_cache, 'get_watermark_async', watermark)
+    first = asyncio.run(conditional_get(request('start_date=2025-06-01&store_ids=2&store_ids=1'), None))
+    second = asyncio.run(conditional_get(request('store_ids=1&store_ids=2&start_date=2025-06-01'), None))
+
+    assert first.etag == second.etag
+
+
+# is_closed_period / Cache-Control
+
+@pytest.mark.parametrize('end_date, closed', [
+    (None, False),
+    ('', False),
+    ('not-a-date', False),
+    (date.today().isoformat(), False),
+    ((date.today() + timedelta(days=1)).isoformat(), False),
+    ((date.today() - timedelta(days=1)).isoformat(), True),
+])
+def test_is_closed_period(end_date, closed):
+    assert is_closed_period(end_date) is closed
+
+
+def test_cache_control_by_period(monkeypatch):
+    async def watermark(db):
+        return WATERMARK
+
+    monkeypatch.setattr(http_cache, 'get_watermark_async', watermark)
+    monkeypatch.setattr('app.core.config.settings.HTTP_CACHE_HISTORICAL_MAX_AGE', 3600)
+    monkeypatch.setattr('app.core.config.settings.HTTP_CACHE_RECENT_MAX_AGE', 30)
+
+    closed = asyncio.run(conditional_get(request('end_date=2025-06-30'), None))
+    recent = asyncio.run(conditional_get(request(), None))
+
+    assert closed.headers['Cache-Control'] == 'public, max-age=3600'
+    assert recent.headers['Cache-Control'] == 'public, max-age=30'
+    assert closed.etag != recent.etag
+
+
+def test_http_cache_disabled(monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.HTTP_CACHE_ENABLED', False)
+
+    conditional = asyncio.run(conditional_get(request(if_none_match='*'), None))
+
+    assert conditional.headers == {'Cache-Control': 'no-cache'}
+    assert not conditional.not_modified
+
+
+# ConditionalGet.not_modified
+
+ETAG = 'W/"abc"'
+
+
+@pytest.mark.parametrize('if_none_match, not_modified', [
+    (None, False),
+    ('', False),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('W/"other"', False),
+    ('*', True),
+    ('W/"other", W/"abc"', True),
+    ('"other","abc"', True),
+    ('W/"other", "another"', False),
+])
+def test_not_modified(if_none_match, not_modified):
+    conditional = ConditionalGet(request(if_none_match=if_none_match), ETAG, 'public, max-age=30')
+
+    assert conditional.not_modified is not_modified
+
+
+def test_not_modified_response_keeps_validators():
+    conditional = ConditionalGet(request(if_none_match=ETAG), ETAG, 'public, max-age=30')
+    response = conditional.not_modified_response()
+
+    assert response.status_code == 304
+    assert response.headers['etag'] == ETAG
+    assert response.headers['cache-control'] == 'public, max-age=30'
+
+
+# get_watermark_async
+
+class FakeWatermarkDb:
+    """AsyncSession mínima: MAX(id) de sales, tabela de estado existente e as marcas de refresh"""
+
+    def __init__(self):
+        self.refreshed_params = None
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if 'rollup_refresh_state' in sql and 'FILTER' in sql:
+            self.refreshed_params = params
+        return self
+
+    def scalar(self):
+        return 1000
+
+    def one(self):
+        return (None, None)
+
+
+def test_watermark_versions_rollups_and_customer_summary_but_not_matviews(monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.DATA_WATERMARK_TTL_SECONDS', 0)
+    db = FakeWatermarkDb()
+
+    watermark = asyncio.run(watermark_module.get_watermark_async(db))
+
+    assert watermark['max_sale_id'] == 1000
+    assert 'customer_store_summary' in db.refreshed_params['rollups']
+    assert 'daily_store_channel_sales' in db.refreshed_params['rollups']
+    assert not set(db.refreshed_params['rollups']) & set(db.refreshed_params['matviews'])
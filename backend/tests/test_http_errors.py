@@ -0,0 +1,31 @@
+"""
+Mapeamento de erros das queries de analytics para respostas HTTP.
+"""
+from sqlalchemy.exc import DBAPIError
+
+from app.api.endpoints.analytics import TIMEOUT_DETAIL, _http_error
+from app.services.query_builder import QueryTooExpensive
+
+
+def test_cost_guard_rejection_is_422():
+    error = _http_error(QueryTooExpensive("Consulta muito ampla"), "Erro")
+
+    assert error.status_code == 422
+    assert error.detail == "Consulta muito ampla"
+
+
+def test_statement_timeout_is_503_with_retry_after():
+    timeout = DBAPIError("SELECT 1", {}, Exception("canceling statement due to statement timeout"))
+
+    error = _http_error(timeout, "Erro")
+
+    assert error.status_code == 503
+    assert error.detail == TIMEOUT_DETAIL
+    assert int(error.headers['Retry-After']) > 0
+
+
+def test_other_database_errors_are_500():
+    error = _http_error(DBAPIError("SELECT 1", {}, Exception("relation does not exist")), "Erro ao buscar")
+
+    assert error.status_code == 500
+    assert error.detail.startswith("Erro ao buscar: ")
@@ -0,0 +1,202 @@
+"""
+SQL do QueryBuilder escolhido a partir da cobertura de rollups e views
+(fonte de cada seção do dashboard e defasagem reportada). Não acessa o banco.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services.query_builder import DASHBOARD_SECTIONS, QueryBuilder
+from app.services.sketches import hll_hash_sql
+
+TODAY = date.today()
+PERIOD = {'start_date': (TODAY - timedelta(days=6)).isoformat(), 'end_date': TODAY.isoformat()}
+
+# Views atualizadas hoje há 2 minutos: (covered_from, refreshed_through, refreshed_at)
+MATVIEWS_FRESH = {
+    name: (TODAY - timedelta(days=30), TODAY, datetime.now() - timedelta(minutes=2))
+    for name in ('mv_daily_store_product_sales', 'mv_daily_store_channel_sales')
+}
+
+
+@pytest.fixture
+def builder():
+    return QueryBuilder(None)
+
+
+# data_freshness do dashboard
+
+def test_dashboard_freshness_covers_products_and_channels(builder):
+    freshness = builder._dashboard_freshness(PERIOD, MATVIEWS_FRESH, DASHBOARD_SECTIONS)
+
+    assert set(freshness) == {'top_products', 'channel_performance'}
+    assert freshness['top_products']['source'] == 'mv_daily_store_product_sales'
+    assert freshness['top_products']['staleness_seconds'] >= 120
+
+
+def test_dashboard_freshness_reports_channel_source_of_each_mode(builder):
+    single = builder._dashboard_freshness(PERIOD, MATVIEWS_FRESH, DASHBOARD_SECTIONS)
+    concurrent = builder._dashboard_freshness(PERIOD, MATVIEWS_FRESH, DASHBOARD_SECTIONS, concurrent=True)
+
+    # A query única agrupa os canais junto das outras seções: rollup ou sales
+    assert single['channel_performance'] == {'source': 'sales', 'refreshed_at': None, 'staleness_seconds': 0}
+    assert concurrent['channel_performance']['source'] == 'mv_daily_store_channel_sales'
+    assert concurrent['channel_performance']['staleness_seconds'] >= 120
+
+
+def test_dashboard_freshness_only_for_requested_sections(builder):
+    assert builder._dashboard_freshness(PERIOD, MATVIEWS_FRESH, ('overview', 'hourly_sales')) == {}
+
+
+# Dashboard em uma query: CTE de vendas só quando alguma seção lê sales
+
+# Rollups cobrindo os dois períodos (atual e anterior) até ontem
+ROLLUPS_COVERED = {
+    name: (TODAY - timedelta(days=90), TODAY - timedelta(days=1), datetime.now())
+    for name in (
+        'daily_store_channel_sales', 'daily_store_hour_sales',
+        'daily_product_sales', 'daily_store_customer_hll'
+    )
+}
+CLOSED_PERIOD = {
+    'start_date': (TODAY - timedelta(days=7)).isoformat(),
+    'end_date': (TODAY - timedelta(days=1)).isoformat()
+}
+CLOSED_PREV_PERIOD = {
+    'start_date': (TODAY - timedelta(days=14)).isoformat(),
+    'end_date': (TODAY - timedelta(days=8)).isoformat()
+}
+
+
+def test_dashboard_without_base_cte_when_everything_is_pre_aggregated(builder):
+    query, params = builder._dashboard_query(CLOSED_PERIOD, CLOSED_PREV_PERIOD, 10, ROLLUPS_COVERED)
+
+    assert 'base' not in query.split()
+    assert 'FROM sales s' not in query
+    assert 'current_start_date' not in params
+    assert not builder._guards_cost(query, params)
+
+
+def test_dashboard_keeps_base_cte_for_sections_reading_sales(builder):
+    query, params = builder._dashboard_query(CLOSED_PERIOD, CLOSED_PREV_PERIOD, 10, ROLLUPS_COVERED, exact=True)
+
+    assert 'WITH base AS MATERIALIZED' in query
+    # Só os KPIs exatos leem o CTE, que cobre o período anterior também
+    assert params['start_date'] == datetime.fromisoformat(CLOSED_PREV_PERIOD['start_date'])
+
+
+# Período terminando hoje: dias fechados dos rollups, só a cauda (hoje) de sales
+
+PREV_PERIOD = {
+    'start_date': (TODAY - timedelta(days=13)).isoformat(),
+    'end_date': (TODAY - timedelta(days=7)).isoformat()
+}
+TODAY_START = datetime.combine(TODAY, datetime.min.time())
+
+
+def test_kpis_of_a_period_ending_today_keep_the_rollup_path(builder):
+    query, params = builder._kpi_overview_query(PERIOD, ROLLUPS_COVERED)
+
+    assert 'FROM daily_store_channel_sales r' in query
+    assert 'COUNT(DISTINCT' not in query
+    assert params['rollup_end_day'] == TODAY - timedelta(days=1)
+    assert params['start_date'] == TODAY_START
+    assert not builder._guards_cost(query, params)
+
+
+def test_dashboard_of_a_period_ending_today_reads_only_today_from_sales(builder):
+    query, params = builder._dashboard_query(PERIOD, PREV_PERIOD, 10, ROLLUPS_COVERED)
+
+    for rollup in ROLLUPS_COVERED:
+        assert rollup in query
+    assert 'COUNT(DISTINCT' not in query
+    # CTE e partes dos rollups se dividem em tail_day: nenhum dia lido duas vezes
+    assert params['start_date'] == params['tail_start'] == TODAY_START
+    assert params['tail_day'] == TODAY
+    assert not builder._guards_cost(query, params)
+
+
+def test_dashboard_tail_starts_after_the_least_refreshed_rollup(builder):
+    coverage = dict(ROLLUPS_COVERED)
+    covered_from, _, refreshed_at = coverage['daily_store_hour_sales']
+    coverage['daily_store_hour_sales'] = (covered_from, TODAY - timedelta(days=3), refreshed_at)
+
+    _, params = builder._dashboard_query(PERIOD, PREV_PERIOD, 10, coverage)
+
+    assert params['tail_day'] == TODAY - timedelta(days=2)
+
+
+def test_dashboard_freshness_of_a_period_ending_today_reports_the_rollups(builder):
+    freshness = builder._dashboard_freshness(PERIOD, ROLLUPS_COVERED, DASHBOARD_SECTIONS)
+
+    assert freshness['top_products']['source'] == 'daily_product_sales'
+    assert freshness['channel_performance']['source'] == 'daily_store_channel_sales'
+    assert freshness['channel_performance']['staleness_seconds'] == 0
+
+
+# Clientes únicos: sketches dos dias fechados + registradores das vendas da cauda
+
+def test_kpis_of_a_period_ending_today_merge_sketches_with_today_registers(builder):
+    query, _ = builder._kpi_overview_query(PERIOD, ROLLUPS_COVERED)
+
+    assert "'sketch' as unique_customers_method" in query
+    assert 'FROM daily_store_customer_hll h' in query
+    assert hll_hash_sql('c.customer_id') in query
+
+
+def test_dashboard_overview_of_a_period_ending_today_is_a_sketch(builder):
+    query, _ = builder._dashboard_query(PERIOD, PREV_PERIOD, 10, ROLLUPS_COVERED)
+
+    assert "'sketch'::text AS category" in query
+    # Só clientes do período atual na cauda entram no sketch
+    assert "FROM base b WHERE b.slice = 'current' AND b.created_at >= :tail_start) c" in query
+
+
+def test_closed_period_sketch_reads_no_raw_registers(builder):
+    query, _ = builder._kpi_overview_query(CLOSED_PERIOD, ROLLUPS_COVERED)
+
+    assert 'hashint8extended' not in query
+    assert 'FROM sales s' not in query
+
+
+# Guarda de custo
+
+@pytest.mark.parametrize('days, guarded', [(7, False), (31, False), (32, True)])
+def test_cost_guard_explains_only_long_windows(builder, monkeypatch, days, guarded):
+    monkeypatch.setattr('app.core.config.settings.QUERY_COST_CHECK_MIN_DAYS', 31)
+    filters = {'start_date': (TODAY - timedelta(days=days - 1)).isoformat(), 'end_date': TODAY.isoformat()}
+    query, params = builder._hourly_sales_query(filters, {})
+
+    assert builder._guards_cost(query, params) is guarded
+
+
+def test_cost_guard_explains_unbounded_windows(builder):
+    query, params = builder._hourly_sales_query({'end_date': TODAY.isoformat()}, {})
+
+    assert builder._guards_cost(query, params)
+
+
+def test_cost_guard_disabled(builder, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.QUERY_MAX_SCAN_ROWS', 0)
+    query, params = builder._hourly_sales_query({'end_date': TODAY.isoformat()}, {})
+
+    assert not builder._guards_cost(query, params)
+
+
+# Views: dia do refresh parcial só vale para períodos que incluem hoje
+
+def test_matview_serves_today_up_to_a_recent_refresh(builder):
+    assert builder._channel_performance_source(PERIOD, MATVIEWS_FRESH) == 'mv_daily_store_channel_sales'
+
+
+def test_matview_partial_last_day_of_a_closed_period_reads_sales(builder):
+    # Último refresh ontem (antes do fim do dia): ontem está incompleto na view
+    yesterday = TODAY - timedelta(days=1)
+    coverage = {
+        'mv_daily_store_channel_sales': (TODAY - timedelta(days=30), yesterday, datetime.now() - timedelta(minutes=5))
+    }
+    closed = {'start_date': (TODAY - timedelta(days=7)).isoformat(), 'end_date': yesterday.isoformat()}
+    before_refresh_day = dict(closed, end_date=(TODAY - timedelta(days=2)).isoformat())
+
+    assert builder._channel_performance_source(closed, coverage) == 'sales'
+    assert builder._channel_performance_source(before_refresh_day, coverage) == 'mv_daily_store_channel_sales'
@@ -0,0 +1,166 @@
+"""
+Single-flight: chamadores simultâneos com a mesma chave compartilham uma
+computação; cancelamento do líder e exceções chegam aos demais chamadores.
+"""
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+class Compute:
+    """compute() que conta chamadas e, com `gate`, espera liberação antes de responder"""
+
+    def __init__(self, gate: asyncio.Event = None, error: Exception = None):
+        self.gate = gate
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return {'call': call, 'rows': [1, 2, 3]}
+
+
+async def settle():
+    """Deixar as tasks criadas chegarem ao primeiro await"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_callers_share_one_computation():
+    async def scenario():
+        flights = SingleFlight()
+        compute = Compute(asyncio.Event())
+        tasks = [asyncio.create_task(flights.do('key', compute)) for _ in range(5)]
+        await settle()
+        compute.gate.set()
+        return flights, compute, await asyncio.gather(*tasks)
+
+    flights, compute, results = asyncio.run(scenario())
+
+    assert compute.calls == 1
+    assert all(result == {'call': 1, 'rows': [1, 2, 3]} for result in results)
+    # Seguidores recebem cópias: ajustar uma resposta não altera as outras
+    results[1]['rows'].append(4)
+    assert results[0]['rows'] == [1, 2, 3]
+    assert flights.stats()['leaders'] == 1
+    assert flights.stats()['coalesced'] == 4
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_different_keys_are_not_coalesced():
+    async def scenario():
+        flights = SingleFlight()
+        compute = Compute()
+        await asyncio.gather(flights.do('a', compute), flights.do('b', compute))
+        return compute
+
+    assert asyncio.run(scenario()).calls == 2
+
+
+def test_follower_takes_over_when_leader_is_cancelled():
+    async def scenario():
+        flights = SingleFlight()
+        compute = Compute(asyncio.Event())
+        leader = asyncio.create_task(flights.do('key', compute))
+        await settle()
+        followers = [asyncio.create_task(flights.do('key', compute)) for _ in range(3)]
+        await settle()
+
+        leader.cancel()
+        await settle()
+        compute.gate.set()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return flights, compute, results
+
+    flights, compute, results = asyncio.run(scenario())
+
+    # Um seguidor assume e recalcula; os outros aguardam o novo líder
+    assert compute.calls == 2
+    assert all(result['call'] == 2 for result in results)
+    assert flights.stats()['leaders'] == 2
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def scenario():
+        flights = SingleFlight()
+        compute = Compute(asyncio.Event())
+        leader = asyncio.create_task(flights.do('key', compute))
+        await settle()
+        follower = asyncio.create_task(flights.do('key', compute))
+        await settle()
+
+        follower.cancel()
+        await settle()
+        compute.gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return compute, await leader
+
+    compute, result = asyncio.run(scenario())
+
+    assert compute.calls == 1
+    assert result['call'] == 1
+
+
+def test_leader_exception_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+        compute = Compute(asyncio.Event(), error=RuntimeError("statement timeout"))
+        tasks = [asyncio.create_task(flights.do('key', compute)) for _ in range(4)]
+        await settle()
+        compute.gate.set()
+        return flights, compute, await asyncio.gather(*tasks, return_exceptions=True)
+
+    flights, compute, results = asyncio.run(scenario())
+
+    assert compute.calls == 1
+    assert len(results) == 4
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_failed_key_is_recomputed_by_the_next_caller():
+    async def scenario():
+        flights = SingleFlight()
+        with pytest.raises(RuntimeError):
+            await flights.do('key', Compute(error=RuntimeError("falhou")))
+        return await flights.do('key', Compute())
+
+    assert asyncio.run(scenario())['call'] == 1
+
+
+def test_result_shared_between_workers_through_lock_dir(tmp_path):
+    async def scenario():
+        # Dois "workers": instâncias separadas, mesmo diretório de locks
+        first, second = SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))
+        compute = Compute()
+        return first, second, compute, await first.do('key', compute), await second.do('key', compute)
+
+    first, second, compute, first_result, second_result = asyncio.run(scenario())
+
+    assert compute.calls == 1
+    assert second_result == first_result
+    assert second.stats()['shared_from_workers'] == 1
+    assert second.stats()['cross_worker']
+
+
+def test_expired_shared_result_is_recomputed(tmp_path):
+    async def scenario():
+        first = SingleFlight(lock_dir=str(tmp_path))
+        second = SingleFlight(lock_dir=str(tmp_path), result_ttl=-1)
+        compute = Compute()
+        await first.do('key', compute)
+        await second.do('key', compute)
+        return compute
+
+    assert asyncio.run(scenario()).calls == 2
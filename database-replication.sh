@@ -0,0 +1,7 @@
+#!/bin/bash
+# Allow streaming replication connections (used by the optional
+# postgres-replica service in docker-compose.yml).
+# Init scripts only run on an empty data volume: on an existing one,
+# append this line to pg_hba.conf by hand and reload.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -97,8 +97,12 @@ CREATE TABLE customers (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Sales and every table hanging off a sale are range-partitioned by month
+-- on the sale timestamp (sales.created_at / sale_created_at on the children),
+-- so date-filtered queries only touch the months they ask for. Partitions
+-- are created by create_monthly_partitions() at the end of this file.
 CREATE TABLE sales (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     store_id INTEGER NOT NULL REFERENCES stores(id),
     sub_brand_id INTEGER REFERENCES sub_brands(id),
     customer_id INTEGER REFERENCES customers(id),
@@ -127,47 +131,58 @@ CREATE TABLE sales (
     -- Metadata
     discount_reason VARCHAR(300),
     increase_reason VARCHAR(300),
-    origin VARCHAR(100) DEFAULT 'POS'
-);
+    origin VARCHAR(100) DEFAULT 'POS',
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
 CREATE TABLE product_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     product_id INTEGER NOT NULL REFERENCES products(id),
     quantity FLOAT NOT NULL,
     base_price FLOAT NOT NULL,
     total_price FLOAT NOT NULL,
-    observations VARCHAR(300)
-);
+    observations VARCHAR(300),
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (sale_id, sale_created_at) REFERENCES sales(id, created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 -- Items added to products (e.g., "Hamburguer + Bacon + Queijo extra")
 CREATE TABLE item_product_sales (
-    id SERIAL PRIMARY KEY,
-    product_sale_id INTEGER NOT NULL REFERENCES product_sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    product_sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     item_id INTEGER NOT NULL REFERENCES items(id),
     option_group_id INTEGER REFERENCES option_groups(id),
     quantity FLOAT NOT NULL,
     additional_price FLOAT NOT NULL,
     price FLOAT NOT NULL,
     amount FLOAT DEFAULT 1,
-    observations VARCHAR(300)
-);
+    observations VARCHAR(300),
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (product_sale_id, sale_created_at) REFERENCES product_sales(id, sale_created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 -- Items added to items (nested customization)
 CREATE TABLE item_item_product_sales (
-    id SERIAL PRIMARY KEY,
-    item_product_sale_id INTEGER NOT NULL REFERENCES item_product_sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    item_product_sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     item_id INTEGER NOT NULL REFERENCES items(id),
     option_group_id INTEGER REFERENCES option_groups(id),
     quantity FLOAT NOT NULL,
     additional_price FLOAT NOT NULL,
     price FLOAT NOT NULL,
-    amount FLOAT DEFAULT 1
-);
+    amount FLOAT DEFAULT 1,
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (item_product_sale_id, sale_created_at) REFERENCES item_product_sales(id, sale_created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 CREATE TABLE delivery_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     courier_id VARCHAR(100),
     courier_name VARCHAR(100),
     courier_phone VARCHAR(100),
@@ -178,13 +193,16 @@ CREATE TABLE delivery_sales (
     delivery_fee FLOAT,
     courier_fee FLOAT,
     timing VARCHAR(100),
-    mode VARCHAR(100)
-);
+    mode VARCHAR(100),
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (sale_id, sale_created_at) REFERENCES sales(id, created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 CREATE TABLE delivery_addresses (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
-    delivery_sale_id INTEGER REFERENCES delivery_sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
+    delivery_sale_id INTEGER,
     street VARCHAR(200),
     number VARCHAR(20),
     complement VARCHAR(200),
@@ -196,8 +214,11 @@ CREATE TABLE delivery_addresses (
     postal_code VARCHAR(20),
     reference VARCHAR(300),
     latitude FLOAT,
-    longitude FLOAT
-);
+    longitude FLOAT,
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (sale_id, sale_created_at) REFERENCES sales(id, created_at) ON DELETE CASCADE,
+    FOREIGN KEY (delivery_sale_id, sale_created_at) REFERENCES delivery_sales(id, sale_created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 CREATE TABLE payment_types (
     id SERIAL PRIMARY KEY,
@@ -206,14 +227,17 @@ CREATE TABLE payment_types (
 );
 
 CREATE TABLE payments (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     payment_type_id INTEGER REFERENCES payment_types(id),
     value DECIMAL(10,2) NOT NULL,
     is_online BOOLEAN DEFAULT false,
     description VARCHAR(100),
-    currency VARCHAR(10) DEFAULT 'BRL'
-);
+    currency VARCHAR(10) DEFAULT 'BRL',
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (sale_id, sale_created_at) REFERENCES sales(id, created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
 
 CREATE TABLE coupons (
     id SERIAL PRIMARY KEY,
@@ -227,10 +251,45 @@ CREATE TABLE coupons (
 );
 
 CREATE TABLE coupon_sales (
-    id SERIAL PRIMARY KEY,
-    sale_id INTEGER REFERENCES sales(id) ON DELETE CASCADE,
+    id SERIAL,
+    sale_id INTEGER NOT NULL,
+    sale_created_at TIMESTAMP NOT NULL,
     coupon_id INTEGER REFERENCES coupons(id),
     value FLOAT,
     target VARCHAR(100),
-    sponsorship VARCHAR(100)
-);
\ No newline at end of file
+    sponsorship VARCHAR(100),
+    PRIMARY KEY (id, sale_created_at),
+    FOREIGN KEY (sale_id, sale_created_at) REFERENCES sales(id, created_at) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_created_at);
+
+-- Monthly partitions for sales and its child tables, named <table>_pYYYYMM.
+-- Idempotent; also called by generate_data.py and app.services.partitions.
+CREATE OR REPLACE FUNCTION create_monthly_partitions(p_from DATE, p_to DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    month_start DATE := date_trunc('month', p_from)::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= p_to LOOP
+        FOREACH parent IN ARRAY ARRAY[
+            'sales', 'product_sales', 'item_product_sales', 'item_item_product_sales',
+            'delivery_sales', 'delivery_addresses', 'payments', 'coupon_sales'
+        ] LOOP
+            partition_name := parent || '_p' || to_char(month_start, 'YYYYMM');
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, parent, month_start, (month_start + INTERVAL '1 month')::date
+                );
+                created := created + 1;
+            END IF;
+        END LOOP;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_monthly_partitions((CURRENT_DATE - INTERVAL '12 months')::date, (CURRENT_DATE + INTERVAL '3 months')::date);
\ No newline at end of file
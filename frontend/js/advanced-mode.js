@@ -255,17 +255,21 @@ class AdvancedMode {
         try {
             const startTime = performance.now();
             
-            // Em produção, isso chamaria a API de queries customizadas
-            // Por enquanto, vamos simular com dados existentes
             const timeRange = this.getDateRange();
-            const data = await this.api.getDashboardData(timeRange.startDate, timeRange.endDate);
+            const data = await this.api.executeCustomQuery(
+                this.currentQuery.dimensions,
+                this.currentQuery.measures,
+                this.currentQuery.filters,
+                timeRange.startDate,
+                timeRange.endDate
+            );
             
             const endTime = performance.now();
             const executionTime = ((endTime - startTime) / 1000).toFixed(2);
             
-            this.currentResults = this.simulateQueryResults(data);
+            this.currentResults = data.rows;
             this.displayResults(this.currentResults);
-            this.updateExecutionInfo(this.currentResults.length, executionTime);
+            this.updateExecutionInfo(this.currentResults.length, executionTime, data.truncated);
             
             // Gerar visualizações
             this.generateVisualizations(this.currentResults);
@@ -278,65 +282,6 @@ class AdvancedMode {
         }
     }
 
-    simulateQueryResults(data) {
-        // Simular resultados baseados na query atual
-        // Em produção, isso viria do backend
-        const results = [];
-        
-        if (this.currentQuery.dimensions.some(d => d.field === 'channel') && 
-            this.currentQuery.measures.some(m => m.field === 'total_sales')) {
-            
-            // Simular dados de canais
-            if (data.channel_performance) {
-                data.channel_performance.forEach(channel => {
-                    const result = { channel: channel.channel_name };
-                    this.currentQuery.measures.forEach(measure => {
-                        if (measure.field === 'total_sales') {
-                            result.total_sales = channel.revenue;
-                        } else if (measure.field === 'order_count') {
-                            result.order_count = channel.orders;
-                        } else if (measure.field === 'avg_ticket') {
-                            result.avg_ticket = channel.avg_ticket;
-                        }
-                    });
-                    results.push(result);
-                });
-            }
-        } else if (this.currentQuery.dimensions.some(d => d.field === 'product_name')) {
-            // Simular dados de produtos
-            if (data.top_products) {
-                data.top_products.forEach(product => {
-                    const result = { product_name: product.product_name };
-                    this.currentQuery.measures.forEach(measure => {
-                        if (measure.field === 'quantity') {
-                            result.quantity = product.quantity_sold;
-                        } else if (measure.field === 'total_sales') {
-                            result.total_sales = product.revenue;
-                        }
-                    });
-                    results.push(result);
-                });
-            }
-        } else {
-            // Resultado padrão com overview
-            const result = {};
-            this.currentQuery.measures.forEach(measure => {
-                if (measure.field === 'total_sales') {
-                    result.total_sales = data.overview.total_revenue;
-                } else if (measure.field === 'order_count') {
-                    result.order_count = data.overview.total_orders;
-                } else if (measure.field === 'avg_ticket') {
-                    result.avg_ticket = data.overview.avg_ticket;
-                } else if (measure.field === 'unique_customers') {
-                    result.unique_customers = data.overview.unique_customers;
-                }
-            });
-            results.push(result);
-        }
-        
-        return results;
-    }
-
     displayResults(results) {
         const table = document.getElementById('results-table');
         const tbody = table.querySelector('tbody');
@@ -399,8 +344,12 @@ class AdvancedMode {
         return value;
     }
 
-    updateExecutionInfo(resultCount, executionTime) {
-        document.getElementById('result-count').textContent = `${resultCount} registros`;
+    updateExecutionInfo(resultCount, executionTime, truncated = false) {
+        const resultCountEl = document.getElementById('result-count');
+        resultCountEl.textContent = truncated
+            ? `${resultCount} registros (resultado limitado - refine os filtros para ver todos)`
+            : `${resultCount} registros`;
+        resultCountEl.title = truncated ? `A query retornou mais de ${resultCount} linhas` : '';
         document.getElementById('execution-time').textContent = `${executionTime}s`;
     }
 
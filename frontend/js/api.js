@@ -35,7 +35,8 @@ class NolaAPI {
 
             console.log('Fetching dashboard data from:', url);
             
-            const response = await fetch(url);
+            // Revalida com If-None-Match: sem mudanças nos dados, a API responde 304
+            const response = await fetch(url, { cache: 'no-cache' });
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -118,7 +119,7 @@ class NolaAPI {
     }
 
     // Método para queries customizadas (modo avançado)
-    async executeCustomQuery(dimensions = [], measures = [], filters = []) {
+    async executeCustomQuery(dimensions = [], measures = [], filters = [], startDate = null, endDate = null) {
         try {
             const response = await fetch(`${this.baseURL}/analytics/custom-query`, {
                 method: 'POST',
@@ -128,11 +129,16 @@ class NolaAPI {
                 body: JSON.stringify({
                     dimensions,
                     measures,
-                    filters
+                    filters,
+                    start_date: startDate || null,
+                    end_date: endDate || null
                 })
             });
             
             const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.detail || `HTTP error! status: ${response.status}`);
+            }
             return data;
         } catch (error) {
             console.error('Error executing custom query:', error);
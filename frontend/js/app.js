@@ -30,7 +30,8 @@ class RestaurantDashboard {
         
         console.log('Carregando dados de:', url);
         
-        const response = await fetch(url);
+        // Revalida com If-None-Match: sem mudanças nos dados, a API responde 304
+        const response = await fetch(url, { cache: 'no-cache' });
         
         if (response.ok) {
             const data = await response.json();
@@ -4,14 +4,22 @@ God Level Coder Challenge - Data Generator
 Generates realistic restaurant data based on Arcca's actual models
 """
 
+import io
+import multiprocessing
 import random
 import argparse
+from itertools import accumulate
 from datetime import datetime, timedelta
 from decimal import Decimal
 import psycopg2
 from psycopg2.extras import execute_batch
 from faker import Faker
 
+try:
+    import numpy as np
+except ImportError:  # only needed for --engine numpy
+    np = None
+
 fake = Faker('pt_BR')
 
 # Configurations
@@ -125,9 +133,10 @@ def setup_base_data(conn):
     return sub_brand_ids, channel_ids
 
 
-def generate_stores(conn, sub_brand_ids, num_stores=50):
+def generate_stores(conn, sub_brand_ids, num_stores=50, end_date=None):
     """Generate realistic stores"""
     print(f"Generating {num_stores} stores...")
+    end_date = end_date or anchor_date()
     cursor = conn.cursor()
     stores = []
     
@@ -160,8 +169,9 @@ def generate_stores(conn, sub_brand_ids, num_stores=50):
             Decimal(str(round(base_lat, 6))),
             Decimal(str(round(base_long, 6))),
             is_active, is_own,
-            fake.date_between(start_date='-2y', end_date='-6m'),
-            datetime.now() - timedelta(days=random.randint(180, 720))
+            fake.date_between(start_date=end_date.date() - timedelta(days=730),
+                              end_date=end_date.date() - timedelta(days=182)),
+            end_date - timedelta(days=random.randint(180, 720))
         ))
         stores.append(cursor.fetchone()[0])
     
@@ -274,9 +284,10 @@ def generate_products_and_items(conn, sub_brand_ids, num_products=500, num_items
     return products, items, option_groups
 
 
-def generate_customers(conn, num_customers=10000):
+def generate_customers(conn, num_customers=10000, end_date=None):
     """Generate customers"""
     print(f"Generating {num_customers} customers...")
+    end_date = end_date or anchor_date()
     cursor = conn.cursor()
     
     batch = []
@@ -288,7 +299,7 @@ def generate_customers(conn, num_customers=10000):
             random.choice([True, False]),
             random.choice([True, False, False]),  # 33% accept email
             random.choice(['qr_code', 'link', 'balcony', 'pos']),
-            datetime.now() - timedelta(days=random.randint(0, 720))
+            end_date - timedelta(days=random.randint(0, 720))
         ))
     
     execute_batch(cursor, """
@@ -306,91 +317,430 @@ def generate_customers(conn, num_customers=10000):
     return customer_ids
 
 
-def generate_sales(conn, stores, channels, products, items, option_groups, customers, months=6):
-    """Generate sales with realistic patterns"""
-    print(f"Generating sales for {months} months...")
+class SalesContext:
+    """Everything a worker needs to generate sales, with sampling tables precomputed.
+
+    Weights are turned into cumulative weights once, and Faker output used on
+    sales (customer names, couriers, addresses) is drawn from pools built up
+    front instead of calling Faker for every sale.
+    """
+
+    FAKE_POOL_SIZE = 2000
+
+    def __init__(self, stores, channels, products, items, option_groups, customers, seed):
+        self.stores = stores
+        self.channels = channels
+        self.products = products
+        self.items = items
+        self.option_groups = option_groups
+        self.customers = customers
+
+        self.hours = list(range(24))
+        self.hour_cum_weights = list(accumulate(get_hour_weight(h) * 100 for h in self.hours))
+        self.channel_cum_weights = list(accumulate(c['weight'] for c in channels))
+        self.product_cum_weights = list(accumulate(p['popularity'] for p in products))
+
+        pool_fake = Faker('pt_BR')
+        pool_fake.seed_instance(f"{seed}:pool")
+        size = self.FAKE_POOL_SIZE
+        self.names = [pool_fake.name() for _ in range(size)]
+        self.phones = [pool_fake.phone_number() for _ in range(size)]
+        self.addresses = [{
+            'street': pool_fake.street_name(),
+            'neighborhood': pool_fake.bairro(),
+            'city': pool_fake.city(),
+            'state': pool_fake.estado_sigla(),
+            'postal_code': pool_fake.postcode()
+        } for _ in range(size)]
+        self._arrays = None
+
+    def arrays(self):
+        """NumPy views of the context, for the numpy engine (built once per process)."""
+        if self._arrays is None:
+            hour_weights = np.array([get_hour_weight(h) for h in self.hours])
+            channel_weights = np.array([c['weight'] for c in self.channels])
+            popularity = np.array([p['popularity'] for p in self.products])
+            self._arrays = {
+                'hour_p': hour_weights / hour_weights.sum(),
+                'store_ids': np.array(self.stores),
+                'customer_ids': np.array(self.customers),
+                'channel_ids': np.array([c['id'] for c in self.channels]),
+                'channel_p': channel_weights / channel_weights.sum(),
+                'channel_is_delivery': np.array([c['type'] == 'D' for c in self.channels]),
+                'channel_is_presential': np.array([c['type'] == 'P' for c in self.channels]),
+                'product_ids': np.array([p['id'] for p in self.products]),
+                'product_prices': np.array([p['base_price'] for p in self.products]),
+                'product_customizable': np.array([p['has_customization'] for p in self.products]),
+                'product_p': popularity / popularity.sum(),
+                'item_ids': np.array([i['id'] for i in self.items]),
+                'item_prices': np.array([i['price'] for i in self.items]),
+                'option_group_ids': np.array(self.option_groups),
+                'discount_reasons': np.array(DISCOUNT_REASONS, dtype=object),
+                'courier_types': np.array(COURIER_TYPES, dtype=object),
+                'delivery_types': np.array(DELIVERY_TYPES, dtype=object),
+                'complements': np.array(['Apto 101', 'Casa', 'Bloco A', 'Fundos', None, None], dtype=object),
+                'names': np.array(self.names, dtype=object),
+                'phones': np.array(self.phones, dtype=object),
+                'streets': np.array([ad['street'] for ad in self.addresses], dtype=object),
+                'neighborhoods': np.array([ad['neighborhood'] for ad in self.addresses], dtype=object),
+                'cities': np.array([ad['city'] for ad in self.addresses], dtype=object),
+                'states': np.array([ad['state'] for ad in self.addresses], dtype=object),
+                'postal_codes': np.array([ad['postal_code'] for ad in self.addresses], dtype=object),
+            }
+        return self._arrays
+
+
+def anchor_date(end_date=None):
+    """Midnight of `end_date` (YYYY-MM-DD) or of today: every generated date is relative to it."""
+    day = datetime.strptime(end_date, '%Y-%m-%d') if end_date else datetime.now()
+    return datetime(day.year, day.month, day.day)
+
+
+def sales_date_range(months, end_date):
+    start_date = end_date - timedelta(days=30 * months)
+    days = []
+    current_date = start_date
+    while current_date <= end_date:
+        days.append(current_date)
+        current_date += timedelta(days=1)
+    return days
+
+
+def shard_days(days, workers):
+    """Split the days into `workers` contiguous shards of similar size."""
+    size, extra = divmod(len(days), workers)
+    shards = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            shards.append(days[start:end])
+        start = end
+    return shards
+
+
+def generate_sales(conn, db_url, ctx, months=6, seed=0, workers=1,
+                   loader_mode='copy', batch_size=5000, engine='python', end_date=None):
+    """Generate sales with realistic patterns, optionally across worker processes."""
+    print(f"Generating sales for {months} months with {workers} worker(s), {engine} engine...")
+    
+    days = sales_date_range(months, end_date or anchor_date())
+    start_date, end_date = days[0], days[-1]
+    
+    # Anomalies (drawn once so every shard agrees on them)
+    anomaly_rng = random.Random(f"{seed}:anomalies")
+    anomalies = {
+        'anomaly_week': start_date + timedelta(days=anomaly_rng.randint(30, 60)),
+        'promo_day': (start_date + timedelta(days=anomaly_rng.randint(90, 120))).date()
+    }
     
     cursor = conn.cursor()
-    start_date = datetime.now() - timedelta(days=30 * months)
-    end_date = datetime.now()
+    # Sales and its child tables are partitioned by month
+    cursor.execute("SELECT create_monthly_partitions(%s, %s)", (start_date.date(), end_date.date()))
+    conn.commit()
     
-    # Anomalies
-    anomaly_week = start_date + timedelta(days=random.randint(30, 60))
-    promo_day = start_date + timedelta(days=random.randint(90, 120))
+    # Secondary indexes are dropped for the load and built once at the end
+    dropped_indexes = drop_secondary_indexes(conn)
     
-    current_date = start_date
-    total_sales = 0
-    batch_size = 500
+    shards = shard_days(days, workers)
+    jobs = [(db_url, ctx, shard, anomalies, seed, loader_mode, batch_size, engine) for shard in shards]
     
-    while current_date <= end_date:
-        weekday = current_date.weekday()
-        day_mult = WEEKDAY_MULT[weekday]
-        
-        # Anomaly: bad week
-        if anomaly_week <= current_date < anomaly_week + timedelta(days=7):
-            day_mult *= 0.7
-        
-        # Anomaly: promo day
-        if current_date.date() == promo_day.date():
-            day_mult *= 3.0
-        
-        daily_sales = int(random.gauss(2700, 400) * day_mult)
+    if workers == 1:
+        totals = [generate_shard(*jobs[0])]
+    else:
+        with multiprocessing.Pool(len(jobs)) as pool:
+            totals = pool.starmap(generate_shard, jobs)
+    
+    total_sales = sum(totals)
+    print(f"✓ {total_sales:,} total sales generated")
+    
+    rebuild_indexes(conn, dropped_indexes)
+    return total_sales
+
+
+def generate_shard(db_url, ctx, days, anomalies, seed, loader_mode, batch_size, engine='python'):
+    """Generate and load a contiguous range of days on its own connection."""
+    conn = get_db_connection(db_url)
+    try:
+        loader = BulkLoader(conn, mode=loader_mode)
+        if engine == 'numpy':
+            total_sales = generate_shard_columns(conn, loader, ctx, days, anomalies, seed, batch_size)
+            print(f"  → {days[0]:%Y-%m-%d} to {days[-1]:%Y-%m-%d}: {total_sales:,} sales")
+            return total_sales
         
+        total_sales = 0
         sales_batch = []
         
-        for _ in range(daily_sales):
-            # Hour distribution
-            hour_weights = [get_hour_weight(h) * 100 for h in range(24)]
-            hour = random.choices(range(24), weights=hour_weights)[0]
-            
-            sale_time = current_date.replace(
-                hour=hour,
-                minute=random.randint(0, 59),
-                second=random.randint(0, 59)
-            )
-            
-            # Select entities
-            store_id = random.choice(stores)
-            channel = random.choices(channels, weights=[c['weight'] for c in channels])[0]
-            customer_id = random.choice(customers) if random.random() > 0.3 else None
-            
-            # Generate sale
-            sale_data = generate_single_sale(
-                sale_time, store_id, channel, customer_id, 
-                products, items, option_groups
-            )
-            
-            sales_batch.append(sale_data)
+        for current_date in days:
+            # One seed per day: the data does not depend on how days are sharded
+            random.seed(f"{seed}:{current_date.date().isoformat()}")
+            sales_batch.extend(generate_day(current_date, ctx, anomalies))
             
             if len(sales_batch) >= batch_size:
-                insert_sales_batch(cursor, sales_batch, items, option_groups)
+                loader.load(sales_batch)
                 total_sales += len(sales_batch)
                 sales_batch = []
-                conn.commit()
         
         # Insert remaining
         if sales_batch:
-            insert_sales_batch(cursor, sales_batch, items, option_groups)
+            loader.load(sales_batch)
             total_sales += len(sales_batch)
-            conn.commit()
         
-        current_date += timedelta(days=1)
+        print(f"  → {days[0]:%Y-%m-%d} to {days[-1]:%Y-%m-%d}: {total_sales:,} sales")
+        return total_sales
+    finally:
+        conn.close()
+
+
+def generate_day(current_date, ctx, anomalies):
+    weekday = current_date.weekday()
+    day_mult = WEEKDAY_MULT[weekday]
+    
+    # Anomaly: bad week
+    anomaly_week = anomalies['anomaly_week']
+    if anomaly_week <= current_date < anomaly_week + timedelta(days=7):
+        day_mult *= 0.7
+    
+    # Anomaly: promo day
+    if current_date.date() == anomalies['promo_day']:
+        day_mult *= 3.0
+    
+    daily_sales = int(random.gauss(2700, 400) * day_mult)
+    
+    hours = random.choices(ctx.hours, cum_weights=ctx.hour_cum_weights, k=daily_sales)
+    channels = random.choices(ctx.channels, cum_weights=ctx.channel_cum_weights, k=daily_sales)
+    
+    sales = []
+    for hour, channel in zip(hours, channels):
+        sale_time = current_date.replace(
+            hour=hour,
+            minute=random.randint(0, 59),
+            second=random.randint(0, 59)
+        )
+        
+        # Select entities
+        store_id = random.choice(ctx.stores)
+        customer_id = random.choice(ctx.customers) if random.random() > 0.3 else None
         
-        if current_date.day == 1:
-            print(f"  → {current_date.strftime('%B %Y')}: {total_sales:,} sales")
+        sales.append(generate_single_sale(sale_time, store_id, channel, customer_id, ctx))
     
-    print(f"✓ {total_sales:,} total sales generated")
+    return sales
+
+
+def generate_shard_columns(conn, loader, ctx, days, anomalies, seed, batch_size):
+    """NumPy engine: generate each day as column arrays and COPY them directly."""
+    arrays = ctx.arrays()
+    total_sales = 0
+    pending = 0
+    
+    for current_date in days:
+        # Seeded per day, like the python engine
+        rng = np.random.default_rng([seed, current_date.date().toordinal()])
+        columns = generate_day_columns(current_date, arrays, anomalies, rng)
+        loader.load_columns(columns)
+        
+        day_sales = len(columns['sales']['store_id'])
+        total_sales += day_sales
+        pending += day_sales
+        if pending >= batch_size:
+            conn.commit()
+            pending = 0
+    
+    conn.commit()
     return total_sales
 
 
-def generate_single_sale(sale_time, store_id, channel, customer_id, products, items, option_groups):
+def generate_day_columns(current_date, a, anomalies, rng):
+    """Draw a whole day of sales at once, as one array per column.
+
+    Mirrors generate_single_sale. Child tables reference their parent by
+    position (`sale_idx`, `product_sale_idx`, `delivery_idx`); the loader
+    swaps positions for the ids it reserves.
+    """
+    day_mult = WEEKDAY_MULT[current_date.weekday()]
+    anomaly_week = anomalies['anomaly_week']
+    if anomaly_week <= current_date < anomaly_week + timedelta(days=7):
+        day_mult *= 0.7
+    if current_date.date() == anomalies['promo_day']:
+        day_mult *= 3.0
+    n = max(0, int(rng.normal(2700, 400) * day_mult))
+    
+    # Sales: time, store, channel, customer
+    hours = rng.choice(24, size=n, p=a['hour_p'])
+    seconds = hours * 3600 + rng.integers(0, 60, n) * 60 + rng.integers(0, 60, n)
+    created_at = np.datetime64(current_date.date(), 's') + seconds.astype('timedelta64[s]')
+    store_id = rng.choice(a['store_ids'], size=n)
+    channel_idx = rng.choice(len(a['channel_ids']), size=n, p=a['channel_p'])
+    channel_id = a['channel_ids'][channel_idx]
+    is_delivery = a['channel_is_delivery'][channel_idx]
+    is_presential = a['channel_is_presential'][channel_idx]
+    has_customer = rng.random(n) > 0.3
+    customer_id = np.where(has_customer, rng.choice(a['customer_ids'], size=n), np.nan)
+    customer_name = np.where(has_customer, None, rng.choice(a['names'], size=n))
+    
+    # Product baskets: 1-5 lines per sale
+    lines_per_sale = np.minimum(5, np.floor(rng.exponential(2.0, n)).astype(np.int64) + 1)
+    sale_idx = np.repeat(np.arange(n), lines_per_sale)
+    n_lines = len(sale_idx)
+    product_idx = rng.choice(len(a['product_ids']), size=n_lines, p=a['product_p'])
+    qty = rng.integers(1, 4, n_lines)
+    base_price = a['product_prices'][product_idx]
+    
+    # Items/complements for customizable products (60% of them)
+    customized = a['product_customizable'][product_idx] & (rng.random(n_lines) > 0.4)
+    items_per_line = np.where(customized, rng.integers(1, 5, n_lines), 0)
+    product_sale_idx = np.repeat(np.arange(n_lines), items_per_line)
+    n_items = len(product_sale_idx)
+    item_idx = rng.integers(0, len(a['item_ids']), n_items)
+    item_price = a['item_prices'][item_idx]
+    option_group_id = np.where(
+        rng.random(n_items) > 0.5, rng.choice(a['option_group_ids'], size=n_items), np.nan
+    )
+    additions = np.bincount(product_sale_idx, weights=item_price, minlength=n_lines)
+    line_total = (base_price + additions) * qty
+    items_value = np.bincount(sale_idx, weights=line_total, minlength=n)
+    
+    # Discounts, increases, fees
+    has_discount = rng.random(n) < 0.2
+    discount = np.where(has_discount, np.round(items_value * rng.uniform(0.05, 0.30, n), 2), 0.0)
+    discount_reason = np.where(has_discount, rng.choice(a['discount_reasons'], size=n), None)
+    increase = np.where(rng.random(n) < 0.05, np.round(items_value * rng.uniform(0.02, 0.10, n), 2), 0.0)
+    delivery_fee = np.where(is_delivery, rng.choice([5.0, 7.0, 9.0, 12.0, 15.0], size=n), 0.0)
+    service_tax = np.where(rng.random(n) < 0.3, np.round(items_value * 0.10, 2), 0.0)
+    
+    # Status and totals
+    completed = rng.random(n) < STATUS_WEIGHTS[0]
+    status = np.where(completed, SALES_STATUS[0], SALES_STATUS[1]).astype(object)
+    total_amount = np.round(items_value - discount + increase + delivery_fee + service_tax, 2)
+    value_paid = np.where(completed, total_amount, 0.0)
+    
+    # Operational times
+    production_seconds = np.where(completed, rng.integers(300, 2401, n), np.nan)
+    delivered = is_delivery & completed
+    delivery_seconds = np.where(delivered, rng.integers(600, 3601, n), np.nan)
+    people_quantity = np.where(is_presential, rng.integers(1, 9, n), np.nan)
+    
+    # Delivery details, strings drawn from the pools
+    delivery_sale_idx = np.flatnonzero(delivered)
+    n_deliveries = len(delivery_sale_idx)
+    delivery_idx = np.arange(n_deliveries)
+    delivery_fees = delivery_fee[delivery_sale_idx]
+    address_idx = rng.integers(0, len(a['streets']), n_deliveries)
+    complement = np.where(
+        rng.random(n_deliveries) > 0.5,
+        rng.choice(a['complements'], size=n_deliveries),
+        None
+    )
+    latitude = np.clip(-23.5 + rng.uniform(-10, 5, n_deliveries), -33.0, -5.0)
+    longitude = np.clip(-46.6 + rng.uniform(-10, 10, n_deliveries), -74.0, -34.0)
+    
+    # Payments: 85% single payment, 15% split in two
+    paid_idx = np.flatnonzero(completed)
+    split = rng.random(len(paid_idx)) < 0.15
+    single_idx = paid_idx[~split]
+    split_idx = paid_idx[split]
+    split_value = np.round(value_paid[split_idx] * rng.uniform(0.3, 0.7, len(split_idx)), 2)
+    payment_sale_idx = np.concatenate([single_idx, split_idx, split_idx])
+    payment_value = np.round(np.concatenate([
+        value_paid[single_idx], split_value, value_paid[split_idx] - split_value
+    ]), 2)
+    # Positions in PAYMENT_TYPES_LIST; the loader maps them to ids
+    payment_type_idx = np.concatenate([
+        rng.integers(0, len(PAYMENT_TYPES_LIST), len(single_idx)),
+        rng.integers(0, 3, len(split_idx)),
+        rng.integers(0, len(PAYMENT_TYPES_LIST), len(split_idx)),
+    ])
+    
+    return {
+        'sales': {
+            'store_id': store_id, 'customer_id': customer_id, 'channel_id': channel_id,
+            'customer_name': customer_name, 'created_at': created_at,
+            'sale_status_desc': status,
+            'total_amount_items': np.round(items_value, 2), 'total_discount': discount,
+            'total_increase': increase, 'delivery_fee': delivery_fee,
+            'service_tax_fee': service_tax, 'total_amount': total_amount,
+            'value_paid': value_paid, 'production_seconds': production_seconds,
+            'delivery_seconds': delivery_seconds, 'discount_reason': discount_reason,
+            'people_quantity': people_quantity,
+            'origin': np.full(n, 'POS', dtype=object),
+        },
+        'product_sales': {
+            'sale_idx': sale_idx, 'product_id': a['product_ids'][product_idx],
+            'quantity': qty, 'base_price': base_price, 'total_price': np.round(line_total, 2),
+        },
+        'item_product_sales': {
+            'product_sale_idx': product_sale_idx, 'item_id': a['item_ids'][item_idx],
+            'option_group_id': option_group_id, 'quantity': np.ones(n_items, dtype=np.int64),
+            'additional_price': item_price, 'price': item_price,
+            'amount': np.ones(n_items, dtype=np.int64),
+        },
+        'delivery_sales': {
+            'sale_idx': delivery_sale_idx,
+            'courier_name': rng.choice(a['names'], size=n_deliveries),
+            'courier_phone': rng.choice(a['phones'], size=n_deliveries),
+            'courier_type': rng.choice(a['courier_types'], size=n_deliveries),
+            'delivery_type': rng.choice(a['delivery_types'], size=n_deliveries),
+            'status': np.full(n_deliveries, 'DELIVERED', dtype=object),
+            'delivery_fee': delivery_fees, 'courier_fee': np.round(delivery_fees * 0.6, 2),
+        },
+        'delivery_addresses': {
+            'sale_idx': delivery_sale_idx, 'delivery_idx': delivery_idx,
+            'street': a['streets'][address_idx],
+            'number': rng.integers(10, 10000, n_deliveries).astype(str).astype(object),
+            'complement': complement,
+            'neighborhood': a['neighborhoods'][address_idx], 'city': a['cities'][address_idx],
+            'state': a['states'][address_idx], 'postal_code': a['postal_codes'][address_idx],
+            'latitude': latitude, 'longitude': longitude,
+        },
+        'payments': {
+            'sale_idx': payment_sale_idx, 'payment_type_idx': payment_type_idx,
+            'value': payment_value,
+        },
+    }
+
+
+def drop_secondary_indexes(conn):
+    """Drop non-constraint indexes on the sales tables, returning their definitions."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = 'public'
+          AND i.tablename = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname
+          )
+    """, (list(BulkLoader.TABLES),))
+    indexes = cursor.fetchall()
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    if indexes:
+        print(f"  Dropped {len(indexes)} secondary index(es) for the load")
+    return indexes
+
+
+def rebuild_indexes(conn, indexes):
+    """Recreate the indexes dropped by drop_secondary_indexes, once, after the load."""
+    if not indexes:
+        return
+    print(f"Rebuilding {len(indexes)} index(es)...")
+    cursor = conn.cursor()
+    for name, indexdef in indexes:
+        # Partitioned parents report "ON ONLY"; rebuild on every partition
+        cursor.execute(indexdef.replace(' ON ONLY ', ' ON '))
+    conn.commit()
+    print("✓ Indexes rebuilt")
+
+
+def generate_single_sale(sale_time, store_id, channel, customer_id, ctx):
     """Generate a single sale with all related data"""
     
     # Select 1-5 products
     num_products = min(5, max(1, int(random.expovariate(0.5)) + 1))
     selected_products = random.choices(
-        products,
-        weights=[p['popularity'] for p in products],
+        ctx.products,
+        cum_weights=ctx.product_cum_weights,
         k=num_products
     )
     
@@ -409,14 +759,14 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
         if product['has_customization'] and random.random() > 0.4:
             num_items = random.randint(1, 4)
             for _ in range(num_items):
-                item = random.choice(items)
+                item = random.choice(ctx.items)
                 item_qty = 1
                 item_price = item['price']
                 item_additions_price += item_price
                 
                 items_data.append({
                     'item_id': item['id'],
-                    'option_group_id': random.choice(option_groups) if random.random() > 0.5 else None,
+                    'option_group_id': random.choice(ctx.option_groups) if random.random() > 0.5 else None,
                     'quantity': item_qty,
                     'additional_price': item_price,
                     'price': item_price
@@ -471,22 +821,23 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
         lat = -23.5 + random.uniform(-10, 5)  # -33.5 to -18.5 (covers Brazil)
         long = -46.6 + random.uniform(-10, 10)  # -56.6 to -36.6
         
+        address = random.choice(ctx.addresses)
         delivery_data = {
-            'courier_name': fake.name(),
-            'courier_phone': fake.phone_number(),
+            'courier_name': random.choice(ctx.names),
+            'courier_phone': random.choice(ctx.phones),
             'courier_type': random.choice(COURIER_TYPES),
             'delivery_type': random.choice(DELIVERY_TYPES),
             'status': 'DELIVERED',
             'delivery_fee': delivery_fee,
             'courier_fee': round(delivery_fee * 0.6, 2),
             'address': {
-                'street': fake.street_name(),
+                'street': address['street'],
                 'number': str(random.randint(10, 9999)),
                 'complement': random.choice(['Apto 101', 'Casa', 'Bloco A', 'Fundos', None, None]) if random.random() > 0.5 else None,
-                'neighborhood': fake.bairro(),
-                'city': fake.city(),
-                'state': fake.estado_sigla(),
-                'postal_code': fake.postcode(),
+                'neighborhood': address['neighborhood'],
+                'city': address['city'],
+                'state': address['state'],
+                'postal_code': address['postal_code'],
                 'latitude': lat,
                 'longitude': long
             }
@@ -509,7 +860,7 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
     return {
         'store_id': store_id,
         'customer_id': customer_id,
-        'customer_name': fake.name() if not customer_id else None,
+        'customer_name': random.choice(ctx.names) if not customer_id else None,
         'channel_id': channel['id'],
         'created_at': sale_time,
         'status': status,
@@ -530,137 +881,258 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
     }
 
 
-def insert_sales_batch(cursor, sales_batch, items, option_groups):
-    """Insert batch of sales with all related data"""
-    
-    # Insert sales
-    sales_data = [(
-        s['store_id'], s['customer_id'], s['channel_id'],
-        s['customer_name'], s['created_at'], s['status'],
-        Decimal(str(s['total_items_value'])),
-        Decimal(str(s['discount'])),
-        Decimal(str(s['increase'])),
-        Decimal(str(s['delivery_fee'])),
-        Decimal(str(s['service_tax'])),
-        Decimal(str(s['total_amount'])),
-        Decimal(str(s['value_paid'])),
-        s['production_sec'], s['delivery_sec'],
-        s['discount_reason'], s['people_qty'], 'POS'
-    ) for s in sales_batch]
-    
-    execute_batch(cursor, """
-        INSERT INTO sales (
-            store_id, customer_id, channel_id, customer_name,
-            created_at, sale_status_desc,
-            total_amount_items, total_discount, total_increase,
-            delivery_fee, service_tax_fee, total_amount, value_paid,
-            production_seconds, delivery_seconds,
-            discount_reason, people_quantity, origin
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    """, sales_data, page_size=500)
-    
-    # Get inserted sale IDs
-    cursor.execute("""
-        SELECT id FROM sales 
-        ORDER BY id DESC 
-        LIMIT %s
-    """, (len(sales_batch),))
-    sale_ids = [row[0] for row in cursor.fetchall()]
-    sale_ids.reverse()
-    
-    # Insert product_sales and related data
-    for sale_id, sale in zip(sale_ids, sales_batch):
-        for prod_data in sale['products']:
-            cursor.execute("""
-                INSERT INTO product_sales (
-                    sale_id, product_id, quantity, base_price, total_price
-                ) VALUES (%s,%s,%s,%s,%s) RETURNING id
-            """, (
-                sale_id, prod_data['product_id'],
-                prod_data['quantity'], prod_data['base_price'],
-                prod_data['total_price']
+class BulkLoader:
+    """Write generated sales and all their child rows, table by table.
+
+    IDs are reserved up front from each table's sequence, so child rows can
+    reference their parents without reading anything back. Each table is
+    then written in one round trip: COPY FROM STDIN (default) or a batched
+    INSERT (mode='insert', slower, handy for debugging).
+    """
+
+    # Column order used for both COPY and INSERT, in foreign key order
+    TABLES = {
+        'sales': (
+            'id', 'store_id', 'customer_id', 'channel_id', 'customer_name',
+            'created_at', 'sale_status_desc',
+            'total_amount_items', 'total_discount', 'total_increase',
+            'delivery_fee', 'service_tax_fee', 'total_amount', 'value_paid',
+            'production_seconds', 'delivery_seconds',
+            'discount_reason', 'people_quantity', 'origin'
+        ),
+        'product_sales': (
+            'id', 'sale_id', 'sale_created_at', 'product_id',
+            'quantity', 'base_price', 'total_price'
+        ),
+        'item_product_sales': (
+            'id', 'product_sale_id', 'sale_created_at', 'item_id', 'option_group_id',
+            'quantity', 'additional_price', 'price', 'amount'
+        ),
+        'delivery_sales': (
+            'id', 'sale_id', 'sale_created_at', 'courier_name', 'courier_phone',
+            'courier_type', 'delivery_type', 'status', 'delivery_fee', 'courier_fee'
+        ),
+        'delivery_addresses': (
+            'id', 'sale_id', 'sale_created_at', 'delivery_sale_id', 'street', 'number',
+            'complement', 'neighborhood', 'city', 'state', 'postal_code',
+            'latitude', 'longitude'
+        ),
+        'payments': (
+            'id', 'sale_id', 'sale_created_at', 'payment_type_id', 'value'
+        ),
+    }
+
+    def __init__(self, conn, mode='copy'):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.mode = mode
+        # Dimension lookups are loaded once instead of once per row
+        self.cursor.execute("SELECT description, id FROM payment_types")
+        self.payment_type_ids = dict(self.cursor.fetchall())
+
+    def reserve_ids(self, table, count):
+        """Take `count` ids from the table's sequence (safe with concurrent writers)."""
+        if count == 0:
+            return []
+        self.cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            (table, count)
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def load(self, sales_batch):
+        """Write one batch of generated sales and commit."""
+        rows = self.build_rows(sales_batch)
+        for table, table_rows in rows.items():
+            if not table_rows:
+                continue
+            if self.mode == 'copy':
+                self._copy(table, table_rows)
+            else:
+                self._insert(table, table_rows)
+        self.conn.commit()
+
+    def build_rows(self, sales_batch):
+        """Turn generated sales into row tuples per table, with pre-assigned ids."""
+        counts = {
+            'sales': len(sales_batch),
+            'product_sales': sum(len(s['products']) for s in sales_batch),
+            'item_product_sales': sum(len(p['items']) for s in sales_batch for p in s['products']),
+            'delivery_sales': sum(1 for s in sales_batch if s['delivery']),
+            'payments': sum(
+                1 for s in sales_batch for p in s['payments'] if p['type'] in self.payment_type_ids
+            ),
+        }
+        counts['delivery_addresses'] = counts['delivery_sales']
+        ids = {table: iter(self.reserve_ids(table, count)) for table, count in counts.items()}
+
+        rows = {table: [] for table in self.TABLES}
+        for s in sales_batch:
+            sale_id = next(ids['sales'])
+            created_at = s['created_at']
+            rows['sales'].append((
+                sale_id, s['store_id'], s['customer_id'], s['channel_id'], s['customer_name'],
+                created_at, s['status'],
+                round(s['total_items_value'], 2), s['discount'], s['increase'],
+                s['delivery_fee'], s['service_tax'],
+                round(s['total_amount'], 2), round(s['value_paid'], 2),
+                s['production_sec'], s['delivery_sec'],
+                s['discount_reason'], s['people_qty'], 'POS'
             ))
-            product_sale_id = cursor.fetchone()[0]
-            
-            # Insert items for this product
-            for item_data in prod_data['items']:
-                cursor.execute("""
-                    INSERT INTO item_product_sales (
-                        product_sale_id, item_id, option_group_id,
-                        quantity, additional_price, price, amount
-                    ) VALUES (%s,%s,%s,%s,%s,%s,%s)
-                """, (
-                    product_sale_id, item_data['item_id'],
-                    item_data['option_group_id'],
-                    item_data['quantity'], item_data['additional_price'],
-                    item_data['price'], 1
+
+            for prod_data in s['products']:
+                product_sale_id = next(ids['product_sales'])
+                rows['product_sales'].append((
+                    product_sale_id, sale_id, created_at, prod_data['product_id'],
+                    prod_data['quantity'], prod_data['base_price'], prod_data['total_price']
+                ))
+                for item_data in prod_data['items']:
+                    rows['item_product_sales'].append((
+                        next(ids['item_product_sales']), product_sale_id, created_at,
+                        item_data['item_id'], item_data['option_group_id'],
+                        item_data['quantity'], item_data['additional_price'],
+                        item_data['price'], 1
+                    ))
+
+            if s['delivery']:
+                d = s['delivery']
+                delivery_sale_id = next(ids['delivery_sales'])
+                rows['delivery_sales'].append((
+                    delivery_sale_id, sale_id, created_at, d['courier_name'], d['courier_phone'],
+                    d['courier_type'], d['delivery_type'], d['status'],
+                    d['delivery_fee'], d['courier_fee']
+                ))
+
+                addr = d['address']
+                # Ensure coordinates are within valid range for Brazil
+                lat = max(-33.0, min(-5.0, addr['latitude']))
+                long = max(-74.0, min(-34.0, addr['longitude']))
+                rows['delivery_addresses'].append((
+                    next(ids['delivery_addresses']), sale_id, created_at, delivery_sale_id,
+                    addr['street'], addr['number'], addr['complement'], addr['neighborhood'],
+                    addr['city'], addr['state'], addr['postal_code'], lat, long
+                ))
+
+            for payment in s['payments']:
+                payment_type_id = self.payment_type_ids.get(payment['type'])
+                if payment_type_id is None:
+                    continue
+                rows['payments'].append((
+                    next(ids['payments']), sale_id, created_at,
+                    payment_type_id, round(payment['value'], 2)
                 ))
+
+        return rows
+
+    def load_columns(self, columns):
+        """Write one day of column arrays from the numpy engine (no commit).
+
+        Parent positions (`sale_idx`, ...) are replaced by reserved ids, and
+        sale_created_at is taken from the parent sale.
+        """
+        # -1 marks payment types missing from the table; like build_rows,
+        # those payments are skipped instead of failing the whole shard
+        payment_type_ids = np.array([self.payment_type_ids.get(d, -1) for d in PAYMENT_TYPES_LIST])
+        ids = {}
+        sale_created_at = {}
         
-        # Insert delivery data
-        if sale['delivery']:
-            d = sale['delivery']
-            cursor.execute("""
-                INSERT INTO delivery_sales (
-                    sale_id, courier_name, courier_phone, courier_type,
-                    delivery_type, status, delivery_fee, courier_fee
-                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
-            """, (
-                sale_id, d['courier_name'], d['courier_phone'],
-                d['courier_type'], d['delivery_type'], d['status'],
-                d['delivery_fee'], d['courier_fee']
-            ))
-            delivery_sale_id = cursor.fetchone()[0]
+        for table, cols in columns.items():
+            if 'payment_type_idx' in cols:
+                known = payment_type_ids[cols['payment_type_idx']] >= 0
+                if not known.all():
+                    for column in list(cols):
+                        cols[column] = cols[column][known]
+            count = len(next(iter(cols.values())))
+            if count == 0:
+                continue
+            ids[table] = np.array(self.reserve_ids(table, count), dtype=np.int64)
+            cols['id'] = ids[table]
             
-            addr = d['address']
-            # Ensure coordinates are within valid range for Brazil
-            lat = max(-33.0, min(-5.0, addr['latitude']))
-            long = max(-74.0, min(-34.0, addr['longitude']))
+            if 'sale_idx' in cols:
+                cols['sale_id'] = ids['sales'][cols['sale_idx']]
+                cols['sale_created_at'] = columns['sales']['created_at'][cols['sale_idx']]
+            if 'product_sale_idx' in cols:
+                cols['product_sale_id'] = ids['product_sales'][cols['product_sale_idx']]
+                cols['sale_created_at'] = sale_created_at['product_sales'][cols['product_sale_idx']]
+            if 'delivery_idx' in cols:
+                cols['delivery_sale_id'] = ids['delivery_sales'][cols['delivery_idx']]
+            if 'payment_type_idx' in cols:
+                cols['payment_type_id'] = payment_type_ids[cols['payment_type_idx']]
+            sale_created_at[table] = cols.get('sale_created_at')
             
-            cursor.execute("""
-                INSERT INTO delivery_addresses (
-                    sale_id, delivery_sale_id, street, number, complement,
-                    neighborhood, city, state, postal_code, latitude, longitude
-                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """, (
-                sale_id, delivery_sale_id, addr['street'], addr['number'],
-                addr['complement'], addr['neighborhood'], addr['city'],
-                addr['state'], addr['postal_code'], lat, long
-            ))
-        
-        # Insert payments
-        for payment in sale['payments']:
-            cursor.execute(
-                "SELECT id FROM payment_types WHERE description = %s LIMIT 1",
-                (payment['type'],)
+            strings = [copy_column(cols[column]).tolist() for column in self.TABLES[table]]
+            buffer = io.StringIO()
+            for row in zip(*strings):
+                buffer.write('\t'.join(row))
+                buffer.write('\n')
+            buffer.seek(0)
+            self.cursor.copy_expert(
+                f"COPY {table} ({', '.join(self.TABLES[table])}) FROM STDIN",
+                buffer
             )
-            result = cursor.fetchone()
-            if result:
-                cursor.execute("""
-                    INSERT INTO payments (sale_id, payment_type_id, value)
-                    VALUES (%s,%s,%s)
-                """, (sale_id, result[0], Decimal(str(payment['value']))))
 
+    def _copy(self, table, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        self.cursor.copy_expert(
+            f"COPY {table} ({', '.join(self.TABLES[table])}) FROM STDIN",
+            buffer
+        )
 
-def create_indexes(conn):
-    """Create performance indexes"""
-    print("Creating indexes...")
-    cursor = conn.cursor()
-    
-    # Additional indexes
-    indexes = [
-        "CREATE INDEX IF NOT EXISTS idx_sales_date_status ON sales(DATE(created_at), sale_status_desc)",
-        "CREATE INDEX IF NOT EXISTS idx_product_sales_product_sale ON product_sales(product_id, sale_id)",
-    ]
-    
-    for idx in indexes:
-        try:
-            cursor.execute(idx)
-        except:
-            pass
-    
-    
+    def _insert(self, table, rows):
+        columns = self.TABLES[table]
+        execute_batch(
+            self.cursor,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({','.join(['%s'] * len(columns))})",
+            rows,
+            page_size=1000
+        )
+
+
+def copy_column(values):
+    """Format a numpy column for COPY's text format (NaN/None become NULL)."""
+    if values.dtype.kind == 'M':
+        return np.char.replace(np.datetime_as_string(values, unit='s'), 'T', ' ')
+    if values.dtype.kind in 'iu':
+        return values.astype(str)
+    if values.dtype.kind == 'f':
+        missing = np.isnan(values)
+        formatted = np.char.mod('%.10g', np.where(missing, 0, values))
+        return np.where(missing, '\\N', formatted)
+    return np.array([copy_value(value) for value in values], dtype=object)
+
+
+def copy_value(value):
+    """Format a value for COPY's text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+    return str(value)
+
+
+def analyze_tables(conn):
+    """Refresh planner statistics and the visibility map after the bulk load.
+
+    Indexes are managed by the backend migrations (python -m app.core.migrations),
+    not by the generator.
+    """
+    print("Analyzing tables...")
     conn.commit()
-    print("✓ Indexes created")
+    conn.autocommit = True
+    cursor = conn.cursor()
+    for table in ('sales', 'product_sales', 'payments'):
+        cursor.execute(f"VACUUM (ANALYZE) {table}")
+    conn.autocommit = False
+    print("✓ Tables analyzed")
 
 
 def main():
@@ -672,8 +1144,29 @@ def main():
     parser.add_argument('--items', type=int, default=200, help='Number of items/complements')
     parser.add_argument('--customers', type=int, default=10000, help='Number of customers')
     parser.add_argument('--months', type=int, default=6, help='Months of sales data')
+    parser.add_argument('--loader', choices=['copy', 'insert'], default='copy',
+                       help='How sales are written: COPY FROM STDIN (fast) or batched INSERT')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                       help='Sales per load/commit')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Processes generating and loading sales in parallel (date range is sharded)')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python',
+                       help='Sale synthesis: per-sale Python objects or whole days as NumPy arrays')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Random seed; the same seed reproduces the same data')
+    parser.add_argument('--end-date', default=None,
+                       help='Last day of sales (YYYY-MM-DD, default: today); fix it to reproduce the same data')
     
     args = parser.parse_args()
+    try:
+        end_date = anchor_date(args.end_date)
+    except ValueError:
+        parser.error("--end-date must be YYYY-MM-DD")
+    if args.engine == 'numpy':
+        if np is None:
+            parser.error("--engine numpy requires numpy (pip install numpy)")
+        if args.loader != 'copy':
+            parser.error("--engine numpy writes with COPY; use --loader copy")
     
     print("=" * 70)
     print("God Level Coder Challenge - Data Generator")
@@ -681,22 +1174,30 @@ def main():
     print(f"Generating {args.months} months of restaurant operational data...")
     print()
     
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    print(f"Seed: {seed}")
+    print(f"End date: {end_date.date()}")
+    random.seed(seed)
+    fake.seed_instance(seed)
+    
     conn = get_db_connection(args.db_url)
     
     try:
         sub_brand_ids, channels = setup_base_data(conn)
-        stores = generate_stores(conn, sub_brand_ids, args.stores)
+        stores = generate_stores(conn, sub_brand_ids, args.stores, end_date)
         products, items, option_groups = generate_products_and_items(
             conn, sub_brand_ids, args.products, args.items
         )
-        customers = generate_customers(conn, args.customers)
+        customers = generate_customers(conn, args.customers, end_date)
         
+        ctx = SalesContext(stores, channels, products, items, option_groups, customers, seed)
         total_sales = generate_sales(
-            conn, stores, channels, products, items, 
-            option_groups, customers, args.months
+            conn, args.db_url, ctx, args.months, seed=seed,
+            workers=max(1, args.workers), loader_mode=args.loader, batch_size=args.batch_size,
+            engine=args.engine, end_date=end_date
         )
         
-        create_indexes(conn)
+        analyze_tables(conn)
         
         # Final stats
         cursor = conn.cursor()